@@ -0,0 +1,143 @@
+# admin_stats.py
+# Глобальная статистика для админов (/stats): счетчики по статусам, просроченные элементы,
+# пользователи по активности, распределение дедлайнов, гистограмма классов темпа, расход LLM.
+# Один проход по проектам и задачам неизменяемой версии данных (snapshot.py) пачками по CHUNK_SIZE
+# (темп - compute_pace_batch на пачку): хендлеры могут менять документ во время расчета, не мешая ему.
+# Расчет идет в потоке (asyncio.to_thread), а не в цикле событий; результат кешируется на
+# STATS_TTL секунд, одновременные запросы ждут один и тот же расчет. В многопроцессном режиме
+# разделы других воркеров читаются с их файлов (data_handler.read_other_partitions) в том же потоке.
+import asyncio
+import heapq
+import logging
+import time
+from datetime import date, timedelta
+from itertools import chain, islice
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
+
+from data_handler import read_other_partitions
+from item_index import POOLS
+from llm_handler import LLM_USAGE
+from pace import build_columns, compute_pace_batch, PACE_CLASS_NAMES
+from progress_history import ensure_loaded, recent_pace
+from snapshot import Snapshot, current_snapshot
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+STATS_TTL = 60.0
+TOP_USERS = 5
+
+# Корзины дедлайнов активных элементов: (подпись, верхняя граница в днях от сегодня включительно)
+DEADLINE_OVERDUE = "просрочено"
+DEADLINE_BUCKETS: Tuple[Tuple[str, int], ...] = (("сегодня", 0), ("7 дней", 7), ("30 дней", 30))
+DEADLINE_LATER = "позже"
+DEADLINE_NONE = "без срока"
+
+_cache: Dict[str, Any] = {"expires": 0.0, "text": None, "task": None}
+
+
+def _chunks(items: Iterable[Any]) -> Iterator[List[Any]]:
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+def compute_stats(snapshot: Snapshot, today: Union[date, None] = None, others: Iterable[Dict[str, Any]] = ()) -> Dict[str, Any]:
+    """Все показатели за один проход по версии данных (и документам других разделов). Вызывается в потоке."""
+    today = today or date.today(); today_iso = today.isoformat()
+    bounds = [((today + timedelta(days=days)).isoformat(), label) for label, days in DEADLINE_BUCKETS]
+    stats: Dict[str, Any] = {
+        "by_status": {item_type: {} for _, item_type in POOLS},
+        "overdue": {item_type: 0 for _, item_type in POOLS},
+        "deadlines": {DEADLINE_OVERDUE: 0, **{label: 0 for label, _ in DEADLINE_BUCKETS}, DEADLINE_LATER: 0, DEADLINE_NONE: 0},
+        "pace": {},
+        "active_by_owner": {},
+        "items_by_owner": {},
+    }
+    active_by_owner: Dict[str, int] = stats["active_by_owner"]; items_by_owner: Dict[str, int] = stats["items_by_owner"]
+    for pool_name, item_type in POOLS:
+        by_status = stats["by_status"][item_type]
+        pool = chain(snapshot.pool(pool_name).values(), *(doc.get(pool_name, {}).values() for doc in others))
+        for chunk in _chunks(pool):
+            active: List[Dict[str, Any]] = []
+            for item in chunk:
+                status = item.get("status", "?"); owner = str(item.get("owner_id"))
+                by_status[status] = by_status.get(status, 0) + 1
+                items_by_owner[owner] = items_by_owner.get(owner, 0) + 1
+                if status != "active":
+                    continue
+                active.append(item); active_by_owner[owner] = active_by_owner.get(owner, 0) + 1
+                deadline = item.get("deadline")
+                if not deadline:
+                    stats["deadlines"][DEADLINE_NONE] += 1; continue
+                # Дедлайны - строки YYYY-MM-DD: сравнение строк совпадает с календарным
+                if deadline < today_iso:
+                    stats["overdue"][item_type] += 1; label = DEADLINE_OVERDUE
+                else:
+                    label = next((bound_label for bound, bound_label in bounds if deadline <= bound), DEADLINE_LATER)
+                stats["deadlines"][label] += 1
+            if active:
+                for pace_class in compute_pace_batch(build_columns(active, today, recent_pace), today)["class"]:
+                    name = PACE_CLASS_NAMES[int(pace_class)]
+                    stats["pace"][name] = stats["pace"].get(name, 0) + 1
+    return stats
+
+
+def format_stats(stats: Dict[str, Any], users_total: int, llm_usage: Dict[str, Dict[str, int]], elapsed: float) -> str:
+    lines = ["📈 Статистика"]
+    for item_type, title in (("project", "Проекты"), ("task", "Задачи")):
+        by_status = stats["by_status"][item_type]
+        parts = ", ".join(f"{status} {count}" for status, count in sorted(by_status.items(), key=lambda kv: -kv[1])) or "нет"
+        lines.append(f"{title}: всего {sum(by_status.values())} ({parts}); просрочено {stats['overdue'][item_type]}")
+
+    active_owners = stats["active_by_owner"]
+    lines.append(f"\nПользователи: {users_total}; с активными элементами {len(active_owners)}, "
+                 f"с элементами {len(stats['items_by_owner'])}")
+    top = heapq.nlargest(TOP_USERS, active_owners.items(), key=lambda kv: kv[1])
+    if top:
+        lines.append("Самые активные: " + ", ".join(f"{owner} ({count})" for owner, count in top))
+
+    lines.append("\nДедлайны активных: " + ", ".join(f"{label} {count}" for label, count in stats["deadlines"].items()))
+    if stats["pace"]:
+        lines.append("Темп: " + ", ".join(f"{name} {count}" for name, count in sorted(stats["pace"].items(), key=lambda kv: -kv[1])))
+
+    if llm_usage:
+        lines.append("\nLLM (с запуска процесса):")
+        for kind, counters in sorted(llm_usage.items()):
+            lines.append(f"  {kind}: вызовов {counters['calls']}, токенов {counters['input_tokens']} вход / {counters['output_tokens']} выход")
+    else:
+        lines.append("\nLLM: вызовов с запуска не было")
+    lines.append(f"\nРасчет: {elapsed * 1000:.0f} мс, кеш {STATS_TTL:.0f} с")
+    return "\n".join(lines)
+
+
+async def _build_text(data: Dict[str, Any]) -> str:
+    llm_usage = {kind: dict(counters) for kind, counters in LLM_USAGE.items()}  # Снимок в цикле событий
+    users_own = len(data.get("users", {}))
+    ensure_loaded()  # История грузится в цикле событий: в потоке она только читается
+    snapshot = current_snapshot(); started = time.perf_counter()
+
+    def compute() -> Tuple[Dict[str, Any], int]:
+        others = read_other_partitions()
+        return compute_stats(snapshot, others=others), users_own + sum(len(doc.get("users", {})) for doc in others)
+    stats, users_total = await asyncio.to_thread(compute)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Статистика для админа рассчитана за {elapsed:.3f} с.")
+    return format_stats(stats, users_total, llm_usage, elapsed)
+
+
+async def get_stats_text(data: Dict[str, Any]) -> str:
+    """Текст /stats: из кеша, из уже идущего расчета или новым расчетом."""
+    now = time.monotonic()
+    if _cache["text"] is not None and now < _cache["expires"]:
+        return _cache["text"]
+    if _cache["task"] is None or _cache["task"].done():
+        _cache["task"] = asyncio.get_running_loop().create_task(_build_text(data))
+    task = _cache["task"]
+    text = await task
+    if _cache["task"] is task:
+        _cache.update(text=text, expires=time.monotonic() + STATS_TTL, task=None)
+    return text
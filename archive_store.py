@@ -0,0 +1,273 @@
+# archive_store.py
+# Холодный архив завершенных элементов. Завершенные проекты и задачи раньше навсегда оставались в
+# основном документе, и за них платили каждое сохранение, поиск по имени, индексы и сканы статуса.
+# Элементы, закрытые (completed/archived) больше ARCHIVE_AFTER_DAYS дней назад, переносятся в
+# отдельный сжатый файл ARCHIVE_FILE (gzip JSON той же структуры: {"projects": {...}, "tasks": {...}}).
+# Единица переноса - "группа": закрытый проект вместе со всеми его задачами (только если все они
+# закрыты) или отдельная задача без проекта. Задачи живого проекта остаются в документе: по ним
+# считаются сводки проекта (rollups.py). Архив не держится в памяти: он читается только по явному
+# запросу (поиск по ID, "/status архив", /restore) и при переносе, в потоке.
+# Порядок записи защищает от потерь: при переносе сначала пишется архив, потом документ; при
+# восстановлении - наоборот. После сбоя элемент может оказаться в обоих местах - тогда верен документ.
+# Все операции с файлом идут по очереди (_archive_lock): перенос и /restore не затирают записи друг друга.
+# В многопроцессном режиме архив, как и данные, разложен по разделам владельцев (cluster.reshard).
+import asyncio
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple, Union
+
+import pytz
+
+from data_handler import load_data, save_data, record_item_mutation, owns_user, SAVE_FAILED_TEXT
+from item_index import POOLS
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FILE = 'bot_data_archive.json.gz'
+ARCHIVE_AFTER_DAYS = 30
+ARCHIVE_INTERVAL = 6 * 3600  # секунд между переносами
+ARCHIVE_LIST_LIMIT = 30
+CLOSED_STATUSES = ("completed", "archived")
+
+# (тип, id) элементов одной группы переноса
+Group = List[Tuple[str, str]]
+
+_stats: Dict[str, int] = {"archived": 0, "restored": 0, "runs": 0}
+_archiver_task: Union[asyncio.Task, None] = None
+_archive_lock = asyncio.Lock()
+
+
+def _pool_name(item_type: str) -> str:
+    return "projects" if item_type == "project" else "tasks"
+
+
+# --- Файл архива ---
+def _read_archive(archive_file: Union[str, None] = None) -> Dict[str, Dict[str, Any]]:
+    archive_file = archive_file or ARCHIVE_FILE
+    try:
+        with gzip.open(archive_file, 'rt', encoding='utf-8') as f:
+            archive = json.load(f)
+    except FileNotFoundError:
+        archive = {}
+    except (OSError, EOFError, json.JSONDecodeError) as e:
+        # Поврежденный архив не перезаписывается: перенос и восстановление останавливаются с ошибкой
+        raise RuntimeError(f"{archive_file} поврежден: {e}") from e
+    for pool_name, _ in POOLS:
+        archive.setdefault(pool_name, {})
+    return archive
+
+
+def _write_archive(archive: Dict[str, Dict[str, Any]], archive_file: Union[str, None] = None) -> None:
+    archive_file = archive_file or ARCHIVE_FILE
+    tmp_file = archive_file + '.tmp'
+    with gzip.open(tmp_file, 'wt', encoding='utf-8', compresslevel=6) as f:
+        json.dump(archive, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_file, archive_file)
+
+
+async def _in_thread(func, *args) -> Any:
+    # Чтение и запись файла - в потоке и строго по одной: _store_items/_drop_items читают, меняют и
+    # переписывают весь файл, и параллельные вызовы теряли бы изменения друг друга
+    async with _archive_lock:
+        return await asyncio.to_thread(func, *args)
+
+
+def _store_items(items: Dict[str, Dict[str, Any]]) -> None:
+    # Вызывается в потоке: items - копии элементов {pool_name: {id: item}}
+    archive = _read_archive()
+    for pool_name, pool in items.items():
+        archive[pool_name].update(pool)
+    _write_archive(archive)
+
+
+def _drop_items(ids: Dict[str, List[str]]) -> None:
+    archive = _read_archive()
+    for pool_name, pool_ids in ids.items():
+        for item_id in pool_ids:
+            archive[pool_name].pop(item_id, None)
+    _write_archive(archive)
+
+
+# --- Выбор элементов для переноса ---
+def _closed_at(item: Dict[str, Any]) -> Union[datetime, None]:
+    # Позднейшая из отметок: восстановленный из архива элемент снова ждет полный срок
+    moments = []
+    for key in ("completed_at", "archived_at", "restored_at"):
+        try: moments.append(datetime.fromisoformat(str(item[key]).replace("Z", "+00:00")))
+        except (KeyError, ValueError): continue
+    return max(moments) if moments else None
+
+
+def select_groups(data: Dict[str, Any], now: Union[datetime, None] = None) -> Tuple[List[Group], List[Tuple[Any, str, str]]]:
+    """
+    Группы к переносу и закрытые элементы без даты закрытия (владелец, тип, id). Таким элементам
+    (закрытым до появления completed_at) ставится completed_at = now: они уйдут в архив через полный срок.
+    """
+    now = now or datetime.now(pytz.utc); cutoff = now - timedelta(days=ARCHIVE_AFTER_DAYS)
+    projects = data.get("projects", {}); tasks = data.get("tasks", {})
+    stamped: List[Tuple[Any, str, str]] = []; old: Dict[Tuple[str, str], bool] = {}
+    for pool_name, item_type in POOLS:
+        for item_id, item in data.get(pool_name, {}).items():
+            if item.get("status") not in CLOSED_STATUSES or not owns_user(item.get("owner_id")):
+                continue
+            closed_at = _closed_at(item)
+            if closed_at is None:
+                item["completed_at"] = now.isoformat(); stamped.append((item.get("owner_id"), item_type, item_id)); continue
+            if closed_at.tzinfo is None: closed_at = pytz.utc.localize(closed_at)
+            old[(item_type, item_id)] = closed_at <= cutoff
+
+    tasks_by_project: Dict[str, List[str]] = {}
+    for task_id, task in tasks.items():
+        if task.get("project_id") in projects:
+            tasks_by_project.setdefault(task["project_id"], []).append(task_id)
+    groups: List[Group] = []
+    for project_id in projects:
+        if not old.get(("project", project_id)):
+            continue
+        children = tasks_by_project.get(project_id, [])
+        if all(("task", task_id) in old for task_id in children):  # Все задачи проекта закрыты
+            groups.append([("project", project_id)] + [("task", task_id) for task_id in children])
+    for task_id, task in tasks.items():
+        if old.get(("task", task_id)) and task.get("project_id") not in projects:
+            groups.append([("task", task_id)])
+    return groups, stamped
+
+
+async def archive_old_items(now: Union[datetime, None] = None) -> int:
+    """Переносит устаревшие закрытые элементы в архив. Возвращает число перенесенных."""
+    data = load_data()
+    groups, stamped = select_groups(data, now)
+    if not groups:
+        if stamped and save_data(data):
+            for owner_id, item_type, item_id in stamped: record_item_mutation(owner_id, item_type, item_id)
+        return 0
+    items: Dict[str, Dict[str, Any]] = {pool_name: {} for pool_name, _ in POOLS}
+    for group in groups:
+        for item_type, item_id in group:
+            items[_pool_name(item_type)][item_id] = dict(data[_pool_name(item_type)][item_id])
+    await _in_thread(_store_items, items)
+
+    data = load_data()  # Пока писался архив, документ могли перечитать
+    moved: List[Tuple[Any, str, str]] = []
+    for group in groups:
+        # Группа, изменившаяся за время записи архива (например, задачу снова открыли), остается в документе
+        if any(data.get(_pool_name(t), {}).get(i) != items[_pool_name(t)][i] for t, i in group):
+            continue
+        for item_type, item_id in group:
+            moved.append((data[_pool_name(item_type)].pop(item_id).get("owner_id"), item_type, item_id))
+    if not save_data(data):
+        # Документ перечитается с диска: элементы остаются в нем, их копии в архиве уступают документу
+        logger.error(f"Перенос в архив не сохранен в документе ({len(moved)} элементов), повтор при следующем проходе.")
+        return 0
+    # Отметки completed_at сохраняются вместе с переносом (элементы документа меняются на месте)
+    for owner_id, item_type, item_id in stamped + moved:
+        record_item_mutation(owner_id, item_type, item_id)
+    _stats["archived"] += len(moved)
+    logger.info(f"В архив перенесено элементов: {len(moved)} (групп {len(groups)}).")
+    return len(moved)
+
+
+# --- Запросы к архиву ---
+def _lookup(archive: Dict[str, Dict[str, Any]], item_id: str, owner_id: Union[str, int]) -> Union[Dict[str, Any], None]:
+    for pool_name, item_type in POOLS:
+        item = archive[pool_name].get(item_id)
+        if item is not None and str(item.get("owner_id")) == str(owner_id):
+            return {**item, "id": item_id, "item_type_db": item_type}
+    return None
+
+
+async def find_archived(item_id: str, owner_id: Union[str, int]) -> Union[Dict[str, Any], None]:
+    """Элемент архива по точному ID (только свой) - копия с 'id' и 'item_type_db', как у find_item_by_name_or_id."""
+    return _lookup(await _in_thread(_read_archive), item_id, owner_id)
+
+
+async def list_archived(owner_id: Union[str, int]) -> List[Dict[str, Any]]:
+    """Архивные элементы пользователя, недавно закрытые первыми."""
+    archive = await _in_thread(_read_archive)
+    found = [{**item, "id": item_id, "item_type_db": item_type}
+             for pool_name, item_type in POOLS for item_id, item in archive[pool_name].items()
+             if str(item.get("owner_id")) == str(owner_id)]
+    found.sort(key=lambda item: str(item.get("completed_at") or item.get("archived_at") or ""), reverse=True)
+    return found
+
+
+def format_archive_list(items: List[Dict[str, Any]]) -> str:
+    if not items:
+        return "Архив пуст."
+    lines = [f"🗄 Архив ({len(items)}):"]
+    for item in items[:ARCHIVE_LIST_LIMIT]:
+        label = "Проект" if item["item_type_db"] == "project" else "Задача"
+        closed = str(item.get("completed_at") or item.get("archived_at") or "")[:10]
+        lines.append(f"• {label} '{item.get('name', '?')}' (ID: `{item['id']}`){', закрыт ' + closed if closed else ''}")
+    if len(items) > ARCHIVE_LIST_LIMIT:
+        lines.append(f"...и еще {len(items) - ARCHIVE_LIST_LIMIT}.")
+    lines.append("Вернуть элемент: /restore <ID>")
+    return "\n".join(lines)
+
+
+async def restore_item(item_id: str, owner_id: Union[str, int]) -> Union[List[Dict[str, Any]], None]:
+    """
+    Возвращает элемент из архива в документ вместе с его группой (проект - со своими задачами,
+    задача архивного проекта - с проектом). Возвращает восстановленные элементы или None, если не найден.
+    """
+    archive = await _in_thread(_read_archive)
+    target = _lookup(archive, item_id, owner_id)
+    if target is None:
+        return None
+    project_id = item_id if target["item_type_db"] == "project" else target.get("project_id")
+    group: Group = [(target["item_type_db"], item_id)]
+    if project_id and project_id in archive["projects"]:
+        group = [("project", project_id)] + [("task", task_id) for task_id, task in archive["tasks"].items()
+                                             if task.get("project_id") == project_id]
+    data = load_data(); now_iso = datetime.now(pytz.utc).isoformat(); restored = []
+    for item_type, group_id in group:
+        pool = data.setdefault(_pool_name(item_type), {})
+        if group_id not in pool:  # После сбоя элемент мог остаться и в документе - тогда верен документ
+            pool[group_id] = {**archive[_pool_name(item_type)][group_id], "restored_at": now_iso}
+        restored.append({**pool[group_id], "id": group_id, "item_type_db": item_type})
+    if not save_data(data):
+        raise RuntimeError(SAVE_FAILED_TEXT)  # Архив не тронут: элемент можно восстановить снова
+    for item in restored:
+        record_item_mutation(item.get("owner_id"), item["item_type_db"], item["id"])
+    ids: Dict[str, List[str]] = {}
+    for item_type, group_id in group:
+        ids.setdefault(_pool_name(item_type), []).append(group_id)
+    await _in_thread(_drop_items, ids)
+    _stats["restored"] += len(restored)
+    logger.info(f"Из архива восстановлено элементов: {len(restored)} (по запросу {item_id}).")
+    return restored
+
+
+# --- Периодический перенос ---
+async def run_archiver() -> None:
+    while True:
+        try:
+            await archive_old_items(); _stats["runs"] += 1
+        except Exception as e:
+            logger.error(f"Ошибка переноса в архив: {e}", exc_info=True)
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+
+def describe_archive() -> str:
+    return (f"Архив: перенесено {_stats['archived']}, восстановлено {_stats['restored']}, "
+            f"проходов {_stats['runs']} (срок {ARCHIVE_AFTER_DAYS} дн.)")
+
+
+def start_archiver() -> asyncio.Task:
+    global _archiver_task
+    if _archiver_task is None or _archiver_task.done():
+        _archiver_task = asyncio.get_running_loop().create_task(run_archiver())
+        logger.info("Перенос завершенных элементов в архив запущен.")
+    return _archiver_task
+
+
+async def stop_archiver() -> None:
+    global _archiver_task
+    if _archiver_task is not None:
+        _archiver_task.cancel()
+        try: await _archiver_task
+        except asyncio.CancelledError: pass
+        _archiver_task = None
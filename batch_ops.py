@@ -0,0 +1,182 @@
+# batch_ops.py
+# Несколько изменений прогресса в одном сообщении: "АН2 +5, Б5 готово, проект Омега 40%".
+# NLU (intent "batch_update") за один вызов возвращает список операций уже с разобранным прогрессом
+# (progress_type/progress_value), поэтому второй вызов LLM на каждый элемент не нужен; для простых
+# записей ("+5", "40%", "готово") есть разбор без LLM. Цели ищутся через индекс
+# (find_item_by_name_or_id), пользователь видит одно подтверждение на все изменения.
+# В 64 байта callback_data список не помещается, поэтому план лежит в user_data (PENDING_BATCH_UPDATE_KEY,
+# сохраняется между перезапусками), а подписанная кнопка несет его отпечаток. Применение - все или
+# ничего: если хоть один элемент изменился с момента показа, не применяется ничего; затем одна запись данных.
+import re
+import struct
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Tuple, Union
+
+import pytz
+
+from callback_codec import sign_payload, verify_payload
+from data_handler import find_item_by_name_or_id
+
+BATCH_PROGRESS = "progress"
+BATCH_COMPLETE = "complete"
+CALLBACK_BATCH_PREFIX = "bt"
+MAX_OPERATIONS = 10
+
+_PAYLOAD = struct.Struct('>BI')  # да/нет, отпечаток плана
+
+_UNITS_RE = re.compile(r'^\s*([+-]\s*\d+)\s*(ед\.?|единиц\w*)?\s*$')
+_PERCENT_RE = re.compile(r'^\D*?(\d{1,3})\s*%\s*$')
+_DONE_WORDS = ("готово", "готов", "готова", "сделано", "сделал", "сделала", "завершил", "завершила", "завершено", "done")
+
+
+def parse_progress_shorthand(text: Union[str, None]) -> Union[Tuple[str, int], None]:
+    """Короткие записи прогресса без LLM: '+5' / '-2' -> units, '40%' -> percent, 'готово' -> complete."""
+    text = (text or "").strip().lower()
+    if not text:
+        return None
+    if text in _DONE_WORDS:
+        return "complete", 100
+    match = _UNITS_RE.match(text)
+    if match:
+        return "units", int(match.group(1).replace(" ", ""))
+    match = _PERCENT_RE.match(text)
+    if match:
+        return "percent", int(match.group(1))
+    return None
+
+
+def progress_to_units(current: int, total: int, progress_type: str, value: int) -> Union[int, None]:
+    """Новое значение в ед. по разобранному прогрессу (как в одиночном update_progress) или None."""
+    if progress_type == "units": new_units = current + value
+    elif progress_type == "percent": new_units = round(value / 100 * total) if total > 0 else value
+    elif progress_type == "absolute_units_set": new_units = value
+    elif progress_type == "complete": new_units = total if total > 0 else 100
+    else: return None
+    new_units = max(new_units, 0)
+    return min(new_units, total) if total > 0 else new_units
+
+
+class BatchPlan:
+    """Изменения по операциям сообщения и то, что разобрать не удалось."""
+
+    def __init__(self, changes: Union[List[Dict[str, Any]], None] = None):
+        # {"id", "item_type", "name", "action", "before", "after", "total"}
+        self.changes: List[Dict[str, Any]] = changes or []
+        self.problems: List[str] = []
+
+    def fingerprint(self) -> int:
+        state = "|".join(f"{c['item_type']}:{c['id']}:{c['action']}:{c['before']}:{c['after']}" for c in self.changes)
+        return zlib.crc32(state.encode('utf-8'))
+
+    def summary(self) -> str:
+        lines = [f"Применить {len(self.changes)} изменени(я/й)?"] if self.changes else ["Нечего изменять."]
+        for change in self.changes:
+            label = "Проект" if change["item_type"] == "project" else "Задача"
+            of_total = f" из {change['total']}" if change["total"] > 0 else ""
+            if change["action"] == BATCH_COMPLETE:
+                lines.append(f"• {label} '{change['name']}': завершить ({change['after']}{of_total})")
+            else:
+                lines.append(f"• {label} '{change['name']}': {change['before']} → {change['after']}{of_total}")
+        if self.problems:
+            lines.append("\nПропущено:")
+            lines.extend(f"• {problem}" for problem in self.problems)
+        return "\n".join(lines)
+
+
+def plan_batch(data: Dict[str, Any], user_id_str: str, operations: Any) -> BatchPlan:
+    plan = BatchPlan()
+    if not isinstance(operations, list):
+        return plan
+    by_item: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for op in operations[:MAX_OPERATIONS]:
+        if not isinstance(op, dict):
+            continue
+        hint = op.get("item_name_hint")
+        if not hint:
+            plan.problems.append("операция без названия элемента"); continue
+        found = find_item_by_name_or_id(str(hint), op.get("item_type"), data)
+        if not found or str(found.get("owner_id")) != user_id_str:
+            plan.problems.append(f"'{hint}' не найден"); continue
+        if found.get("status") != "active":
+            plan.problems.append(f"'{found['name']}' уже не активен"); continue
+
+        progress_type = op.get("progress_type"); value = op.get("progress_value")
+        if op.get("action") == BATCH_COMPLETE:
+            progress_type, value = "complete", 100
+        if progress_type not in ("units", "percent", "absolute_units_set", "complete") or value is None:
+            parsed = parse_progress_shorthand(op.get("progress_description"))
+            if parsed is None:
+                plan.problems.append(f"'{found['name']}': не понял прогресс '{op.get('progress_description') or ''}'"); continue
+            progress_type, value = parsed
+        try: value = int(float(value))
+        except (TypeError, ValueError):
+            plan.problems.append(f"'{found['name']}': неверное значение прогресса"); continue
+
+        key = (found["item_type_db"], found["id"])
+        change = by_item.get(key)  # Элемент упомянут повторно: следующая операция - поверх предыдущей
+        total = found.get("total_units", 0) or 0
+        before = found.get("current_units", 0)
+        current = change["after"] if change else before
+        after = progress_to_units(current, total, progress_type, value)
+        if change is None:
+            change = by_item[key] = {"id": found["id"], "item_type": found["item_type_db"], "name": found["name"],
+                                     "action": BATCH_PROGRESS, "before": before, "after": before, "total": total}
+            plan.changes.append(change)
+        change["after"] = after
+        if progress_type == "complete":
+            change["action"] = BATCH_COMPLETE
+            if total == 0: change["total"] = 100
+    unchanged = [c for c in plan.changes if c["after"] == c["before"] and c["action"] != BATCH_COMPLETE]
+    for change in unchanged:
+        plan.changes.remove(change); plan.problems.append(f"'{change['name']}': прогресс не изменился ({change['before']})")
+    return plan
+
+
+def stale_items(data: Dict[str, Any], plan: BatchPlan) -> List[str]:
+    """Имена элементов, изменившихся (или исчезнувших) с момента показа плана."""
+    stale = []
+    for change in plan.changes:
+        item = data.get("projects" if change["item_type"] == "project" else "tasks", {}).get(change["id"])
+        if item is None or item.get("status") != "active" or item.get("current_units", 0) != change["before"]:
+            stale.append(change["name"])
+    return stale
+
+
+def apply_batch(data: Dict[str, Any], plan: BatchPlan) -> Tuple[List[Tuple[Any, str, str]], List[Tuple[str, int]]]:
+    """
+    Применяет план к data (без сохранения). Возвращает [(владелец, тип, id), ...] для record_item_mutation
+    и [(id, изменение), ...] для progress_history.record_progress - записать только после удачного save_data.
+    """
+    now_iso = datetime.now(pytz.utc).isoformat(); touched = []; progress = []
+    for change in plan.changes:
+        item = data["projects" if change["item_type"] == "project" else "tasks"][change["id"]]
+        progress.append((change["id"], change["after"] - item.get("current_units", 0)))
+        item["current_units"] = change["after"]
+        if change["action"] == BATCH_COMPLETE:
+            item["total_units"] = change["total"]; item["status"] = "completed"; item["completed_at"] = now_iso
+        touched.append((item.get("owner_id"), change["item_type"], change["id"]))
+    return touched, progress
+
+
+# --- Хранение плана и подписанные кнопки ---
+def plan_to_state(plan: BatchPlan) -> List[Dict[str, Any]]:
+    return [dict(change) for change in plan.changes]
+
+
+def plan_from_state(state: Any) -> Union[BatchPlan, None]:
+    if not isinstance(state, list) or not state:
+        return None
+    return BatchPlan([dict(change) for change in state])
+
+
+def encode_batch_confirmation(user_id: int, plan: BatchPlan, confirm: bool) -> str:
+    return sign_payload(CALLBACK_BATCH_PREFIX, user_id, _PAYLOAD.pack(int(confirm), plan.fingerprint()))
+
+
+def decode_batch_confirmation(user_id: int, callback_data: str) -> Union[Dict[str, Any], None]:
+    payload = verify_payload(CALLBACK_BATCH_PREFIX, user_id, callback_data)
+    if payload is None or len(payload) != _PAYLOAD.size:
+        return None
+    confirm, fingerprint = _PAYLOAD.unpack(payload)
+    return {"confirm": bool(confirm), "fingerprint": fingerprint}
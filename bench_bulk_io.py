@@ -0,0 +1,59 @@
+# bench_bulk_io.py
+# Время импорта и экспорта N строк: разбор CSV, проверка, одно сохранение данных.
+#   python bench_bulk_io.py --rows 10000
+# Запускать в пустом каталоге: создает bot_data_v2.json рядом с текущим каталогом.
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+
+import bulk_io
+import data_handler
+
+
+def make_csv(path: str, rows: int, seed: int = 7) -> None:
+    rnd = random.Random(seed)
+    projects = max(1, rows // 20)
+    deadlines = ["2030-01-15", "2030-06-30", "через 2 недели", "конец месяца", "", "31.12.2030"]
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["type", "name", "deadline", "project", "total_units", "current_units"])
+        for i in range(projects):
+            writer.writerow(["project", f"Проект {i}", rnd.choice(deadlines), "", 100, rnd.randint(0, 50)])
+        for i in range(rows - projects):
+            writer.writerow(["task", f"Задача {i}", rnd.choice(deadlines), f"Проект {rnd.randrange(projects)}", 10, rnd.randint(0, 10)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк массового импорта/экспорта")
+    parser.add_argument("--rows", type=int, default=10_000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_bulk_")
+    os.chdir(workdir)
+    csv_path = os.path.join(workdir, "import.csv")
+    make_csv(csv_path, args.rows)
+    data = data_handler.load_data()
+
+    started = time.perf_counter()
+    result = bulk_io.import_file(data, "1", csv_path, "import.csv")
+    prepared = time.perf_counter()
+    if not result.ok:
+        print(result.summary()); return
+    bulk_io.apply_import(data, "1", result); data_handler.save_data(data)
+    saved = time.perf_counter()
+    path, count = bulk_io.export_to_file(data, "1", "csv")
+    exported = time.perf_counter()
+    os.remove(path)
+
+    print(f"Строк: {args.rows}; {result.summary()}")
+    print(f"Разбор и проверка: {(prepared - started) * 1000:8.1f} мс")
+    print(f"Применение и сохранение: {(saved - prepared) * 1000:8.1f} мс")
+    print(f"Экспорт {count} строк:   {(exported - saved) * 1000:8.1f} мс")
+    print(f"Итого: {exported - started:.2f} с (каталог {workdir})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# bench_pace.py
+# Сравнение поэлементного расчета темпа (compute_pace в цикле) с пакетным (compute_pace_batch).
+#   python bench_pace.py --items 100000
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+import pace
+
+
+def make_items(count: int, seed: int = 42):
+    rnd = random.Random(seed)
+    today = date.today()
+    items = []
+    for i in range(count):
+        created = today - timedelta(days=rnd.randint(-3, 60))
+        total = rnd.choice([0, 10, 20, 100])
+        items.append({
+            "id": f"task_{i:08x}",
+            "status": "active" if rnd.random() < 0.85 else "completed",
+            "created_at": f"{created.isoformat()}T{rnd.randint(0, 23):02d}:00:00+00:00",
+            "deadline": (created + timedelta(days=rnd.randint(-2, 90))).isoformat() if rnd.random() < 0.9 else None,
+            "total_units": total,
+            "current_units": rnd.randint(0, total) if total else 0,
+        })
+    return items
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк расчета темпа")
+    parser.add_argument("--items", type=int, default=100_000)
+    args = parser.parse_args()
+
+    items = make_items(args.items)
+    today = date.today()
+    pace.deadline_ordinal.cache_clear(); pace.created_ordinal.cache_clear()
+
+    loop_results, loop_s = timed(lambda: [pace.compute_pace(item, today) for item in items])
+    columns, columns_s = timed(pace.build_columns, items)
+    batch, batch_s = timed(pace.compute_pace_batch, columns, today)
+
+    mismatches = sum(1 for i, r in enumerate(loop_results) if int(batch["class"][i]) != r["class"])
+    print(f"Элементов: {args.items}, NumPy: {pace.NUMPY_AVAILABLE}")
+    print(f"Поэлементно (compute_pace):        {loop_s * 1000:9.1f} мс")
+    print(f"Сборка колонок (build_columns):    {columns_s * 1000:9.1f} мс")
+    print(f"Пакетный расчет (compute_pace_batch): {batch_s * 1000:6.1f} мс")
+    print(f"Колонки + расчет против цикла: x{loop_s / (columns_s + batch_s):.1f}, только расчет: x{loop_s / batch_s:.1f}")
+    print(f"Расхождений классов прогноза: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
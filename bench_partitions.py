@@ -0,0 +1,85 @@
+# bench_partitions.py
+# Стоимость записи данных в многопроцессном режиме: каждый воркер пишет только свой раздел
+# (data_handler.set_partition), поэтому сохранение после правки стоит O(документ / N).
+#   python bench_partitions.py --items 100000 --users 2000 --workers 1 2 4 8 --seconds 3
+# Для каждого N процессы-воркеры одновременно правят свои элементы и сохраняют данные;
+# итог - сохранений в секунду всего и время одного сохранения. Масштабирование по ядрам видно,
+# только если ядер не меньше N. Запускать в пустом каталоге: создает файлы разделов рядом.
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+import pytz
+
+import cluster
+import data_handler
+
+
+def make_data(users: int, items: int, seed: int = 7):
+    rnd = random.Random(seed)
+    data = data_handler.get_default_data()
+    created = datetime.now(pytz.utc).isoformat()
+    for user in range(users):
+        data["users"][str(user)] = {"username": f"user{user}", "timezone": "UTC"}
+    for i in range(items):
+        pool, prefix = ("projects", "proj") if i % 10 == 0 else ("tasks", "task")
+        item_id = f"{prefix}_{i:08x}"
+        data[pool][item_id] = {"id": item_id, "name": f"Элемент {i}", "owner_id": str(rnd.randrange(users)),
+                               "deadline": "2031-01-01", "created_at": created, "status": "active",
+                               "total_units": 100, "current_units": 0}
+    return data
+
+
+def _worker(index: int, count: int, seconds: float, start_at: float, results) -> None:
+    data_handler.set_partition(index, count)
+    data = data_handler.load_data()
+    task_ids = list(data["tasks"])
+    rnd = random.Random(index)
+    while time.time() < start_at:
+        time.sleep(0.001)
+    saves = 0; spent = 0.0; stop = start_at + seconds
+    while time.time() < stop:
+        item = data["tasks"][rnd.choice(task_ids)]
+        item["current_units"] = (item["current_units"] + 1) % 100
+        started = time.perf_counter()
+        data_handler.save_data(data)
+        spent += time.perf_counter() - started; saves += 1
+    results.put((saves, spent))
+
+
+def run(count: int, seconds: float) -> None:
+    cluster.reshard(count)
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    start_at = time.time() + 2.0  # Все воркеры успевают загрузить свой раздел
+    processes = [context.Process(target=_worker, args=(i, count, seconds, start_at, results)) for i in range(count)]
+    for process in processes: process.start()
+    totals = [results.get() for _ in processes]
+    for process in processes: process.join()
+    saves = sum(s for s, _ in totals); spent = sum(t for _, t in totals)
+    print(f"Воркеров {count}: сохранений {saves / seconds:8.1f}/с, одно сохранение {spent / max(saves, 1) * 1000:7.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк записи данных по разделам")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_partitions_")
+    os.chdir(workdir)
+    data_handler.save_data(make_data(args.users, args.items))
+    print(f"Ядер: {os.cpu_count()}, элементов {args.items}, пользователей {args.users} (каталог {workdir})")
+    for count in args.workers:
+        run(count, args.seconds)
+    cluster.reshard(1)
+
+
+if __name__ == '__main__':
+    main()
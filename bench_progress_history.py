@@ -0,0 +1,53 @@
+# bench_progress_history.py
+# История прогресса на N событиях: дозапись, загрузка журнала с диска, запросы темпа за окно.
+#   python bench_progress_history.py --events 1000000 --items 20000
+# Работает во временном каталоге.
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+import progress_history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк истории прогресса")
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--items", type=int, default=20_000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_history_")
+    os.chdir(workdir)
+    rnd = random.Random(7)
+    today = date.today(); first_day = today - timedelta(days=365)
+    item_ids = [f"task_{i:08x}" for i in range(args.items)]
+
+    started = time.perf_counter()
+    for n in range(args.events):
+        # События идут по времени: день растет вместе с номером события
+        progress_history.record_progress(rnd.choice(item_ids), rnd.randint(1, 5), first_day + timedelta(days=n * 365 // args.events))
+    recorded = time.perf_counter()
+
+    progress_history._series.clear(); progress_history._item_numbers.clear()
+    progress_history._state.update(loaded=False, events=0)
+    progress_history.ensure_loaded()
+    loaded = time.perf_counter(); loaded_events = progress_history._state["events"]
+
+    for item_id in item_ids:
+        progress_history.recent_pace(item_id, first_day.toordinal(), today=today)
+    queried = time.perf_counter()
+    size = os.path.getsize(progress_history.HISTORY_FILE)
+    records = progress_history.compact()
+    compacted = time.perf_counter()
+
+    print(f"Событий: {args.events}, элементов: {args.items}, журнал {size / 1e6:.1f} МБ")
+    print(f"Дозапись:        {(recorded - started):8.2f} с")
+    print(f"Загрузка:        {(loaded - recorded):8.2f} с ({loaded_events} событий в памяти)")
+    print(f"Темп за 7 дней:  {(queried - loaded) / args.items * 1e6:8.1f} мкс на элемент")
+    print(f"Сжатие журнала:  {(compacted - queried):8.2f} с -> {records} записей ({os.path.getsize(progress_history.HISTORY_FILE) / 1e6:.1f} МБ)")
+
+
+if __name__ == '__main__':
+    main()
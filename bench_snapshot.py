@@ -0,0 +1,120 @@
+# bench_snapshot.py
+# Снимки данных (snapshot.py) под нагрузкой: память версии, стоимость публикации после правки
+# и одновременная работа писателя (цикл событий) и читателя (/stats в потоке).
+#   python bench_snapshot.py --users 2000 --items 100000 --seconds 5
+# Сравнивается чтение снимка и чтение живого документа тем же потоком. Без записи на диск.
+import argparse
+import asyncio
+import gc
+import random
+import time
+import tracemalloc
+from datetime import datetime
+
+import pytz
+
+import admin_stats
+import data_handler
+import snapshot
+
+
+def make_data(users: int, items: int, seed: int = 7):
+    rnd = random.Random(seed)
+    data = data_handler.get_default_data()
+    created = datetime.now(pytz.utc).isoformat()
+    for i in range(items):
+        pool, prefix = ("projects", "proj") if i % 10 == 0 else ("tasks", "task")
+        item_id = f"{prefix}_{i:08x}"
+        data[pool][item_id] = {"id": item_id, "name": f"Элемент {i}", "owner_id": str(rnd.randrange(users)),
+                               "deadline": f"2031-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}", "created_at": created,
+                               "status": "active", "total_units": 100, "current_units": rnd.randint(0, 50)}
+    return data
+
+
+def _live_stats(data):
+    # Чтение живого документа из потока, как было до снимков
+    counts = {}
+    for pool_name in ("projects", "tasks"):
+        for item in data[pool_name].values():
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+    return counts
+
+
+async def contention(data, ids, seconds: float, use_snapshot: bool):
+    stop = time.perf_counter() + seconds
+    counters = {"writes": 0, "reads": 0, "errors": 0, "max_write_ms": 0.0, "max_publish_ms": 0.0}
+    rnd = random.Random(1)
+
+    async def writer():
+        while time.perf_counter() < stop:
+            pool, item_id = rnd.choice(ids)
+            started = time.perf_counter()
+            item = data[pool][item_id]; item["current_units"] = (item["current_units"] + 1) % 100
+            if rnd.random() < 0.01:  # Изредка - создание элемента: меняется размер пула
+                new_id = f"task_new{counters['writes']:08x}"
+                data["tasks"][new_id] = {**item, "id": new_id}
+                data_handler.record_item_mutation(item["owner_id"], "task", new_id)
+            data_handler.record_item_mutation(item["owner_id"], "project" if pool == "projects" else "task", item_id)
+            counters["max_write_ms"] = max(counters["max_write_ms"], (time.perf_counter() - started) * 1000)
+            counters["writes"] += 1
+            await asyncio.sleep(0)
+
+    async def reader():
+        while time.perf_counter() < stop:
+            try:
+                if use_snapshot:
+                    # Версия публикуется при чтении: все правки с прошлого чтения - одним проходом
+                    started = time.perf_counter(); version = snapshot.current_snapshot()
+                    counters["max_publish_ms"] = max(counters["max_publish_ms"], (time.perf_counter() - started) * 1000)
+                    await asyncio.to_thread(admin_stats.compute_stats, version)
+                else: await asyncio.to_thread(_live_stats, data)
+                counters["reads"] += 1
+            except RuntimeError:  # dictionary changed size during iteration
+                counters["errors"] += 1
+
+    await asyncio.gather(writer(), reader())
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк снимков данных")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    data = make_data(args.users, args.items)
+    data_handler._store.update(data=data, mtime=data_handler._file_mtime())
+    ids = [(pool, item_id) for pool in ("projects", "tasks") for item_id in data[pool]]
+
+    gc.collect(); tracemalloc.start()
+    started = time.perf_counter()
+    first = snapshot.current_snapshot()
+    built = time.perf_counter() - started
+    full_size = tracemalloc.get_traced_memory()[0]
+    print(f"Полное построение: {built * 1000:.0f} мс, память версии {full_size / 1e6:.1f} МБ "
+          f"({full_size / args.items:.0f} Б на элемент)")
+
+    item = data["tasks"][ids[-1][1]]; item["current_units"] += 1
+    data_handler.record_item_mutation(item["owner_id"], "task", ids[-1][1])
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    second = snapshot.current_snapshot()
+    published = time.perf_counter() - started
+    delta = tracemalloc.get_traced_memory()[0] - before
+    shared = sum(a is b for a, b in zip(first.shards, second.shards))
+    print(f"Публикация после одной правки: {published * 1000:.2f} мс, +{delta / 1e3:.1f} КБ, "
+          f"общих корзин с прошлой версией {shared}/{snapshot.SHARD_COUNT}")
+    tracemalloc.stop()
+
+    for use_snapshot in (False, True):
+        counters = asyncio.run(contention(data, ids, args.seconds, use_snapshot))
+        label = "снимок" if use_snapshot else "живой документ"
+        print(f"{label}: записей {counters['writes']} ({counters['writes'] / args.seconds:.0f}/с, макс. {counters['max_write_ms']:.2f} мс), "
+              f"чтений {counters['reads']}, ошибок чтения {counters['errors']}"
+              + (f", макс. публикация {counters['max_publish_ms']:.1f} мс" if use_snapshot else ""))
+    print(snapshot.describe_snapshots())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# bench_startup.py
+# Замер запуска бота: импорт bot5, сборка Application, прогрев (данные + индексы + LLM).
+#   python bench_startup.py --runs 5 --items 20000
+# Каждый прогон идет в отдельном процессе с холодным импортом. При --items > 0 данные
+# генерируются во временном каталоге, иначе используется bot_data_v2.json из текущего каталога.
+# В рабочем боте время до первого ответа пишется в лог отметкой "первый апдейт".
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import date, timedelta
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHILD_CODE = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import bot5
+t_import = time.perf_counter() - t0
+genai_loaded_on_import = 'google.generativeai' in sys.modules
+bot5.build_application()
+asyncio.run(bot5.warm_up())
+print(json.dumps({
+    "import_s": t_import,
+    "genai_loaded_on_import": genai_loaded_on_import,
+    "marks": bot5.timeline.marks,
+    "durations": bot5.timeline.durations,
+}))
+"""
+
+
+def make_data_file(path: str, items: int) -> None:
+    today = date.today()
+    data = {"users": {}, "projects": {}, "tasks": {}, "config": {"admin_ids": []}, "legacy_goal": {}}
+    for i in range(items):
+        owner = str(1000 + i % 500)
+        data["users"].setdefault(owner, {"username": f"User_{owner}", "receive_reports": True, "is_admin": False, "timezone": "UTC"})
+        pool, prefix = ("projects", "proj") if i % 5 == 0 else ("tasks", "task")
+        item_id = f"{prefix}_{i:08x}"
+        data[pool][item_id] = {"id": item_id, "name": f"Элемент {i}", "deadline": (today + timedelta(days=i % 60)).isoformat(),
+                               "owner_id": owner, "created_at": f"{today - timedelta(days=i % 30)}T10:00:00+00:00",
+                               "status": "active" if i % 7 else "completed", "total_units": 10, "current_units": i % 11}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def run_once(workdir: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+    env["PYTHONPATH"] = REPO_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    env["LOG_LEVEL"] = "WARNING"
+    out = subprocess.run([sys.executable, "-c", CHILD_CODE], cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк запуска бота")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--items", type=int, default=0, help="сгенерировать данные с таким числом элементов")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = os.getcwd()
+        if args.items > 0:
+            workdir = tmp
+            make_data_file(os.path.join(tmp, "bot_data_v2.json"), args.items)
+        results = [run_once(workdir) for _ in range(args.runs)]
+
+    print(f"Прогонов: {args.runs}, элементов: {args.items or 'из текущего файла'}")
+    print(f"google.generativeai загружен при импорте bot5: {any(r['genai_loaded_on_import'] for r in results)}")
+    print(f"Импорт bot5: медиана {statistics.median(r['import_s'] for r in results) * 1000:.1f} мс")
+    for phase in results[0]["durations"]:
+        print(f"{phase}: медиана {statistics.median(r['durations'][phase] for r in results) * 1000:.1f} мс")
+    ready = [elapsed for r in results for phase, elapsed in r["marks"] if phase.startswith("готов к работе")]
+    print(f"До готовности: медиана {statistics.median(ready) * 1000:.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
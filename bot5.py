@@ -1,29 +1,50 @@
 # main_bot.py
+from startup import timeline, warm_up, note_first_update # Первым: отсчет хронологии запуска
 import asyncio
 import json
 import logging
 from datetime import datetime, date, timedelta 
 import uuid 
 import os
+import tempfile
 from typing import Union
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, filters, ContextTypes,
-    ConversationHandler, CallbackQueryHandler
+    ConversationHandler, CallbackQueryHandler, TypeHandler
 )
 import pytz 
 
 from llm_handler import interpret_user_input, interpret_progress_description
-from data_handler import load_data, save_data, is_admin as is_user_admin_from_data, find_item_by_name_or_id
-from utils import generate_id, parse_natural_deadline_to_date
+from data_handler import load_data, save_data, is_admin as is_user_admin_from_data, find_item_by_name_or_id, record_item_mutation, SAVE_FAILED_TEXT
+from utils import generate_id, parse_natural_deadline_to_date, ID_MAX_NODES
+from pace import compute_pace, with_rollup, PACE_DONE, PACE_BAD_PLAN, PACE_INVALID
+from rollups import get_project_rollup, describe_rollups
+from admin_stats import get_stats_text
+from reminders import start_reminder_scheduler, stop_reminder_scheduler, describe_reminders
+from progress_history import record_progress, recent_pace
+from status_view import get_status_page, parse_page_callback, filter_code, describe_status_cache, FILTER_OVERDUE, CALLBACK_STATUS_PAGE_PREFIX
+from log_handler import setup_logging, log_event, set_log_level, set_sampling_rate, describe_logging
+import profiler
+from reports import start_report_scheduler, stop_report_scheduler
+import outbound
+import bulk_io
+import bulk_ops
+import batch_ops
+from state_store import UserState, start_state_store, stop_state_store
+import debounce
+import archive_store
+from snapshot import current_snapshot, describe_snapshots
+from dedup import drop_duplicate_updates, claim_mutation, release_mutation, start_dedup, stop_dedup, describe_dedup
    
 from constants import (
     ASK_PROJECT_NAME, ASK_PROJECT_DEADLINE,
     ASK_TASK_NAME, ASK_TASK_PROJECT_LINK, ASK_TASK_DEADLINE_STATE,
     ACTIVE_CONVERSATION_KEY, 
     ADD_PROJECT_CONV_STATE_VALUE, ADD_TASK_CONV_STATE_VALUE, UPDATE_PROGRESS_CONV_STATE_VALUE,
-    LAST_PROCESSED_IN_CONV_MSG_ID_KEY, PENDING_PROGRESS_UPDATE_KEY,
+    LAST_PROCESSED_IN_CONV_MSG_ID_KEY, PENDING_PROGRESS_UPDATE_KEY, PENDING_BATCH_UPDATE_KEY, CALLBACK_CONFIRM_PROGRESS_PREFIX,
     ASK_PROGRESS_ITEM_TYPE, ASK_PROGRESS_ITEM_NAME, ASK_PROGRESS_DESCRIPTION, ITEM_FOR_PROGRESS_UPDATE_KEY,
     CALLBACK_SHOW_PACE_DETAILS_PREFIX,
     CALLBACK_UPDATE_PARENT_PROJECT_PREFIX 
@@ -40,12 +61,10 @@ from conversations import (
     ask_for_progress_confirmation, confirm_progress_update_callback
 )
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG
-)
+setup_logging()
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
+timeline.mark("импорт модулей")
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_IDS_STR = os.getenv('ADMIN_IDS', '0')
@@ -60,17 +79,193 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if user_id_str not in data["users"]:
         data["users"][user_id_str] = {"username": user.username or f"User_{user_id_str}", "receive_reports": True, "is_admin": is_admin_now, "timezone": "UTC"}
     else: data["users"][user_id_str].update({"is_admin": is_admin_now, "username": user.username or data["users"][user_id_str].get("username", f"User_{user_id_str}")})
-    save_data(data); logger.info(f"User {user.id} ({user.username}) started/updated. Admin: {is_admin_now}")
+    if not save_data(data): await update.message.reply_text(SAVE_FAILED_TEXT); return
+    logger.info(f"User {user.id} ({user.username}) started/updated. Admin: {is_admin_now}")
     await update.message.reply_text(f"Привет, {user.first_name}! Я ваш менеджер проектов. /help")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     admin_text = ""
     if is_user_admin_from_data(update.effective_user.id, load_data()):
-        admin_text = "\n\n👑 *Админ-команды* (в разработке):\n..." 
-    help_msg = ("🤖 *Команды:*\n/start, /help\n/newproject - создать проект\n/newtask - создать задачу\n/progress - обновить прогресс\n\n"
+        admin_text = "\n\n👑 *Админ-команды:*\n/loglevel [уровень] [логгер] - уровень логирования\n/logsample <событие> <доля> - сэмплирование событий лога\n/profile <N | Ts | stop> - профилирование N апдейтов или T секунд\n/queue - очередь исходящих сообщений и кеш статуса\n/stats - общая статистика по всем пользователям"
+    help_msg = ("🤖 *Команды:*\n/start, /help\n/newproject - создать проект\n/newtask - создать задачу\n/progress - обновить прогресс\n/status [проекты | задачи | просрочено | архив | проект] - список по страницам\n/restore <ID> - вернуть элемент из архива\n/import - массовая загрузка из CSV/JSONL\n/export [csv | jsonl] - выгрузка\n\n"
                 "💡 *Общение в свободной форме:*\n'создай проект X дедлайн Y'\n'добавь задачу Z для проекта X'\n'прогресс по задаче X +5'" + admin_text)
     await update.message.reply_text(help_msg, parse_mode='Markdown')
 
+async def loglevel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_user_admin_from_data(update.effective_user.id, load_data()):
+        await update.message.reply_text("Команда доступна только администраторам."); return
+    args = context.args or []
+    if args:
+        level_name = args[0]; logger_name = args[1] if len(args) > 1 else None
+        if not set_log_level(level_name, logger_name):
+            await update.message.reply_text(f"Неизвестный уровень '{level_name}'. Варианты: DEBUG, INFO, WARNING, ERROR."); return
+        logger.warning(f"Админ {update.effective_user.id} установил уровень {level_name.upper()} для '{logger_name or 'root'}'.")
+    await update.message.reply_text(describe_logging())
+
+async def logsample_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_user_admin_from_data(update.effective_user.id, load_data()):
+        await update.message.reply_text("Команда доступна только администраторам."); return
+    args = context.args or []
+    if len(args) != 2:
+        await update.message.reply_text("Использование: /logsample <событие> <доля 0..1>\n\n" + describe_logging()); return
+    try: rate = float(args[1].replace(',', '.'))
+    except ValueError: await update.message.reply_text(f"Доля должна быть числом, получено '{args[1]}'."); return
+    set_sampling_rate(args[0], rate)
+    logger.warning(f"Админ {update.effective_user.id} установил сэмплирование {args[0]}={rate}.")
+    await update.message.reply_text(describe_logging())
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_user_admin_from_data(update.effective_user.id, load_data()):
+        await update.message.reply_text("Команда доступна только администраторам."); return
+    args = context.args or []
+    if not args:
+        status = "идет" if profiler.is_active() else "не запущено"
+        await update.message.reply_text(f"Профилирование {status}.\nИспользование: /profile 50 (апдейтов) | /profile 30s | /profile stop"); return
+    if args[0].lower() == "stop":
+        if not await profiler.stop_session():
+            await update.message.reply_text("Профилирование не запущено.")
+        return
+    try: max_updates, max_seconds = profiler.parse_limit(args[0])
+    except ValueError: await update.message.reply_text(f"Не понял лимит '{args[0]}'. Примеры: 50, 30s, 2m."); return
+    if not profiler.start_session(context.application, update.effective_chat.id, max_updates, max_seconds):
+        await update.message.reply_text("Профилирование уже идет. /profile stop"); return
+    limit_text = f"{max_updates} апдейтов" if max_updates else f"{max_seconds:.0f} с"
+    await update.message.reply_text(f"Профилирование включено на {limit_text}. Итоги придут сюда.")
+
+async def queue_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_user_admin_from_data(update.effective_user.id, load_data()):
+        await update.message.reply_text("Команда доступна только администраторам."); return
+    await update.message.reply_text("📤 Исходящие сообщения:\n" + outbound.describe_metrics() + "\n\n" + describe_status_cache() + "\n" + describe_rollups() + "\n" + describe_reminders() + "\n" + describe_dedup() + "\n" + debounce.describe_debounce() + "\n" + archive_store.describe_archive() + "\n" + describe_snapshots())
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    data = load_data()
+    if not is_user_admin_from_data(update.effective_user.id, data):
+        await update.message.reply_text("Команда доступна только администраторам."); return
+    await update.message.reply_text(await get_stats_text(data))
+
+ARCHIVE_QUERIES = ("архив", "archive")
+
+async def archived_or_not_found(query: str, user_id_str: str, not_found_text: str) -> str:
+    # Завершенные давно элементы лежат в архиве (archive_store.py) и находятся только по точному ID
+    archived = await archive_store.find_archived(query.strip(), user_id_str)
+    if archived is None: return not_found_text
+    label = "Проект" if archived["item_type_db"] == "project" else "Задача"
+    return f"🗄 {label} '{archived.get('name', '?')}' (ID: {archived['id']}) в архиве. Вернуть: /restore {archived['id']}"
+
+async def restore_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /restore <ID> - вернуть элемент из архива (проект - вместе с задачами)
+    user_id_str = str(update.effective_user.id)
+    if not context.args: await update.message.reply_text("Использование: /restore <ID>. Список архива: /status архив"); return
+    try: restored = await archive_store.restore_item(context.args[0].strip(), user_id_str)
+    except RuntimeError as e: await update.message.reply_text(str(e)); return
+    if restored is None: await update.message.reply_text(f"В архиве нет элемента с ID {context.args[0]}."); return
+    names = ", ".join(f"'{item.get('name', item['id'])}'" for item in restored)
+    await update.message.reply_text(f"♻️ Восстановлено из архива: {names}.")
+
+async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /status [проекты | задачи | просрочено | архив | <имя проекта>]
+    data = load_data(); user_id_str = str(update.effective_user.id)
+    arg = " ".join(context.args or []).strip(); arg_lower = arg.lower()
+    if arg_lower in ARCHIVE_QUERIES:
+        await update.message.reply_text(archive_store.format_archive_list(await archive_store.list_archived(user_id_str)), parse_mode='Markdown'); return
+    if arg_lower in ("просрочено", "просроченные", "overdue"): code = FILTER_OVERDUE
+    elif arg_lower in ("проекты", "projects"): code = filter_code("project")
+    elif arg_lower in ("задачи", "tasks"): code = filter_code("task")
+    elif arg:
+        found_project = find_item_by_name_or_id(arg, "project", data)
+        if not found_project: await update.message.reply_text(await archived_or_not_found(arg, user_id_str, f"Проект '{arg}' не найден.")); return
+        code = filter_code(project_id=found_project["id"])
+    else: code = filter_code()
+    page_text, page_markup = get_status_page(data, user_id_str, code)
+    await update.message.reply_text(page_text, parse_mode='Markdown', reply_markup=page_markup)
+
+async def status_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query; await query.answer()
+    parsed = parse_page_callback(query.data)
+    if not parsed: await query.edit_message_reply_markup(reply_markup=None); return
+    code, offset = parsed
+    page_text, page_markup = get_status_page(load_data(), str(update.effective_user.id), code, offset)
+    try: await query.edit_message_text(page_text, parse_mode='Markdown', reply_markup=page_markup)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower(): raise  # Устаревшая кнопка вернула ту же страницу - менять нечего
+
+async def import_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(bulk_io.IMPORT_HELP)
+
+async def import_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    document = update.message.document; user_id_str = str(update.effective_user.id)
+    if document.file_size and document.file_size > 20 * 1024 * 1024:
+        await update.message.reply_text("Файл больше 20 МБ: Telegram не дает боту его скачать."); return
+    tmp_path = os.path.join(tempfile.gettempdir(), f"import_{user_id_str}_{document.file_unique_id}.tmp")
+    try:
+        await (await document.get_file()).download_to_drive(tmp_path)
+        # Разбор и проверка - в потоке по снимку; ID и изменения - в цикле событий одним сохранением
+        owner_data = current_snapshot().owner_data(user_id_str)
+        result = await asyncio.to_thread(bulk_io.import_file, owner_data, user_id_str, tmp_path, document.file_name or "")
+        if result.ok:
+            data = load_data(); errors = bulk_io.apply_import(data, user_id_str, result)
+            if errors: await update.message.reply_text("Импорт отменен: данные изменились во время разбора.\n" + "\n".join(errors[:bulk_io.MAX_REPORTED_ERRORS])); return
+            if not save_data(data): await update.message.reply_text(SAVE_FAILED_TEXT); return
+            record_item_mutation(user_id_str)
+            logger.info(f"Пользователь {user_id_str} импортировал {len(result.projects)} проектов и {len(result.tasks)} задач.")
+        await update.message.reply_text(result.summary())
+    except UnicodeDecodeError:
+        await update.message.reply_text("Файл должен быть в кодировке UTF-8.")
+    finally:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    fmt = "jsonl" if (context.args or [""])[0].lower() == "jsonl" else "csv"
+    # Экспорт идет в потоке по неизменяемому снимку: правки, сделанные во время записи файла, его не портят
+    user_id_str = str(update.effective_user.id)
+    path, count = await asyncio.to_thread(bulk_io.export_to_file, current_snapshot().owner_data(user_id_str), user_id_str, fmt)
+    try:
+        if not count: await update.message.reply_text("Нечего экспортировать: у вас нет проектов и задач."); return
+        with open(path, 'rb') as f:
+            await update.message.reply_document(f, filename=f"items_{date.today().isoformat()}.{fmt}", caption=f"Элементов: {count}")
+    finally:
+        os.remove(path)
+
+async def bulk_confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query; await query.answer(); user_id = update.effective_user.id
+    request = bulk_ops.decode_bulk_confirmation(user_id, query.data)
+    if request is None: await query.edit_message_text("Ошибка: кнопка недействительна."); return
+    if not request["confirm"]: await query.edit_message_text("Массовое действие отменено."); return
+    data = load_data()
+    # План пересчитывается по текущим данным; отпечаток гарантирует, что применяется ровно показанный набор
+    plan = bulk_ops.plan_bulk_action(data, str(user_id), request["project_id"], request["action"], request["days"])
+    if not plan.changes or plan.fingerprint() != request["fingerprint"]:
+        await query.edit_message_text("С момента запроса элементы проекта изменились. Повторите команду."); return
+    progress = bulk_ops.apply_bulk_plan(data, plan); changed = len(plan.changes)
+    if not save_data(data): await query.edit_message_text(SAVE_FAILED_TEXT); return
+    for item_id, delta in progress: record_progress(item_id, delta) # История - только для сохраненных изменений
+    record_item_mutation(user_id)
+    logger.info(f"Пользователь {user_id}: {request['action']} для проекта {request['project_id']}, изменено {changed}.")
+    await query.edit_message_text(f"Готово: изменено элементов - {changed}.")
+
+async def batch_confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query; await query.answer(); user_id = update.effective_user.id
+    request = batch_ops.decode_batch_confirmation(user_id, query.data)
+    if request is None: await query.edit_message_text("Ошибка: кнопка недействительна."); return
+    pending_state = context.user_data.get(PENDING_BATCH_UPDATE_KEY); plan = batch_ops.plan_from_state(pending_state)
+    # Кнопка от более раннего сообщения: ожидающий план уже заменен другим
+    if plan is None or plan.fingerprint() != request["fingerprint"]: await query.edit_message_text("Это подтверждение устарело. Повторите запрос."); return
+    context.user_data.pop(PENDING_BATCH_UPDATE_KEY, None)
+    if not request["confirm"]: await query.edit_message_text("Изменения отменены."); return
+    if not claim_mutation("batch", update): return # Повторное нажатие той же кнопки
+    data = load_data()
+    stale = batch_ops.stale_items(data, plan)
+    if stale: await query.edit_message_text(f"С момента запроса изменились: {', '.join(stale)}. Ничего не применено, повторите запрос."); return
+    touched, progress = batch_ops.apply_batch(data, plan)
+    if not save_data(data): # Все изменения - одной записью
+        # План и кнопка остаются в силе: повторное нажатие применит их заново
+        context.user_data[PENDING_BATCH_UPDATE_KEY] = pending_state; release_mutation("batch", update)
+        await query.edit_message_text(SAVE_FAILED_TEXT, reply_markup=query.message.reply_markup if query.message else None); return
+    for item_id, delta in progress: record_progress(item_id, delta) # История - только для сохраненных изменений
+    for owner_id, item_type, item_id in touched: record_item_mutation(owner_id, item_type, item_id)
+    logger.info(f"Пользователь {user_id}: применено изменений из одного сообщения - {len(touched)}.")
+    await query.edit_message_text(f"Готово: обновлено элементов - {len(touched)}.")
+
 async def show_pace_details_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer() 
@@ -79,7 +274,7 @@ async def show_pace_details_callback(update: Update, context: ContextTypes.DEFAU
     original_message_id = query.message.message_id 
     chat_id_for_reply = query.message.chat_id      
     
-    logger.debug(f"Callback для деталей темпа: {callback_data}")
+    log_event(logger, logging.DEBUG, "pace.details_callback", data=callback_data)
 
     item_id = None
     try:
@@ -94,8 +289,12 @@ async def show_pace_details_callback(update: Update, context: ContextTypes.DEFAU
             return
 
         logger.debug(f"Извлечен item_id: {item_id} для деталей темпа.")
-        pace_data_key = f"pace_details_for_{item_id}" 
-        pace_details = context.user_data.pop(pace_data_key, None) 
+        data = load_data(); user_id_str = str(update.effective_user.id); pace_details = None
+        item = data.get("projects", {}).get(item_id) or data.get("tasks", {}).get(item_id)
+        if item and (str(item.get("owner_id")) == user_id_str or is_user_admin_from_data(update.effective_user.id, data)):
+            rollup = get_project_rollup(data, item_id) if item_id in data.get("projects", {}) else None
+            pace_item = with_rollup({**item, "id": item_id}, rollup)
+            pace_details = compute_pace(pace_item, recent_pace=recent_pace)["details"]
 
         if pace_details:
             details_text_md = "*Подробнее о темпе:*" 
@@ -124,7 +323,7 @@ async def show_pace_details_callback(update: Update, context: ContextTypes.DEFAU
                 reply_markup=None, 
                 parse_mode=None 
             )
-            logger.warning(f"Детали темпа для {item_id} не найдены в user_data ({pace_data_key}).")
+            logger.warning(f"Детали темпа для {item_id} недоступны (нет элемента, чужой элемент или темп не считается).")
 
     except Exception as e:
         logger.error(f"Ошибка в show_pace_details_callback для item_id '{item_id}': {e}", exc_info=True)
@@ -145,22 +344,24 @@ async def handle_parent_project_progress_yes(update: Update, context: ContextTyp
     await query.answer()
     user_id = update.effective_user.id
 
-    parts = query.data.split('_') 
-    logger.debug(f"Получен callback ДА для обновления родительского проекта: {query.data}")
-
-    if len(parts) != 6 or parts[3] != "yes": 
+    # "<префикс>_yes_<id проекта>_<ед.>"; id проекта сам содержит "_", поэтому разбор с краев
+    log_event(logger, logging.DEBUG, "parent_progress.yes_callback", data=query.data)
+    head = f"{CALLBACK_UPDATE_PARENT_PROJECT_PREFIX}_yes_"
+    project_id, _, units_part = query.data[len(head):].rpartition('_')
+    if not query.data.startswith(head) or not project_id: 
         logger.error(f"Некорректный callback_data для ДА обновления проекта: {query.data}")
         await query.edit_message_text("Ошибка обработки вашего выбора (yes).")
         return
 
-    project_id = parts[4] 
     try:
-        units_to_add = int(parts[5])
-    except (IndexError, ValueError):
+        units_to_add = int(units_part)
+    except ValueError:
         logger.error(f"Некорректное значение units_to_add в callback_data (yes): {query.data}")
         await query.edit_message_text("Ошибка в данных для обновления прогресса проекта (yes).")
         return
 
+    if not claim_mutation("parent_progress", update):
+        return  # Повторное нажатие: прогресс проекта уже добавлен
     data = load_data()
     if project_id in data.get("projects", {}):
         project_data = data["projects"][project_id]
@@ -173,7 +374,11 @@ async def handle_parent_project_progress_yes(update: Update, context: ContextTyp
             new_proj_units = total_proj_units
         
         project_data["current_units"] = new_proj_units
-        save_data(data)
+        if not save_data(data):
+            release_mutation("parent_progress", update)
+            await query.edit_message_text(SAVE_FAILED_TEXT, reply_markup=query.message.reply_markup if query.message else None); return
+        record_progress(project_id, new_proj_units - current_proj_units)
+        record_item_mutation(project_data.get("owner_id"), "project", project_id)
         
         feedback_message = f"Прогресс проекта '{project_name}' обновлен до {new_proj_units}."
         if total_proj_units > 0: feedback_message += f" (из {total_proj_units})"
@@ -186,17 +391,21 @@ async def handle_parent_project_progress_yes(update: Update, context: ContextTyp
 
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Union[int, None]:
     uid = update.effective_user.id; user_text = update.message.text; current_message_id = update.message.message_id
-    data = load_data() 
+    # Сначала дешевые проверки по user_data, и только потом чтение данных и NLU
     last_conv_msg_id = context.user_data.pop(LAST_PROCESSED_IN_CONV_MSG_ID_KEY, None)
-    if last_conv_msg_id == current_message_id: logger.debug(f"Дубль после диалога: {current_message_id}. Пропуск."); return None
+    if last_conv_msg_id == current_message_id: log_event(logger, logging.DEBUG, "text.skip_after_conv", message_id=current_message_id); return None
     
     active_conv_type = context.user_data.get(ACTIVE_CONVERSATION_KEY)
     if active_conv_type in [ADD_PROJECT_CONV_STATE_VALUE, ADD_TASK_CONV_STATE_VALUE, UPDATE_PROGRESS_CONV_STATE_VALUE]:
-        logger.debug(f"Сообщение от {uid} ('{user_text}') проигнорировано (активен диалог '{active_conv_type}')"); return None 
+        log_event(logger, logging.DEBUG, "text.skip_active_conv", user_id=uid, conv=active_conv_type); return None 
     
-    logger.debug(f"handle_text_message для {uid}: '{user_text}' (ID: {current_message_id})")
-    nlu_result = await interpret_user_input(user_text)
-    logger.debug(f"NLU result for '{user_text}': {nlu_result}") # DEBUG LOG FOR NLU
+    log_event(logger, logging.DEBUG, "text.received", user_id=uid, text=user_text, message_id=current_message_id)
+    # Быстрые сообщения подряд склеиваются в один запрос NLU; перекрытые новым сообщением - выходят
+    user_text = await debounce.collect(uid, user_text)
+    if user_text is None: log_event(logger, logging.DEBUG, "text.debounced", user_id=uid, message_id=current_message_id); return None
+    nlu_result = await debounce.run_nlu(uid, user_text, interpret_user_input)
+    if nlu_result is debounce.SUPERSEDED: log_event(logger, logging.DEBUG, "text.nlu_superseded", user_id=uid, message_id=current_message_id); return None
+    data = load_data()
 
     if not nlu_result or "intent" not in nlu_result: 
         logger.warning(f"NLU failed or no intent for '{user_text}'. NLU_Result: {nlu_result}. User ID: {uid}")
@@ -204,7 +413,8 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         return None
         
     intent = nlu_result.get("intent"); entities = nlu_result.get("entities", {}); user_id_str = str(uid)
-    logger.info(f"NLU от {uid}: Intent='{intent}', Entities={entities}")
+    profiler.note_intent(intent)
+    log_event(logger, logging.INFO, "nlu.intent", user_id=uid, intent=intent, entities=entities)
 
     if intent == "add_project":
         name=entities.get("item_name_hint");dl_llm=entities.get("deadline")
@@ -212,10 +422,11 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             parsed_dl=parse_natural_deadline_to_date(dl_llm) if dl_llm else None;final_dl=parsed_dl.strftime('%Y-%m-%d') if parsed_dl else None
             dl_msg=f"с дедлайном {final_dl}" if final_dl else "без дедлайна"
             if dl_llm and not parsed_dl:await update.message.reply_text(f"Проект '{name}'. Дедлайн '{dl_llm}' не распознан. /newproject?");return None
-            new_id=generate_id("proj");created_at=datetime.now(pytz.utc).isoformat()
-            data.setdefault("projects", {})
+            if not claim_mutation("create",update):return None
+            data.setdefault("projects", {});new_id=generate_id("proj",data["projects"]);created_at=datetime.now(pytz.utc).isoformat()
             data["projects"][new_id]={"id":new_id,"name":name,"deadline":final_dl,"owner_id":user_id_str,"created_at":created_at,"status":"active","total_units":0,"current_units":0,"last_report_day_counter":0}
-            save_data(data);await update.message.reply_text(f"🎉 Проект '{name}' {dl_msg} создан!\nID: `{new_id}`",parse_mode='Markdown')
+            if not save_data(data):await update.message.reply_text(SAVE_FAILED_TEXT);return None
+            record_item_mutation(user_id_str,"project",new_id);await update.message.reply_text(f"🎉 Проект '{name}' {dl_msg} создан!\nID: `{new_id}`",parse_mode='Markdown')
         else:await update.message.reply_text("Не понял имя проекта. /newproject?")
         return None
             
@@ -229,9 +440,11 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
                 if found_proj:proj_id=found_proj["id"];proj_fb_msg=f"к проекту '{found_proj['name']}'"
                 else:await update.message.reply_text(f"Проект '{proj_hint}' не найден. Задача '{task_name}' без привязки. /newtask?")
             if dl_llm and not parsed_dl:await update.message.reply_text(f"Задача '{task_name}'. Дедлайн '{dl_llm}' не распознан. /newtask?");return None
-            new_id=generate_id("task");created_at=datetime.now(pytz.utc).isoformat();data.setdefault("tasks",{})
+            if not claim_mutation("create",update):return None
+            data.setdefault("tasks",{});new_id=generate_id("task",data["tasks"]);created_at=datetime.now(pytz.utc).isoformat()
             data["tasks"][new_id]={"id":new_id,"name":task_name,"deadline":final_dl,"project_id":proj_id,"owner_id":user_id_str,"created_at":created_at,"status":"active","total_units":0,"current_units":0}
-            save_data(data);await update.message.reply_text(f"💪 Задача '{task_name}' ({proj_fb_msg}) {dl_msg_task} создана!\nID: `{new_id}`",parse_mode='Markdown')
+            if not save_data(data):await update.message.reply_text(SAVE_FAILED_TEXT);return None
+            record_item_mutation(user_id_str,"task",new_id);await update.message.reply_text(f"💪 Задача '{task_name}' ({proj_fb_msg}) {dl_msg_task} создана!\nID: `{new_id}`",parse_mode='Markdown')
         else:await update.message.reply_text("Не понял имя задачи. /newtask?")
         return None
 
@@ -324,18 +537,22 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     elif intent == "query_status":
         item_name_hint = entities.get("item_name_hint"); item_type_llm = entities.get("item_type")
         reply_lines = []; keyboard_markup = None
-        pace_details_for_button = {} 
 
         if item_name_hint: 
+            if item_name_hint.strip().lower() in ARCHIVE_QUERIES:
+                await update.message.reply_text(archive_store.format_archive_list(await archive_store.list_archived(user_id_str)), parse_mode='Markdown'); return None
             found_item = find_item_by_name_or_id(item_name_hint, item_type_llm, data)
             if not found_item: 
-                await update.message.reply_text(f"Не нашел '{item_name_hint}'."); 
+                await update.message.reply_text(await archived_or_not_found(item_name_hint, user_id_str, f"Не нашел '{item_name_hint}'.")); 
                 return None # Exit if specific item not found
             
             item_id=found_item['id']; item_name=found_item['name']; item_type_db=found_item['item_type_db']
             curr_u=found_item.get('current_units',0); total_u=found_item.get('total_units',0)
             status_val=found_item.get('status','активен'); dl_str=found_item.get('deadline')
             created_at_iso = found_item.get("created_at") 
+            # Сводка по задачам проекта поддерживается инкрементально (rollups.py) - без перебора задач
+            rollup = get_project_rollup(data, item_id) if item_type_db == "project" else None
+            pace_item = with_rollup(found_item, rollup)
 
             s_icon = "✅" if status_val=="completed" else ("⏳" if status_val=="active" else "❓")
             item_type_rus_single = "Проект" if item_type_db=="project" else "Задача"
@@ -351,6 +568,11 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
                     progress_text += " (100% условно)"
                 reply_lines.append(progress_text)
             else: reply_lines.append("Прогресс: 0 или не отслеживается")
+            if rollup:
+                rollup_text = f"Задачи: завершено {rollup.completed_count} из {rollup.task_count}"
+                if rollup.total_units > 0: rollup_text += f", ед. по задачам {rollup.current_units}/{rollup.total_units}"
+                if rollup.earliest_open_deadline: rollup_text += f", ближайший срок задачи {rollup.earliest_open_deadline}"
+                reply_lines.append(rollup_text)
                 
             if dl_str:
                 try:
@@ -368,77 +590,23 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
                 except ValueError: reply_lines.append(f"Дедлайн: {dl_str} (ошибка формата)")
             else: reply_lines.append("Дедлайн: не установлен")
             
-            forecast_str = None # Moved definition higher
-            if status_val == "active" and dl_str and created_at_iso and total_u > 0:
-                try:
-                    created_at_dt = datetime.fromisoformat(created_at_iso.replace("Z", "+00:00"))
-                    created_date = created_at_dt.date()
-                    deadline_date = datetime.strptime(dl_str, '%Y-%m-%d').date()
-                    today = date.today()
-                    
-                    total_days_planned = (deadline_date - created_date).days
-                    days_passed = (today - created_date).days
-                    days_left_for_calc = (deadline_date - today).days 
-                    units_left = total_u - curr_u
-
-                    logger.debug(
-                        f"Темп - Входные данные для '{item_name}' (ID: {item_id}):\n"
-                        f"  Создан: {created_date}, Дедлайн: {deadline_date}, Сегодня: {today}\n"
-                        f"  Всего дней по плану: {total_days_planned}\n"
-                        f"  Дней прошло: {days_passed}, Дней осталось: {days_left_for_calc}\n"
-                        f"  Текущий прогресс: {curr_u}, Всего единиц: {total_u}"
-                    )
-
-                    if total_days_planned >= 0 and curr_u < total_u: 
-                        required_pace = None; actual_pace = None
-                        required_pace_text = "не определен"; actual_pace_text = "не определен" 
-
-                        if units_left <= 0: required_pace_text = "все сделано!"
-                        elif days_left_for_calc > 0: 
-                            required_pace = units_left / days_left_for_calc
-                            required_pace_text = f"{required_pace:.2f} ед./день"
-                        else: required_pace_text = "срок вышел"
-                        
-                        if curr_u > 0:
-                            if days_passed > 0:
-                                actual_pace = curr_u / days_passed
-                                actual_pace_text = f"{actual_pace:.2f} ед./день"
-                            elif days_passed == 0: actual_pace_text = "сделано сегодня" 
-                            else: actual_pace_text = "прогресс до старта (?)"
-                        elif curr_u == 0 and days_passed >= 0 : actual_pace_text = "еще не начато"
-                        else: actual_pace_text = "ожидание начала"
-                        
-                        pace_details_for_button['required'] = required_pace_text
-                        pace_details_for_button['actual'] = actual_pace_text
-                        logger.debug(f"Темп-РАСЧЕТ: required='{required_pace_text}', actual='{actual_pace_text}'")
-                        
-                        if required_pace_text == "все сделано!": forecast_str = "Отличная работа, всё сделано!"
-                        elif required_pace_text == "срок вышел": forecast_str = "Срок вышел, не успели. 😥"
-                        elif actual_pace_text == "сделано сегодня":
-                             forecast_str = "Отличный старт! 👍" if units_left > 0 else "Всё сделано сегодня! 🎉"
-                        elif actual_pace_text == "прогресс до старта (?)": forecast_str = "Необычно, но прогресс есть!"
-                        elif actual_pace_text not in ["еще не начато", "ожидание начала"] and required_pace is not None and actual_pace is not None:
-                            if actual_pace >= required_pace: forecast_str = "Успеваете! 👍"
-                            else: forecast_str = "Нужно ускориться! 🏃💨"
-                        
-                        if forecast_str: reply_lines.append(f"Прогноз: {forecast_str}")
-                        else: 
-                            if pace_details_for_button.get('required') and pace_details_for_button.get('actual'):
-                                reply_lines.append(f"Темп: (см. детали)") 
-                        
-                        if pace_details_for_button:
-                            pace_data_key = f"pace_details_for_{item_id}"
-                            context.user_data[pace_data_key] = pace_details_for_button
-                            keyboard_buttons = [[InlineKeyboardButton("Показать детали темпа", callback_data=f"{CALLBACK_SHOW_PACE_DETAILS_PREFIX}_{item_id}")]]
-                            keyboard_markup = InlineKeyboardMarkup(keyboard_buttons)
-                            logger.debug(f"Темп-СОХРАНЕНО для кнопки: key='{pace_data_key}', details={pace_details_for_button}")
-                    elif curr_u >= total_u and total_u > 0 : 
-                         reply_lines.append("Прогноз: Завершено! 🎉")
-                    else: 
-                        reply_lines.append("Темп: Недостаточно данных для расчета (проверьте дедлайн и общие единицы).")
-                except Exception as e:
-                    logger.error(f"Ошибка при расчете темпа для {item_id}: {e}", exc_info=True)
+            if status_val == "active" and dl_str and created_at_iso and pace_item.get("total_units", 0) > 0:
+                # Фактический темп - за последние дни по истории прогресса (для сводки по задачам истории нет)
+                pace_result = compute_pace(pace_item, recent_pace=recent_pace)
+                pace_class = pace_result["class"]
+                log_event(logger, logging.DEBUG, "pace.result", item_id=item_id, pace_class=pace_class, details=pace_result["details"])
+                if pace_class == PACE_INVALID:
                     reply_lines.append("Темп: Ошибка при расчете.")
+                elif pace_class == PACE_DONE:
+                    reply_lines.append("Прогноз: Завершено! 🎉")
+                elif pace_class == PACE_BAD_PLAN:
+                    reply_lines.append("Темп: Недостаточно данных для расчета (проверьте дедлайн и общие единицы).")
+                else:
+                    if pace_result["forecast"]: reply_lines.append(f"Прогноз: {pace_result['forecast']}")
+                    else: reply_lines.append(f"Темп: (см. детали)")
+                    # Детали не сохраняются: при нажатии темп пересчитывается по текущему состоянию элемента
+                    keyboard_buttons = [[InlineKeyboardButton("Показать детали темпа", callback_data=f"{CALLBACK_SHOW_PACE_DETAILS_PREFIX}_{item_id}")]]
+                    keyboard_markup = InlineKeyboardMarkup(keyboard_buttons)
             elif status_val == "active": 
                  reply_lines.append("Темп: Невозможно рассчитать (нет дедлайна, цели в ед. или даты создания).")
 
@@ -448,108 +616,98 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
                 if proj: reply_lines.append(f"Проект: {proj.get('name','Неизвестный')}")
         
         else: # No item_name_hint, general status query
-            items_found_for_listing = False 
-
-            # --- Показываем ПРОЕКТЫ ---
-            if item_type_llm == "project" or item_type_llm is None:
-                user_projects = []
-                for p_id, p_data in data.get("projects", {}).items(): 
-                    is_owned_by_user = str(p_data.get("owner_id")) == user_id_str
-                    is_active = p_data.get("status") == "active"
-                    logger.debug(f"Проверка проекта для списка: ID={p_id}, Name='{p_data.get('name')}', OwnerMatch={is_owned_by_user}, Status='{p_data.get('status')}', IsActiveForList={is_active}")
-                    if is_owned_by_user and is_active: # CORRECTED INDENTATION
-                        p_data_copy = p_data.copy() # Avoid modifying original data if adding id
-                        if 'id' not in p_data_copy: p_data_copy['id'] = p_id # Ensure id is present
-                        user_projects.append(p_data_copy)
-                
-                if user_projects:
-                    reply_lines.append("*Ваши активные проекты:*")
-                    for p_item in sorted(user_projects, key=lambda x: (x.get("deadline") or "9999", x.get("name", "").lower())):
-                        dl_info = f"(до {p_item['deadline']})" if p_item.get('deadline') else "(без срока)"
-                        prog = ""
-                        if p_item.get("total_units", 0) > 0:
-                            prog = f" [{p_item.get('current_units',0)}/{p_item['total_units']}]"
-                        elif p_item.get('current_units', 0) > 0 : 
-                            prog = f" [{p_item.get('current_units',0)} ед.]"
-                        reply_lines.append(f"  `{p_item['id']}`: {p_item['name']} {dl_info} {prog}")
-                    items_found_for_listing = True
-                elif item_type_llm == "project": # Searched only for projects and none active
-                    reply_lines.append("У вас нет активных проектов.")
-                    items_found_for_listing = True 
-
-            # --- Показываем ЗАДАЧИ ---
-            if item_type_llm == "task" or item_type_llm is None:
-                user_tasks = []
-                for t_id, t_data in data.get("tasks", {}).items():
-                    is_owned_by_user = str(t_data.get("owner_id")) == user_id_str
-                    is_active = t_data.get("status") == "active"
-                    logger.debug(f"Проверка задачи для списка: ID={t_id}, Name='{t_data.get('name')}', OwnerMatch={is_owned_by_user}, Status='{t_data.get('status')}', IsActiveForList={is_active}")
-                    if is_owned_by_user and is_active: # CORRECTED INDENTATION
-                        t_data_copy = t_data.copy()
-                        if 'id' not in t_data_copy: t_data_copy['id'] = t_id
-                        user_tasks.append(t_data_copy)
-                
-                if user_tasks:
-                    if items_found_for_listing and reply_lines: 
-                        reply_lines.append("") 
-                    reply_lines.append("*Ваши активные задачи:*")
-                    for t_item in sorted(user_tasks, key=lambda x: (x.get("deadline") or "9999", x.get("name", "").lower())):
-                        dl_info = f"(до {t_item['deadline']})" if t_item.get('deadline') else "(без срока)"
-                        prog = ""
-                        if t_item.get("total_units", 0) > 0:
-                            prog = f" [{t_item.get('current_units',0)}/{t_item['total_units']}]"
-                        elif t_item.get('current_units', 0) > 0:
-                             prog = f" [{t_item.get('current_units',0)} ед.]"
-                        
-                        project_link_str = ""
-                        if t_item.get("project_id"):
-                            project_data_for_task = data.get("projects", {}).get(t_item["project_id"])
-                            if project_data_for_task: 
-                                project_link_str = f" (Проект: _{project_data_for_task.get('name','?')} _)" 
-                        reply_lines.append(f"  `{t_item['id']}`: {t_item['name']}{project_link_str} {dl_info} {prog}")
-                    items_found_for_listing = True
-                elif item_type_llm == "task": # Searched only for tasks and none active
-                    reply_lines.append("У вас нет активных задач.")
-                    items_found_for_listing = True 
-            
-            if not items_found_for_listing:
-                if not reply_lines: # Ensure we don't add this if specific "no projects/tasks" was already added
-                    reply_lines.append("У вас нет активных проектов или задач. Время что-нибудь создать! 😊")
-                    # items_found_for_listing = True # Set to true as we are providing a response
+            # Постраничный список из status_view.py; фильтры - по типу, просроченным и по проекту
+            project_id = None; project_hint = entities.get("project_name_hint_for_task")
+            if project_hint:
+                found_project = find_item_by_name_or_id(project_hint, "project", data)
+                if not found_project: await update.message.reply_text(f"Проект '{project_hint}' не найден."); return None
+                project_id = found_project["id"]
+            code = filter_code(item_type_llm, entities.get("status_filter") == "overdue", project_id)
+            page_text, page_markup = get_status_page(data, user_id_str, code)
+            await update.message.reply_text(page_text, parse_mode='Markdown', reply_markup=page_markup)
+            return None
         
         # --- Отправка сообщения (ЕДИНЫЙ УПРОЩЕННЫЙ БЛОК) ---
         if reply_lines:
             final_reply_text = "\n".join(reply_lines)
-            
-            # Add a general header only if item_name_hint was None and we are showing actual lists of items
-            has_actual_list_content = False
-            if not item_name_hint:
-                if any("*Ваши активные проекты:*" in line for line in reply_lines) or \
-                   any("*Ваши активные задачи:*" in line for line in reply_lines):
-                    has_actual_list_content = True
-            
-            if has_actual_list_content: # Only add this generic header if we are listing items.
-                 final_reply_text = "🔍 *Ваш текущий статус:*\n" + final_reply_text
-            
             await update.message.reply_text(final_reply_text, parse_mode='Markdown', reply_markup=keyboard_markup)
         else:
             # This 'else' branch is for cases where reply_lines is unexpectedly empty.
             # Specific item "not found" is handled earlier.
-            # General query "no items" should populate reply_lines with a message.
             # So, this signifies an issue if reached.
             logger.error(f"query_status: reply_lines is unexpectedly empty AFTER processing. User: {uid}, Text: '{user_text}', NLU: {nlu_result}")
             await update.message.reply_text("Не удалось сформировать ответ по статусу. Пожалуйста, попробуйте еще раз или /help.")
         
         return None # End of query_status handling
         
+    elif intent == "batch_update":
+        plan = batch_ops.plan_batch(data, user_id_str, entities.get("operations"))
+        if not plan.changes: await update.message.reply_text(plan.summary() + "\nОбновите по одному: /progress"); return None
+        context.user_data[PENDING_BATCH_UPDATE_KEY] = batch_ops.plan_to_state(plan)
+        keyboard = [[InlineKeyboardButton("✅ Да", callback_data=batch_ops.encode_batch_confirmation(uid, plan, True)),
+                     InlineKeyboardButton("❌ Нет", callback_data=batch_ops.encode_batch_confirmation(uid, plan, False))]]
+        await update.message.reply_text(plan.summary(), reply_markup=InlineKeyboardMarkup(keyboard))
+        return None
+
+    elif intent == "bulk_project_action":
+        project_hint = entities.get("project_name_hint_for_task") or entities.get("item_name_hint"); action = entities.get("bulk_action")
+        if action not in bulk_ops.BULK_ACTIONS or not project_hint:
+            await update.message.reply_text("Не понял массовое действие. Примеры: 'заверши все задачи проекта X', 'сдвинь сроки проекта X на 3 дня', 'архивируй завершенные в X'."); return None
+        found_project = find_item_by_name_or_id(project_hint, "project", data)
+        if not found_project or str(found_project.get("owner_id")) != user_id_str: await update.message.reply_text(f"Проект '{project_hint}' не найден."); return None
+        try: days = int(entities.get("shift_days") or 0)
+        except (TypeError, ValueError): days = 0
+        if action == bulk_ops.BULK_SHIFT_DEADLINES and not (0 < abs(days) <= bulk_ops.MAX_SHIFT_DAYS):
+            await update.message.reply_text("На сколько дней сдвинуть сроки? Например: 'сдвинь сроки проекта X на 3 дня'."); return None
+        plan = bulk_ops.plan_bulk_action(data, user_id_str, found_project["id"], action, days)
+        summary = plan.summary(found_project["name"])
+        if not plan.changes: await update.message.reply_text(summary); return None
+        keyboard = [[InlineKeyboardButton("✅ Да", callback_data=bulk_ops.encode_bulk_confirmation(uid, plan, True)),
+                     InlineKeyboardButton("❌ Нет", callback_data=bulk_ops.encode_bulk_confirmation(uid, plan, False))]]
+        await update.message.reply_text(summary, reply_markup=InlineKeyboardMarkup(keyboard))
+        return None
+
+    elif intent in ("pause_reports", "resume_reports"):
+        enable = intent == "resume_reports"
+        user_entry = data["users"].setdefault(user_id_str, {"username": update.effective_user.username or f"User_{user_id_str}", "is_admin": False, "timezone": "UTC"})
+        user_entry["receive_reports"] = enable
+        if not save_data(data): await update.message.reply_text(SAVE_FAILED_TEXT); return None
+        await update.message.reply_text("Ежедневные отчеты включены. 📊" if enable else "Ежедневные отчеты приостановлены. Напишите 'включи отчеты', чтобы вернуть.")
+        return None
+
     else: 
         await update.message.reply_text(f"Не совсем понял ваш запрос: '{user_text}'. Попробуйте /help.")
     return None
 
-def main():
-    builder = Application.builder().token(BOT_TOKEN)
+async def post_init(application: Application) -> None:
+    await warm_up()
+    start_state_store(application)
+    start_dedup()
+    async def send_report(chat_id: int, text: str):
+        # Массовая рассылка: уступает интерактивным ответам в очереди исходящих
+        await application.bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown', rate_limit_args={"priority": outbound.BULK})
+    start_report_scheduler(send_report)
+    start_reminder_scheduler(send_report)
+    archive_store.start_archiver()
+
+async def post_shutdown(application: Application) -> None:
+    await stop_report_scheduler()
+    await stop_reminder_scheduler()
+    await archive_store.stop_archiver()
+    await stop_state_store(application)
+    await stop_dedup()
+
+def build_application() -> Application:
+    builder = Application.builder().token(BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown)
+    # Ежедневные отчеты идут через собственный планировщик (reports.py), JobQueue не нужна
     logger.info("Инициализация Application без встроенной JobQueue (job_queue=None).")
     builder.job_queue(None) 
+    # user_data с TTL ключей и лимитом размера; ожидающие подтверждения сохраняются между перезапусками
+    builder.context_types(ContextTypes(user_data=UserState))
+    # Все исходящие запросы идут через очередь с лимитами Telegram (outbound.py) и общий пул соединений
+    builder.rate_limiter(outbound.rate_limiter)
+    builder.connection_pool_size(outbound.HTTP_CONNECTION_POOL_SIZE).pool_timeout(outbound.HTTP_POOL_TIMEOUT)
+    builder.connect_timeout(outbound.HTTP_CONNECT_TIMEOUT).read_timeout(outbound.HTTP_READ_TIMEOUT).write_timeout(outbound.HTTP_WRITE_TIMEOUT)
     application = builder.build()
 
     add_project_conv = ConversationHandler(
@@ -575,22 +733,58 @@ def main():
         fallbacks=[CommandHandler('cancel', universal_cancel)], name="update_progress_conversation"
     )
 
+    application.add_handler(TypeHandler(Update, note_first_update), group=-1000)
+    # Повторно доставленные апдейты отбрасываются до всех остальных групп (dedup.py)
+    application.add_handler(TypeHandler(Update, drop_duplicate_updates), group=-999)
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("status", status_command))
+    application.add_handler(CommandHandler("restore", restore_command))
+    application.add_handler(CommandHandler("import", import_command))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(MessageHandler(filters.Document.FileExtension("csv") | filters.Document.FileExtension("jsonl"), import_document))
+    application.add_handler(CommandHandler("loglevel", loglevel_command))
+    application.add_handler(CommandHandler("logsample", logsample_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("queue", queue_command))
+    application.add_handler(CommandHandler("stats", stats_command))
     
     application.add_handler(add_project_conv, group=1)
     application.add_handler(add_task_conv, group=1)
     application.add_handler(update_progress_conv, group=1)
     
-    application.add_handler(CallbackQueryHandler(confirm_progress_update_callback, pattern=r"^confirm_progress_(yes|no)$"), group=1)
+    application.add_handler(CallbackQueryHandler(confirm_progress_update_callback, pattern=rf"^(confirm_progress_(yes|no)|{CALLBACK_CONFIRM_PROGRESS_PREFIX}:.+)$"), group=1)
+    application.add_handler(CallbackQueryHandler(bulk_confirm_callback, pattern=f"^{bulk_ops.CALLBACK_BULK_PREFIX}:"), group=1)
+    application.add_handler(CallbackQueryHandler(batch_confirm_callback, pattern=f"^{batch_ops.CALLBACK_BATCH_PREFIX}:"), group=1)
+    application.add_handler(CallbackQueryHandler(status_page_callback, pattern=f"^{CALLBACK_STATUS_PAGE_PREFIX}:"), group=1)
     application.add_handler(CallbackQueryHandler(show_pace_details_callback, pattern=f"^{CALLBACK_SHOW_PACE_DETAILS_PREFIX}_"), group=1)
     application.add_handler(CallbackQueryHandler(handle_parent_project_progress_no_thanks, pattern=f"^{CALLBACK_UPDATE_PARENT_PROJECT_PREFIX}_no_"), group=1)
     application.add_handler(CallbackQueryHandler(handle_parent_project_progress_yes, pattern=f"^{CALLBACK_UPDATE_PARENT_PROJECT_PREFIX}_yes_"), group=1)
 
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message), group=2) 
-    
-    logger.info("Запуск бота...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    # Неблокирующий: хендлер ждет окно склейки сообщений (debounce.py), не задерживая другие апдейты
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message, block=False), group=2) 
+    timeline.mark("приложение собрано")
+    return application
+
+def main():
+    mode = os.getenv('BOT_MODE', 'polling').lower()
+    workers = int(os.getenv('BOT_WORKERS', '1'))
+    if workers > ID_MAX_NODES: logger.error(f"BOT_WORKERS={workers}: воркеров может быть не больше {ID_MAX_NODES}."); exit()
+    if workers > 1:
+        # Приемник + воркеры по разделам пользователей (cluster.py); Application собирают воркеры
+        from cluster import run_cluster
+        logger.info(f"Запуск бота (режим: {mode}, воркеров: {workers})...")
+        run_cluster(workers, mode, allowed_updates=Update.ALL_TYPES)
+        logger.info("Бот остановлен."); return
+    from cluster import reshard
+    reshard(1) # Раньше работали воркеры: их разделы собираются обратно в один файл
+    application = build_application()
+    logger.info(f"Запуск бота (режим: {mode})...")
+    if mode == 'webhook':
+        from webhook import run_webhook
+        asyncio.run(run_webhook(application, allowed_updates=Update.ALL_TYPES))
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
     logger.info("Бот остановлен.")
 
 if __name__ == '__main__':
@@ -0,0 +1,263 @@
+# bulk_io.py
+# Массовый импорт и экспорт проектов и задач (CSV или JSON Lines).
+# Импорт: строки читаются потоком, дедлайны разбираются один раз на уникальную строку,
+# задачи привязываются к проектам по точному имени (среди проектов пользователя и только что
+# импортированных) или по id. Файл применяется целиком или никак: при любой ошибке в строках
+# данные не меняются. Разбор идет в потоке по элементам владельца из снимка (snapshot.py) и живой
+# документ не трогает; новые элементы получают временные ссылки ("#<строка>"). Настоящие ID
+# выдаются в apply_import в цикле событий, там же ссылки на существующие проекты проверяются
+# заново. Применение - одно сохранение данных и одно уведомление об изменениях.
+# Файл /export загружается обратно без дублей: строки с id, который уже есть у пользователя,
+# пропускаются, а status и created_at переносятся.
+import csv
+import json
+import logging
+import re
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, TextIO, Tuple, Union
+
+import pytz
+
+from utils import generate_id, parse_natural_deadline_to_date
+
+logger = logging.getLogger(__name__)
+
+MAX_IMPORT_ROWS = 50000
+MAX_REPORTED_ERRORS = 20
+EXPORT_FIELDS = ["id", "type", "name", "deadline", "project", "status", "total_units", "current_units", "created_at"]
+IMPORT_HELP = (
+    "Импорт: пришлите файл .csv или .jsonl.\n"
+    "Колонки (CSV с заголовком) или ключи (JSONL): type (project/task), name, deadline, "
+    "project (имя или id проекта для задачи), total_units, current_units; "
+    "необязательные id, status (active/completed/archived), created_at.\n"
+    "Файл /export можно загрузить обратно: элементы, чей id уже есть у вас, пропускаются.\n"
+    "Файл применяется целиком: если в строках есть ошибки, ничего не сохраняется."
+)
+
+_ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_IMPORT_STATUSES = ("active", "completed", "archived")
+_TYPE_ALIASES = {"project": "project", "проект": "project", "proj": "project", "task": "task", "задача": "task"}
+
+
+class ImportResult:
+    def __init__(self):
+        # Временная ссылка "#<строка>" -> элемент без id; у задач project_id - ссылка или id существующего проекта
+        self.projects: Dict[str, Dict[str, Any]] = {}
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self.source_ids: Dict[str, str] = {}  # ссылка -> id из файла (для проверки дублей при применении)
+        self.errors: List[str] = []
+        self.rows = 0
+        self.skipped = 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors and self.rows > 0 and bool(self.projects or self.tasks)
+
+    def summary(self) -> str:
+        if self.errors:
+            shown = "\n".join(self.errors[:MAX_REPORTED_ERRORS])
+            more = f"\n…и еще {len(self.errors) - MAX_REPORTED_ERRORS} ошибок." if len(self.errors) > MAX_REPORTED_ERRORS else ""
+            return f"Импорт отменен: ошибки в {len(self.errors)} из {self.rows} строк.\n{shown}{more}"
+        if not self.rows:
+            return "Файл пуст: нет строк для импорта."
+        skipped = f", пропущено уже существующих {self.skipped}" if self.skipped else ""
+        return f"Импортировано: проектов {len(self.projects)}, задач {len(self.tasks)} (строк {self.rows}{skipped})."
+
+
+# --- Чтение ---
+def iter_rows(stream: TextIO, file_name: str) -> Iterator[Tuple[int, Union[Dict[str, Any], None]]]:
+    """(номер строки, словарь) по одной строке файла; None вместо словаря - строку не удалось разобрать."""
+    if file_name.lower().endswith(".jsonl"):
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                yield line_no, row if isinstance(row, dict) else None
+            except json.JSONDecodeError:
+                yield line_no, None
+        return
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, {(k or "").strip().lower(): v for k, v in row.items()}
+
+
+def _resolve_deadline(raw: Any, memo: Dict[str, Union[str, None]]) -> Tuple[bool, Union[str, None]]:
+    """(успех, YYYY-MM-DD или None). Каждая уникальная строка разбирается один раз."""
+    text = str(raw or "").strip()
+    if not text:
+        return True, None
+    if text not in memo:
+        if _ISO_DATE_RE.match(text):
+            try: memo[text] = datetime.strptime(text, '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError: memo[text] = None
+        else:
+            parsed = parse_natural_deadline_to_date(text)
+            memo[text] = parsed.strftime('%Y-%m-%d') if parsed else None
+    return memo[text] is not None, memo[text]
+
+
+def _units(row: Dict[str, Any], key: str) -> int:
+    value = row.get(key)
+    if value in (None, ""):
+        return 0
+    number = int(float(str(value).replace(",", ".")))
+    if number < 0:
+        raise ValueError(f"{key} < 0")
+    return number
+
+
+def _created_at(raw: Any, default: str) -> Union[str, None]:
+    text = str(raw or "").strip()
+    if not text:
+        return default
+    try: moment = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError: return None
+    return (moment if moment.tzinfo else pytz.utc.localize(moment)).isoformat()
+
+
+def prepare_import(owner_data: Mapping[str, Any], user_id_str: str, rows: Iterable[Tuple[int, Union[Dict[str, Any], None]]]) -> ImportResult:
+    """
+    Проверяет строки и готовит новые элементы. owner_data - элементы пользователя
+    (snapshot.Snapshot.owner_data) или документ: чужие элементы пропускаются. Проекты из файла
+    создаются раньше задач, поэтому задача может ссылаться на проект, описанный ниже по файлу.
+    """
+    result = ImportResult()
+    created_at = datetime.now(pytz.utc).isoformat()
+    memo: Dict[str, Union[str, None]] = {}
+    pending_tasks: List[Tuple[int, Dict[str, Any], str]] = []
+    own = {pool_name: {i: item for i, item in owner_data.get(pool_name, {}).items() if str(item.get("owner_id")) == user_id_str}
+           for pool_name in ("projects", "tasks")}
+    file_ids: Dict[str, str] = {}  # id проекта из файла -> ссылка или существующий id
+
+    # Имена проектов пользователя (в нижнем регистре) -> id
+    project_by_name = {item.get("name", "").lower(): pid for pid, item in own["projects"].items()}
+
+    for line_no, row in rows:
+        result.rows += 1
+        if result.rows > MAX_IMPORT_ROWS:
+            result.errors.append(f"Строк больше {MAX_IMPORT_ROWS}: разбейте файл на части."); break
+        if row is None:
+            result.errors.append(f"Строка {line_no}: не удалось разобрать."); continue
+        item_type = _TYPE_ALIASES.get(str(row.get("type") or "").strip().lower())
+        name = str(row.get("name") or "").strip()
+        if item_type is None:
+            result.errors.append(f"Строка {line_no}: type должен быть project или task."); continue
+        if not name:
+            result.errors.append(f"Строка {line_no}: пустое имя."); continue
+        ok, deadline = _resolve_deadline(row.get("deadline"), memo)
+        if not ok:
+            result.errors.append(f"Строка {line_no}: не распознан дедлайн '{row.get('deadline')}'."); continue
+        try:
+            total = _units(row, "total_units"); current = _units(row, "current_units")
+        except ValueError:
+            result.errors.append(f"Строка {line_no}: total_units и current_units - целые числа ≥ 0."); continue
+        if total and current > total:
+            result.errors.append(f"Строка {line_no}: current_units больше total_units."); continue
+        status = str(row.get("status") or "active").strip().lower()
+        if status not in _IMPORT_STATUSES:
+            result.errors.append(f"Строка {line_no}: status должен быть active, completed или archived."); continue
+        item_created_at = _created_at(row.get("created_at"), created_at)
+        if item_created_at is None:
+            result.errors.append(f"Строка {line_no}: created_at не в формате ISO."); continue
+
+        source_id = str(row.get("id") or "").strip()
+        if source_id in own["projects" if item_type == "project" else "tasks"]:
+            # Элемент уже есть (повторная загрузка экспорта): не дублируем
+            result.skipped += 1
+            if item_type == "project": file_ids[source_id] = source_id
+            continue
+        item = {"name": name, "deadline": deadline, "owner_id": user_id_str, "created_at": item_created_at,
+                "status": status, "total_units": total, "current_units": current}
+        ref = f"#{line_no}"
+        if source_id: result.source_ids[ref] = source_id
+        if item_type == "project":
+            result.projects[ref] = {**item, "last_report_day_counter": 0}
+            project_by_name.setdefault(name.lower(), ref)
+            if source_id: file_ids[source_id] = ref
+        else:
+            pending_tasks.append((line_no, item, str(row.get("project") or "").strip()))
+
+    for line_no, item, project_ref in pending_tasks:
+        project_id = None
+        if project_ref:
+            project_id = file_ids.get(project_ref) or (project_ref if project_ref in own["projects"] else project_by_name.get(project_ref.lower()))
+            if project_id is None:
+                result.errors.append(f"Строка {line_no}: проект '{project_ref}' не найден."); continue
+        result.tasks[f"#{line_no}"] = {**item, "project_id": project_id}
+    return result
+
+
+def apply_import(data: Dict[str, Any], user_id_str: str, result: ImportResult) -> List[str]:
+    """
+    Применяет подготовленный импорт к живому документу (в цикле событий). Ссылки на существующие
+    проекты проверяются заново: пока шел разбор, проект могли удалить. При ошибке data не меняется,
+    возвращается список ошибок; иначе - пустой список, элементы получают ID и id в result.
+    """
+    projects_pool = data.setdefault("projects", {}); tasks_pool = data.setdefault("tasks", {})
+
+    def owned(pool: Dict[str, Any], item_id: str) -> bool:
+        return item_id in pool and str(pool[item_id].get("owner_id")) == user_id_str
+
+    # Элементы, чей id из файла появился у пользователя за время разбора, тоже пропускаются
+    id_map: Dict[str, str] = {}
+    for refs, pool in ((result.projects, projects_pool), (result.tasks, tasks_pool)):
+        for ref in [r for r in refs if owned(pool, result.source_ids.get(r, ""))]:
+            id_map[ref] = result.source_ids[ref]; del refs[ref]; result.skipped += 1
+    errors = [f"Проект '{task['project_id']}' для задачи '{task['name']}' больше не существует."
+              for task in result.tasks.values()
+              if task["project_id"] and not task["project_id"].startswith("#") and not owned(projects_pool, task["project_id"])]
+    if errors:
+        return errors
+
+    projects: Dict[str, Dict[str, Any]] = {}; tasks: Dict[str, Dict[str, Any]] = {}
+    for ref, item in result.projects.items():
+        new_id = id_map[ref] = generate_id("proj", projects_pool)
+        projects[new_id] = projects_pool[new_id] = {"id": new_id, **item}
+    for item in result.tasks.values():
+        new_id = generate_id("task", tasks_pool)
+        tasks[new_id] = tasks_pool[new_id] = {"id": new_id, **item, "project_id": id_map.get(item["project_id"], item["project_id"])}
+    result.projects = projects; result.tasks = tasks
+    return []
+
+
+def import_file(owner_data: Mapping[str, Any], user_id_str: str, path: str, file_name: str) -> ImportResult:
+    with open(path, 'r', encoding='utf-8-sig', newline='') as stream:
+        return prepare_import(owner_data, user_id_str, iter_rows(stream, file_name))
+
+
+# --- Экспорт ---
+def _export_rows(data: Mapping[str, Any], user_id_str: str) -> Iterator[Dict[str, Any]]:
+    # data - документ или элементы владельца из снимка (snapshot.Snapshot.owner_data): индекс не нужен,
+    # чтобы экспорт в потоке не трогал общий кеш индекса
+    projects = data.get("projects", {}); tasks = data.get("tasks", {})
+    for item_type, pool in (("project", projects), ("task", tasks)):
+        for item_id, item in pool.items():
+            if str(item.get("owner_id")) != user_id_str: continue
+            project_name = projects.get(item.get("project_id") or "", {}).get("name", "") if item_type == "task" else ""
+            yield {"id": item_id, "type": item_type, "name": item.get("name", ""), "deadline": item.get("deadline") or "",
+                   "project": project_name, "status": item.get("status", ""), "total_units": item.get("total_units", 0),
+                   "current_units": item.get("current_units", 0), "created_at": item.get("created_at", "")}
+
+
+def export_items(data: Mapping[str, Any], user_id_str: str, stream: TextIO, fmt: str = "csv") -> int:
+    """Пишет элементы пользователя в поток построчно. Возвращает число строк."""
+    count = 0
+    if fmt == "jsonl":
+        for row in _export_rows(data, user_id_str):
+            stream.write(json.dumps(row, ensure_ascii=False) + "\n"); count += 1
+        return count
+    writer = csv.DictWriter(stream, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in _export_rows(data, user_id_str):
+        writer.writerow(row); count += 1
+    return count
+
+
+def export_to_file(data: Mapping[str, Any], user_id_str: str, fmt: str = "csv") -> Tuple[str, int]:
+    """Потоковый экспорт во временный файл (удаляет вызывающий). Возвращает (путь, число строк)."""
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8-sig' if fmt == "csv" else 'utf-8', newline='',
+                                     suffix=f".{fmt}", delete=False) as stream:
+        count = export_items(data, user_id_str, stream, fmt)
+    return stream.name, count
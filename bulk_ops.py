@@ -0,0 +1,122 @@
+# bulk_ops.py
+# Массовые действия над задачами проекта: завершить все, сдвинуть сроки, архивировать завершенные.
+# Затронутые элементы берутся из индекса project_id -> задачи (ItemIndex.tasks_by_project).
+# Пользователь видит одно подтверждение со сводкой; кнопка подписана (callback_codec) и несет
+# отпечаток затронутого набора: если между показом и нажатием набор изменился, действие не применяется.
+# Применение - одна запись данных.
+import struct
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple, Union
+
+import pytz
+
+from callback_codec import sign_payload, verify_payload
+from data_handler import get_item_index
+
+BULK_COMPLETE_TASKS = "complete_tasks"
+BULK_SHIFT_DEADLINES = "shift_deadlines"
+BULK_ARCHIVE_COMPLETED = "archive_completed"
+BULK_ACTIONS = (BULK_COMPLETE_TASKS, BULK_SHIFT_DEADLINES, BULK_ARCHIVE_COMPLETED)
+CALLBACK_BULK_PREFIX = "bk"
+MAX_SHIFT_DAYS = 3650
+MAX_LISTED = 10
+
+_ACTION_CODES = {action: code for code, action in enumerate(BULK_ACTIONS)}
+_PAYLOAD = struct.Struct('>BBhI')  # действие, да/нет, сдвиг в днях, отпечаток набора
+
+
+class BulkPlan:
+    """Затронутые элементы и их новые значения; строится заново и при показе, и при подтверждении."""
+
+    def __init__(self, project_id: str, action: str, days: int = 0):
+        self.project_id = project_id; self.action = action; self.days = days
+        self.changes: List[Dict[str, Any]] = []  # {"pool", "id", "name", "field": новое значение, ...}
+
+    def fingerprint(self) -> int:
+        # crc32 по id и текущему состоянию затронутых полей: любое изменение набора меняет отпечаток
+        state = "|".join(f"{c['id']}:{c['before']}" for c in self.changes)
+        return zlib.crc32(f"{self.action}:{self.days}:{state}".encode('utf-8'))
+
+    def summary(self, project_name: str) -> str:
+        if not self.changes:
+            return {
+                BULK_COMPLETE_TASKS: f"В проекте '{project_name}' нет активных задач.",
+                BULK_SHIFT_DEADLINES: f"В проекте '{project_name}' нет активных элементов со сроком.",
+                BULK_ARCHIVE_COMPLETED: f"В проекте '{project_name}' нет завершенных задач.",
+            }[self.action]
+        count = len(self.changes)
+        if self.action == BULK_COMPLETE_TASKS: head = f"Завершить {count} задач(и) проекта '{project_name}'?"
+        elif self.action == BULK_SHIFT_DEADLINES: head = f"Сдвинуть сроки {count} элемент(ов) проекта '{project_name}' на {self.days:+d} дн.?"
+        else: head = f"Архивировать {count} завершенных задач(и) проекта '{project_name}'?"
+        lines = [head]
+        for change in self.changes[:MAX_LISTED]:
+            detail = f": {change['before']} → {change['after']}" if self.action == BULK_SHIFT_DEADLINES else ""
+            lines.append(f"• {change['name']}{detail}")
+        if count > MAX_LISTED:
+            lines.append(f"…и еще {count - MAX_LISTED}.")
+        return "\n".join(lines)
+
+
+def plan_bulk_action(data: Dict[str, Any], user_id_str: str, project_id: str, action: str, days: int = 0) -> BulkPlan:
+    plan = BulkPlan(project_id, action, days)
+    project = data.get("projects", {}).get(project_id)
+    if project is None or str(project.get("owner_id")) != user_id_str:
+        return plan  # Поиск по имени/ID идет по всем пользователям: чужой проект - пустой план
+    tasks = data.get("tasks", {})
+    task_ids = [t for t in get_item_index(data).tasks_by_project.get(project_id, [])
+                if t in tasks and str(tasks[t].get("owner_id")) == user_id_str]
+    if action == BULK_COMPLETE_TASKS:
+        for t in task_ids:
+            if tasks[t].get("status") == "active":
+                plan.changes.append({"pool": "tasks", "id": t, "name": tasks[t].get("name", t), "before": "active", "after": "completed"})
+    elif action == BULK_ARCHIVE_COMPLETED:
+        for t in task_ids:
+            if tasks[t].get("status") == "completed":
+                plan.changes.append({"pool": "tasks", "id": t, "name": tasks[t].get("name", t), "before": "completed", "after": "archived"})
+    elif action == BULK_SHIFT_DEADLINES:
+        candidates = [("projects", project_id, project)] + [("tasks", t, tasks[t]) for t in task_ids]
+        for pool, item_id, item in candidates:
+            if item.get("status") == "active" and item.get("deadline"):
+                try: new_deadline = (datetime.strptime(item["deadline"], '%Y-%m-%d') + timedelta(days=days)).strftime('%Y-%m-%d')
+                except ValueError: continue
+                plan.changes.append({"pool": pool, "id": item_id, "name": item.get("name", item_id), "before": item["deadline"], "after": new_deadline})
+    return plan
+
+
+def apply_bulk_plan(data: Dict[str, Any], plan: BulkPlan) -> List[Tuple[str, int]]:
+    """
+    Применяет план к data (без сохранения). Возвращает [(id, изменение прогресса), ...] для
+    progress_history.record_progress - записать только после удачного save_data.
+    """
+    now_iso = datetime.now(pytz.utc).isoformat(); progress = []
+    for change in plan.changes:
+        item = data[change["pool"]][change["id"]]
+        if plan.action == BULK_COMPLETE_TASKS:
+            # Как при одиночном завершении: прогресс доводится до цели (или до 100, если цели не было)
+            if item.get("total_units", 0) == 0: item["total_units"] = 100
+            progress.append((change["id"], item["total_units"] - item.get("current_units", 0)))
+            item["current_units"] = item["total_units"]; item["status"] = "completed"; item["completed_at"] = now_iso
+        elif plan.action == BULK_ARCHIVE_COMPLETED:
+            item["status"] = "archived"; item["archived_at"] = now_iso
+        else:
+            item["deadline"] = change["after"]
+    return progress
+
+
+# --- Подписанные кнопки подтверждения ---
+def encode_bulk_confirmation(user_id: int, plan: BulkPlan, confirm: bool) -> str:
+    project_id = plan.project_id.encode('utf-8')
+    payload = _PAYLOAD.pack(_ACTION_CODES[plan.action], int(confirm), plan.days, plan.fingerprint()) + project_id
+    return sign_payload(CALLBACK_BULK_PREFIX, user_id, payload)
+
+
+def decode_bulk_confirmation(user_id: int, callback_data: str) -> Union[Dict[str, Any], None]:
+    payload = verify_payload(CALLBACK_BULK_PREFIX, user_id, callback_data)
+    if payload is None or len(payload) <= _PAYLOAD.size:
+        return None
+    action_code, confirm, days, fingerprint = _PAYLOAD.unpack_from(payload)
+    if action_code >= len(BULK_ACTIONS):
+        return None
+    return {"action": BULK_ACTIONS[action_code], "confirm": bool(confirm), "days": days, "fingerprint": fingerprint,
+            "project_id": payload[_PAYLOAD.size:].decode('utf-8', errors='replace')}
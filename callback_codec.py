@@ -0,0 +1,121 @@
+# callback_codec.py
+# Самодостаточные callback_data для inline-кнопок: все нужное для обработки нажатия упаковано
+# в саму кнопку (struct -> base64url) и подписано HMAC, привязанным к пользователю.
+# Серверное состояние между показом кнопки и нажатием не нужно, несколько открытых
+# подтверждений не мешают друг другу. Лимит Telegram на callback_data - 64 байта.
+import base64
+import hashlib
+import hmac
+import os
+import re
+import struct
+from typing import Any, Dict, Tuple, Union
+
+from utils import id_number, id_from_number
+
+CALLBACK_DATA_LIMIT = 64
+TAG_BYTES = 8         # Усеченный HMAC-SHA256: 64 бита достаточно против подбора через кнопки
+FORMAT_VERSION = 1
+
+# Флаги подтверждения прогресса
+_FLAG_TASK = 0x01      # иначе проект
+_FLAG_COMPLETE = 0x02  # иначе обновление прогресса
+_FLAG_YES = 0x04       # иначе "Нет"
+_FLAG_RAW_ID = 0x08    # id не в формате <префикс>_<8 hex>, хранится строкой
+_FLAG_TIME_ID = 0x10   # id с меткой времени (utils.generate_id): 50-битное число в 7 байтах
+
+_COMPACT_ID_RE = re.compile(r'^(proj|task)_([0-9a-f]{8})$')
+_PROGRESS_HEAD = struct.Struct('>BBii')  # версия, флаги, старые ед., новые ед.
+
+_secret_key: Union[bytes, None] = None
+
+
+def _key() -> bytes:
+    # CALLBACK_SECRET, если задан; иначе ключ выводится из токена бота (не покидает процесс)
+    global _secret_key
+    if _secret_key is None:
+        secret = os.getenv('CALLBACK_SECRET') or os.getenv('BOT_TOKEN') or ''
+        _secret_key = hashlib.sha256(b'callback-data:' + secret.encode('utf-8')).digest()
+    return _secret_key
+
+
+def _tag(prefix: str, user_id: int, payload: bytes) -> bytes:
+    message = prefix.encode('ascii') + b':' + struct.pack('>q', user_id) + payload
+    return hmac.new(_key(), message, hashlib.sha256).digest()[:TAG_BYTES]
+
+
+def sign_payload(prefix: str, user_id: int, payload: bytes) -> str:
+    """'<prefix>:<base64url(payload + подпись)>'. ValueError, если не помещается в 64 байта."""
+    encoded = base64.urlsafe_b64encode(payload + _tag(prefix, user_id, payload)).rstrip(b'=').decode('ascii')
+    callback_data = f"{prefix}:{encoded}"
+    if len(callback_data) > CALLBACK_DATA_LIMIT:
+        raise ValueError(f"callback_data длиной {len(callback_data)} превышает {CALLBACK_DATA_LIMIT} байт")
+    return callback_data
+
+
+def verify_payload(prefix: str, user_id: int, callback_data: str) -> Union[bytes, None]:
+    """Полезная нагрузка, если префикс верный и подпись сходится для этого пользователя, иначе None."""
+    head, _, encoded = (callback_data or '').partition(':')
+    if head != prefix or not encoded:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+    except (ValueError, TypeError):
+        return None
+    if len(raw) <= TAG_BYTES:
+        return None
+    payload, tag = raw[:-TAG_BYTES], raw[-TAG_BYTES:]
+    return payload if hmac.compare_digest(tag, _tag(prefix, user_id, payload)) else None
+
+
+# --- Подтверждение прогресса / завершения ---
+def _pack_item_id(item_id: str, item_type: str) -> Union[Tuple[int, bytes], None]:
+    # (флаг, байты) для известных форматов id; None - id хранится строкой
+    prefix = "task" if item_type == "task" else "proj"
+    if not item_id.startswith(prefix + "_"):
+        return None
+    number = id_number(item_id)
+    if number is not None:
+        return _FLAG_TIME_ID, number.to_bytes(7, 'big')
+    match = _COMPACT_ID_RE.match(item_id)
+    if not match:
+        return None
+    return 0, bytes.fromhex(match.group(2))
+
+
+def encode_progress_confirmation(prefix: str, user_id: int, item_id: str, item_type: str, action: str,
+                                 old_units: int, new_units: int, confirm: bool) -> str:
+    flags = (_FLAG_TASK if item_type == "task" else 0) | (_FLAG_COMPLETE if action == "complete" else 0) | (_FLAG_YES if confirm else 0)
+    packed = _pack_item_id(item_id, item_type)
+    if packed is None:
+        flags |= _FLAG_RAW_ID
+        raw_id = item_id.encode('utf-8')
+        packed_id = bytes([len(raw_id)]) + raw_id
+    else:
+        id_flag, packed_id = packed; flags |= id_flag
+    payload = _PROGRESS_HEAD.pack(FORMAT_VERSION, flags, int(old_units), int(new_units)) + packed_id
+    return sign_payload(prefix, user_id, payload)
+
+
+def decode_progress_confirmation(prefix: str, user_id: int, callback_data: str) -> Union[Dict[str, Any], None]:
+    """Разбирает и проверяет кнопку подтверждения. None - чужая, поврежденная или неизвестной версии."""
+    payload = verify_payload(prefix, user_id, callback_data)
+    if payload is None or len(payload) < _PROGRESS_HEAD.size:
+        return None
+    version, flags, old_units, new_units = _PROGRESS_HEAD.unpack_from(payload)
+    if version != FORMAT_VERSION:
+        return None
+    item_type = "task" if flags & _FLAG_TASK else "project"
+    rest = payload[_PROGRESS_HEAD.size:]
+    if flags & _FLAG_RAW_ID:
+        item_id = rest[1:1 + rest[0]].decode('utf-8', errors='replace') if rest else ''
+    elif flags & _FLAG_TIME_ID:
+        item_id = id_from_number('task' if item_type == 'task' else 'proj', int.from_bytes(rest, 'big'))
+    else:
+        item_id = f"{'task' if item_type == 'task' else 'proj'}_{rest.hex()}"
+    return {
+        "item_id": item_id, "item_type_db": item_type,
+        "action_type": "complete" if flags & _FLAG_COMPLETE else "update",
+        "old_current_units": old_units, "new_current_units": new_units,
+        "confirm": bool(flags & _FLAG_YES),
+    }
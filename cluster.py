@@ -0,0 +1,372 @@
+# cluster.py
+# Многопроцессный режим (BOT_WORKERS > 1). Один процесс-приемник получает апдейты (вебхук или
+# long polling, как BOT_MODE) и раздает их N процессам-воркерам через multiprocessing.Queue.
+# Воркер выбирается по отправителю апдейта (user_id % N), поэтому все апдейты пользователя
+# обрабатывает один процесс по порядку: ConversationHandler и context.user_data
+# (ACTIVE_CONVERSATION_KEY и др.) остаются корректными без общей памяти.
+# Воркер - обычное Application без опроса Telegram. Данные и файлы состояния (WORKER_FILES) у
+# каждого воркера свои: он пишет только свой раздел (data_handler.set_partition), без блокировок
+# между процессами. Имена файлов раздела содержат число воркеров ('x.w1of4.json'); при его смене
+# reshard() до запуска воркеров перекладывает данные по новым разделам (LAYOUT_FILE помнит раскладку).
+# Приемник следит за воркерами: завершившийся или зависший (нет сердцебиения) воркер перезапускается.
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import signal
+import time
+from array import array
+from typing import Any, Dict, List, Set, Tuple, Union
+
+from telegram import Bot, Update
+from telegram.error import NetworkError, RetryAfter
+
+from data_handler import partition_of, partition_file, repartition_data
+
+logger = logging.getLogger(__name__)
+
+INBOX_SIZE = 1000             # апдейтов в очереди одного воркера; при переполнении приемник просит Telegram повторить
+HEARTBEAT_INTERVAL = 1.0      # как часто воркер отмечается (и как долго ждет очередь)
+HEARTBEAT_TIMEOUT = 30.0      # без отметки дольше - воркер считается зависшим
+STARTUP_TIMEOUT = 120.0       # на запуск воркера (сборка приложения, прогрев)
+HEALTH_CHECK_INTERVAL = 5.0
+RESTART_BACKOFF = 5.0         # не чаще одного перезапуска воркера за этот интервал
+SHUTDOWN_TIMEOUT = 15.0
+POLL_TIMEOUT = 30             # long polling приемника, с
+LAYOUT_FILE = 'cluster_layout.json'  # {"workers": N[, "previous": M]} - на сколько разделов разложены файлы
+
+
+def route_user_id(raw: Dict[str, Any]) -> int:
+    """Id отправителя сырого апдейта (как effective_user), иначе id чата, иначе 0."""
+    for key, value in raw.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        sender = value.get("from") or value.get("user")
+        if isinstance(sender, dict) and "id" in sender:
+            return int(sender["id"])
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return int(chat["id"])
+    return 0
+
+
+def _worker_files() -> List[Tuple[Any, str]]:
+    # (модуль, атрибут с именем файла) для файлов состояния, которые у каждого воркера свои
+    import archive_store, dedup, progress_history, reminders, reports, state_store
+    return [(state_store, "STATE_FILE"), (reports, "REPORT_PROGRESS_FILE"), (reports, "REPORT_SENT_LOG_FILE"),
+            (reminders, "REMINDERS_SENT_FILE"), (progress_history, "HISTORY_FILE"), (progress_history, "HISTORY_IDS_FILE"),
+            (dedup, "DEDUP_FILE"), (archive_store, "ARCHIVE_FILE")]
+
+
+# --- Смена числа воркеров ---
+def _read_json(path: str) -> Any:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_json(path: str, value: Any) -> None:
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(value, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_file, path)
+
+
+def _remove_layout(count: int) -> None:
+    import data_handler
+    paths = [data_handler.DATA_FILE] + [getattr(module, attr) for module, attr in _worker_files()]
+    for path in paths:
+        for index in range(count):
+            try: os.remove(partition_file(path, index, count))
+            except FileNotFoundError: pass
+
+
+def _legacy_archives() -> List[str]:
+    # Раньше у воркера был свой архив по номеру ('bot_data_archive.w1.json.gz') и при смене числа
+    # воркеров элементы чужих номеров пропадали из поиска и /restore
+    import archive_store
+    directory, name = os.path.split(archive_store.ARCHIVE_FILE)
+    stem, dot, ext = name.partition('.')
+    pattern = re.compile(rf"{re.escape(stem)}\.w\d+{re.escape(dot + ext)}")
+    return [os.path.join(directory, f) for f in os.listdir(directory or '.') if pattern.fullmatch(f)]
+
+
+def _reshard_archive(old: int, new: int, legacy: List[str]) -> Dict[str, Any]:
+    # Архив - в раздел владельца элемента, как и данные. Возвращает {id: владелец} архивных элементов
+    import archive_store
+    merged: Dict[str, Dict[str, Any]] = {}
+    for path in [partition_file(archive_store.ARCHIVE_FILE, i, old) for i in range(old)] + legacy:
+        for pool_name, pool in archive_store._read_archive(path).items(): merged.setdefault(pool_name, {}).update(pool)
+    if any(merged.values()):
+        for j in range(new):
+            archive_store._write_archive({pool_name: {i: item for i, item in pool.items() if partition_of(item.get("owner_id"), new) == j}
+                                          for pool_name, pool in merged.items()}, partition_file(archive_store.ARCHIVE_FILE, j, new))
+    return {item_id: item.get("owner_id") for pool in merged.values() for item_id, item in pool.items()}
+
+
+def _reshard_state(old: int, new: int, users: Dict[str, Any], owners: Dict[str, Any]) -> None:
+    # Файлы состояния воркеров: по пользователям - в раздел пользователя, общие отметки - всем
+    import dedup, progress_history, reminders, reports, state_store
+    olds = range(old); news = range(new)
+
+    user_state: Dict[str, Any] = {}
+    for i in olds: user_state.update(_read_json(partition_file(state_store.STATE_FILE, i, old)) or {})
+    for j in news:
+        _write_json(partition_file(state_store.STATE_FILE, j, new), {u: v for u, v in user_state.items() if partition_of(u, new) == j})
+
+    # Отчеты: группа завершена, только если ее завершили все старые воркеры; для остальных
+    # пользователи воркера, завершившего группу, считаются получившими отчет
+    progress = [reports._load_progress(partition_file(reports.REPORT_PROGRESS_FILE, i, old),
+                                       partition_file(reports.REPORT_SENT_LOG_FILE, i, old)) for i in olds]
+    done = set.intersection(*(set(p["done"]) for p in progress))
+    sent: Dict[str, Set[str]] = {}
+    for i, p in enumerate(progress):
+        for bucket, user_ids in p["sent"].items(): sent.setdefault(bucket, set()).update(user_ids)
+        for bucket in set(p["done"]) - done:
+            sent.setdefault(bucket, set()).update(u for u in users if partition_of(u, old) == i)
+    for j in news:
+        reports._save_progress({"done": sorted(done), "sent": {b: sorted(u for u in ids if partition_of(u, new) == j)
+                                                              for b, ids in sent.items() if b not in done}},
+                               partition_file(reports.REPORT_PROGRESS_FILE, j, new), partition_file(reports.REPORT_SENT_LOG_FILE, j, new))
+
+    for path in (reminders.REMINDERS_SENT_FILE, dedup.DEDUP_FILE):
+        merged: Dict[str, Any] = {}
+        for i in olds: merged.update(_read_json(partition_file(path, i, old)) or {})
+        for j in news: _write_json(partition_file(path, j, new), merged)
+
+    # История прогресса - в раздел владельца элемента (неизвестные - в раздел 0)
+    series: Dict[str, Tuple[array, array]] = {}
+    for i in olds:
+        _, part = progress_history.read_history(partition_file(progress_history.HISTORY_FILE, i, old),
+                                                partition_file(progress_history.HISTORY_IDS_FILE, i, old))
+        for item_id, (days, deltas) in part.items():
+            for day, delta in zip(days, deltas): progress_history._add_event(series, item_id, day, delta)
+    for j in news:
+        progress_history.write_history({i: v for i, v in series.items() if partition_of(owners.get(i), new) == j},
+                                       partition_file(progress_history.HISTORY_FILE, j, new),
+                                       partition_file(progress_history.HISTORY_IDS_FILE, j, new))
+
+
+def reshard(count: int) -> None:
+    """
+    Приводит файлы данных и состояния к раскладке на count воркеров (1 - обычный режим).
+    Вызывается до запуска воркеров. Новые файлы пишутся рядом со старыми (в имени - число
+    воркеров), раскладка переключается записью LAYOUT_FILE, и только потом старые файлы удаляются:
+    сбой на любом шаге оставляет одну целую раскладку.
+    """
+    layout = _read_json(LAYOUT_FILE) or {}
+    old = int(layout.get("workers", 1)); previous = layout.get("previous")
+    if previous is not None:
+        _remove_layout(int(previous))  # Прошлое переключение не успело удалить старые файлы
+        _write_json(LAYOUT_FILE, {"workers": old})
+    legacy = _legacy_archives()
+    if old == count:
+        if legacy:
+            _reshard_archive(old, count, legacy)
+            for path in legacy: os.remove(path)
+            logger.info(f"Архивы воркеров ({len(legacy)}) разложены по разделам владельцев.")
+        return
+    started = time.perf_counter()
+    merged = repartition_data(old, count)
+    owners = _reshard_archive(old, count, legacy)
+    owners.update({item_id: item.get("owner_id") for pool_name in ("projects", "tasks") for item_id, item in merged[pool_name].items()})
+    _reshard_state(old, count, merged["users"], owners)
+    _write_json(LAYOUT_FILE, {"workers": count, "previous": old})
+    _remove_layout(old)
+    for path in legacy: os.remove(path)
+    _write_json(LAYOUT_FILE, {"workers": count})
+    logger.info(f"Данные переложены с {old} на {count} разделов за {time.perf_counter() - started:.2f} с "
+                f"(пользователей {len(merged['users'])}, элементов {len(owners)}).")
+
+
+# --- Воркер ---
+def _worker_main(index: int, count: int, inbox: Any, heartbeat: Any) -> None:
+    # Точка входа дочернего процесса: свой раздел данных и свои файлы состояния
+    import data_handler, outbound, utils
+    data_handler.set_partition(index, count)
+    for module, attr in _worker_files():
+        setattr(module, attr, partition_file(getattr(module, attr), index, count))
+    utils.ID_NODE = index  # Новые ID разных воркеров не совпадают даже в одну секунду
+    # Лимит Telegram на бота общий: каждый воркер получает свою долю. Личный чат = пользователь,
+    # поэтому лимиты на чат по-прежнему считаются в одном процессе.
+    outbound.rate_limiter.global_bucket = outbound.TokenBucket(outbound.GLOBAL_RATE / count, max(1, outbound.GLOBAL_BURST // count))
+    import bot5
+    application = bot5.build_application()
+    logger.info(f"Воркер {index + 1}/{count} (pid {os.getpid()}) запущен.")
+    asyncio.run(_run_worker(application, inbox, heartbeat))
+    logger.info(f"Воркер {index + 1}/{count} остановлен.")
+
+
+async def _run_worker(application: Any, inbox: Any, heartbeat: Any) -> None:
+    from webhook import running_application
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try: loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError: pass
+    async with running_application(application):
+        while not stop_event.is_set():
+            heartbeat.value = time.time()  # Отметка из цикла событий: если он завис, отметок не будет
+            try:
+                raw = await asyncio.to_thread(inbox.get, True, HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                continue
+            if raw is None:
+                break  # Приемник останавливает воркер
+            try:
+                update = Update.de_json(raw, application.bot)
+            except (ValueError, TypeError, KeyError) as e:
+                logger.warning(f"Воркер: не удалось разобрать апдейт {raw.get('update_id')}: {e}"); continue
+            await application.update_queue.put(update)
+
+
+class _WorkerSlot:
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Union[multiprocessing.Process, None] = None
+        self.inbox: Any = None
+        self.heartbeat: Any = None
+        self.started_at = 0.0
+        self.restarts = 0
+
+
+# --- Приемник ---
+class Cluster:
+    def __init__(self, count: int):
+        self.count = count
+        self.context = multiprocessing.get_context("spawn")  # Чистые процессы: без копии цикла событий и сокетов родителя
+        self.slots: List[_WorkerSlot] = [_WorkerSlot(i) for i in range(count)]
+        self.stats: Dict[str, int] = {"dispatched": 0, "busy": 0, "restarts": 0}
+
+    def start_worker(self, slot: _WorkerSlot, new_inbox: bool = True) -> None:
+        if new_inbox or slot.inbox is None:
+            slot.inbox = self.context.Queue(INBOX_SIZE)
+        slot.heartbeat = self.context.Value('d', 0.0, lock=False)
+        slot.process = self.context.Process(target=_worker_main, name=f"bot-worker-{slot.index}",
+                                            args=(slot.index, self.count, slot.inbox, slot.heartbeat), daemon=True)
+        slot.process.start(); slot.started_at = time.time()
+
+    def dispatch(self, raw: Dict[str, Any]) -> bool:
+        slot = self.slots[partition_of(route_user_id(raw), self.count)]
+        try:
+            slot.inbox.put_nowait(raw)
+        except queue.Full:
+            self.stats["busy"] += 1
+            return False
+        self.stats["dispatched"] += 1
+        return True
+
+    def _alive(self, slot: _WorkerSlot, now: float) -> bool:
+        if slot.process is None or not slot.process.is_alive():
+            return False
+        if slot.heartbeat.value == 0.0:
+            return now - slot.started_at < STARTUP_TIMEOUT
+        return now - slot.heartbeat.value < HEARTBEAT_TIMEOUT
+
+    def is_ready(self) -> bool:
+        now = time.time()
+        return all(slot.heartbeat is not None and slot.heartbeat.value > 0 and self._alive(slot, now) for slot in self.slots)
+
+    async def supervise(self) -> None:
+        while True:
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            now = time.time()
+            for slot in self.slots:
+                if self._alive(slot, now) or now - slot.started_at < RESTART_BACKOFF:
+                    continue
+                exited = not slot.process.is_alive()
+                if exited:
+                    logger.error(f"Воркер {slot.index} завершился (код {slot.process.exitcode}), перезапуск.")
+                else:
+                    logger.error(f"Воркер {slot.index} не отвечает {now - max(slot.heartbeat.value, slot.started_at):.0f} с, перезапуск.")
+                    slot.process.kill()
+                    await asyncio.to_thread(slot.process.join, SHUTDOWN_TIMEOUT)
+                # Очередь завершившегося процесса цела и отдается новому; убитый мог оставить ее в
+                # несогласованном состоянии, поэтому ему - новая (апдейты в ней теряются)
+                slot.restarts += 1; self.stats["restarts"] += 1
+                self.start_worker(slot, new_inbox=not exited)
+
+    async def stop(self) -> None:
+        for slot in self.slots:
+            if slot.process is not None and slot.process.is_alive():
+                try: slot.inbox.put(None, timeout=1.0)
+                except queue.Full: slot.process.terminate()
+        for slot in self.slots:
+            if slot.process is None: continue
+            await asyncio.to_thread(slot.process.join, SHUTDOWN_TIMEOUT)
+            if slot.process.is_alive():
+                logger.warning(f"Воркер {slot.index} не остановился за {SHUTDOWN_TIMEOUT:.0f} с, принудительное завершение.")
+                slot.process.kill()
+
+    def describe(self) -> str:
+        lines = [f"Воркеров: {self.count}, роздано апдейтов {self.stats['dispatched']}, "
+                 f"отказов (очередь полна) {self.stats['busy']}, перезапусков {self.stats['restarts']}"]
+        for slot in self.slots:
+            pid = slot.process.pid if slot.process else None
+            lines.append(f"  #{slot.index}: pid {pid}, перезапусков {slot.restarts}")
+        return "\n".join(lines)
+
+
+async def _poll_updates(bot: Bot, cluster: Cluster, allowed_updates: Any) -> None:
+    # Long polling на стороне приемника; offset сдвигается только после передачи апдейта воркеру
+    offset = None
+    await bot.delete_webhook()
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=POLL_TIMEOUT, read_timeout=POLL_TIMEOUT + 10,
+                                            allowed_updates=allowed_updates)
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)); continue
+        except NetworkError as e:
+            logger.warning(f"Приемник: ошибка получения апдейтов: {e}"); await asyncio.sleep(1.0); continue
+        for update in updates:
+            while not cluster.dispatch(update.to_dict()):
+                await asyncio.sleep(0.1)  # Воркер перегружен: ждем, порядок апдейтов сохраняется
+            offset = update.update_id + 1
+
+
+async def _run_ingress(count: int, mode: str, allowed_updates: Any) -> None:
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try: loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError: pass
+
+    cluster = Cluster(count)
+    for slot in cluster.slots:
+        cluster.start_worker(slot)
+    logger.info(f"Запущено воркеров: {count} (режим приема: {mode}).")
+    bot = Bot(os.getenv('BOT_TOKEN'))
+    tasks = [loop.create_task(cluster.supervise())]
+    server = None
+    try:
+        async with bot:
+            if mode == 'webhook':
+                from webhook import WebhookServer, register_webhook
+                server = WebhookServer(None, sink=cluster.dispatch, ready_check=cluster.is_ready)
+                await server.start()
+                await register_webhook(bot, allowed_updates)
+            else:
+                tasks.append(loop.create_task(_poll_updates(bot, cluster, allowed_updates)))
+            await stop_event.wait()
+    finally:
+        logger.info("Остановка приемника и воркеров...")
+        if server is not None: await server.stop()
+        for task in tasks: task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await cluster.stop()
+        logger.info(cluster.describe())
+
+
+def run_cluster(count: int, mode: str, allowed_updates: Any = Update.ALL_TYPES) -> None:
+    from utils import ID_MAX_NODES
+    if not 1 <= count <= ID_MAX_NODES:
+        # Номер воркера входит в ID элементов (utils.ID_NODE): больше воркеров - совпадающие ID
+        raise ValueError(f"Число воркеров должно быть от 1 до {ID_MAX_NODES}, задано {count}")
+    reshard(count)
+    asyncio.run(_run_ingress(count, mode, allowed_updates))
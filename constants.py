@@ -23,8 +23,14 @@ UPDATE_PROGRESS_CONV_STATE_VALUE = 'state_updating_progress'
 NEW_TASK_INFO_KEY = 'new_task_info'
 ITEM_FOR_PROGRESS_UPDATE_KEY = 'item_for_progress_update'
 
-# Ключ для данных, ожидающих подтверждения кнопками (обновление/завершение прогресса)
+# Ключ для данных, ожидающих подтверждения кнопками (обновление/завершение прогресса).
+# Новые кнопки самодостаточны (CALLBACK_CONFIRM_PROGRESS_PREFIX); ключ читается только для старых кнопок
 PENDING_PROGRESS_UPDATE_KEY = 'pending_progress_update_info'
+# План изменений из одного сообщения (batch_ops.py), ожидающий подтверждения; кнопка несет только его отпечаток
+PENDING_BATCH_UPDATE_KEY = 'pending_batch_update'
+
+# Префикс подписанных кнопок подтверждения прогресса (формат - callback_codec.py)
+CALLBACK_CONFIRM_PROGRESS_PREFIX = "cp"
 
 # Callback data для кнопки "Детали темпа"
 CALLBACK_SHOW_PACE_DETAILS_PREFIX = "show_pace_details"
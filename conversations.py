@@ -12,15 +12,20 @@ from constants import (
     LAST_PROCESSED_IN_CONV_MSG_ID_KEY,
     ASK_TASK_NAME, ASK_TASK_PROJECT_LINK, ASK_TASK_DEADLINE_STATE,
     ADD_TASK_CONV_STATE_VALUE, NEW_TASK_INFO_KEY,
-    PENDING_PROGRESS_UPDATE_KEY,
+    PENDING_PROGRESS_UPDATE_KEY, CALLBACK_CONFIRM_PROGRESS_PREFIX,
     ASK_PROGRESS_ITEM_TYPE, ASK_PROGRESS_ITEM_NAME, ASK_PROGRESS_DESCRIPTION, 
     UPDATE_PROGRESS_CONV_STATE_VALUE, ITEM_FOR_PROGRESS_UPDATE_KEY,
     CALLBACK_UPDATE_PARENT_PROJECT_PREFIX # Для кнопок Да/Нет при обновлении проекта
 )
    
 from utils import parse_natural_deadline_to_date, generate_id
-from data_handler import load_data, save_data, find_item_by_name_or_id
+from data_handler import load_data, save_data, find_item_by_name_or_id, record_item_mutation, SAVE_FAILED_TEXT
+from rollups import get_project_rollup
+from progress_history import record_progress
 from llm_handler import interpret_progress_description
+from log_handler import log_event
+from callback_codec import encode_progress_confirmation, decode_progress_confirmation
+from dedup import claim_mutation, release_mutation
 
 logger = logging.getLogger(__name__)
 
@@ -52,10 +57,13 @@ async def received_project_deadline(update: Update, context: ContextTypes.DEFAUL
         parsed_dl = parse_natural_deadline_to_date(deadline_txt)
         if parsed_dl: final_dl_str = parsed_dl.strftime('%Y-%m-%d'); dl_msg = f"с дедлайном {final_dl_str}"
         else: await update.message.reply_text(f"Не понял дату '{deadline_txt}'. Еще раз или 'пропустить'. /cancel"); return ASK_PROJECT_DEADLINE
-    data = load_data(); new_id = generate_id("proj"); created_at = datetime.now(pytz.utc).isoformat()
-    data.setdefault("projects", {}) # Гарантируем существование ключа
+    if not claim_mutation("create", update): # Повторная доставка того же сообщения
+        context.user_data.pop('new_project_info', None); context.user_data.pop(ACTIVE_CONVERSATION_KEY, None); return ConversationHandler.END
+    data = load_data(); data.setdefault("projects", {}) # Гарантируем существование ключа
+    new_id = generate_id("proj", data["projects"]); created_at = datetime.now(pytz.utc).isoformat()
     data["projects"][new_id] = {"id":new_id,"name":project_name,"deadline":final_dl_str,"owner_id":str(uid),"created_at":created_at,"status":"active", "total_units":0,"current_units":0,"last_report_day_counter":0}
-    save_data(data); await update.message.reply_text(f"🎉 Проект '{project_name}' {dl_msg} создан!\nID: `{new_id}`",parse_mode='Markdown')
+    if not save_data(data): await update.message.reply_text(SAVE_FAILED_TEXT + " /cancel"); return ASK_PROJECT_DEADLINE # Можно прислать срок еще раз
+    record_item_mutation(uid, "project", new_id); await update.message.reply_text(f"🎉 Проект '{project_name}' {dl_msg} создан!\nID: `{new_id}`",parse_mode='Markdown')
     context.user_data.pop('new_project_info', None); context.user_data.pop(ACTIVE_CONVERSATION_KEY, None)
     context.user_data[LAST_PROCESSED_IN_CONV_MSG_ID_KEY] = update.message.message_id
     return ConversationHandler.END
@@ -93,9 +101,12 @@ async def received_task_deadline(update: Update, context: ContextTypes.DEFAULT_T
         parsed_dl = parse_natural_deadline_to_date(deadline_txt)
         if parsed_dl: final_dl_str = parsed_dl.strftime('%Y-%m-%d'); dl_msg = f"с дедлайном {final_dl_str}"
         else: await update.message.reply_text(f"Не понял дату '{deadline_txt}'. Еще раз или 'пропустить'. /cancel"); return ASK_TASK_DEADLINE_STATE
-    data = load_data(); new_id = generate_id("task"); created_at = datetime.now(pytz.utc).isoformat(); data.setdefault("tasks", {})
+    if not claim_mutation("create", update): # Повторная доставка того же сообщения
+        context.user_data.pop(NEW_TASK_INFO_KEY, None); context.user_data.pop(ACTIVE_CONVERSATION_KEY, None); return ConversationHandler.END
+    data = load_data(); data.setdefault("tasks", {}); new_id = generate_id("task", data["tasks"]); created_at = datetime.now(pytz.utc).isoformat()
     data["tasks"][new_id] = {"id": new_id, "name": task_name, "deadline": final_dl_str, "project_id": task_info.get('project_id'), "owner_id": str(uid), "created_at": created_at, "status": "active", "total_units":0, "current_units":0}
-    save_data(data); await update.message.reply_text(f"💪 Задача '{task_name}' ({project_fb}) {dl_msg} создана!\nID: `{new_id}`", parse_mode='Markdown')
+    if not save_data(data): await update.message.reply_text(SAVE_FAILED_TEXT + " /cancel"); return ASK_TASK_DEADLINE_STATE # Можно прислать срок еще раз
+    record_item_mutation(uid, "task", new_id); await update.message.reply_text(f"💪 Задача '{task_name}' ({project_fb}) {dl_msg} создана!\nID: `{new_id}`", parse_mode='Markdown')
     context.user_data.pop(NEW_TASK_INFO_KEY, None); context.user_data.pop(ACTIVE_CONVERSATION_KEY, None)
     context.user_data[LAST_PROCESSED_IN_CONV_MSG_ID_KEY] = update.message.message_id
     return ConversationHandler.END
@@ -165,7 +176,7 @@ async def received_progress_description_dialog(update: Update, context: ContextT
 
 # --- Функции для кнопок подтверждения ПРОГРЕССА / ЗАВЕРШЕНИЯ ---
 async def ask_for_progress_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE, item_info: dict):
-    logger.debug(f"ask_for_progress_confirmation получила item_info: {item_info}") # Добавим лог для отладки
+    log_event(logger, logging.DEBUG, "progress.confirm_requested", item_info=item_info)
 
     item_name = item_info['item_name']
     new_units = item_info['new_current_units']
@@ -189,13 +200,14 @@ async def ask_for_progress_confirmation(update: Update, context: ContextTypes.DE
         else:
             text += "?"
     
+    # Все, что нужно confirm_progress_update_callback, упаковано в подписанные кнопки - user_data не используется
+    button_args = (CALLBACK_CONFIRM_PROGRESS_PREFIX, update.effective_user.id, item_info['item_id'], item_info['item_type_db'],
+                   action_type, old_units, new_units)
     keyboard = [[
-        InlineKeyboardButton("✅ Да", callback_data="confirm_progress_yes"),
-        InlineKeyboardButton("❌ Нет", callback_data="confirm_progress_no")
+        InlineKeyboardButton("✅ Да", callback_data=encode_progress_confirmation(*button_args, True)),
+        InlineKeyboardButton("❌ Нет", callback_data=encode_progress_confirmation(*button_args, False))
     ]]
-    # Сохраняем всю item_info (включая action_type) для confirm_progress_update_callback
-    context.user_data[PENDING_PROGRESS_UPDATE_KEY] = item_info 
-    logger.debug(f"Сохранено в PENDING_PROGRESS_UPDATE_KEY: {item_info} для {update.effective_user.id}")
+    log_event(logger, logging.DEBUG, "progress.pending_saved", user_id=update.effective_user.id, item_id=item_info.get('item_id'))
     
     # Отправляем сообщение с кнопками
     if update.message: # Если это ответ на обычное сообщение
@@ -207,17 +219,25 @@ async def ask_for_progress_confirmation(update: Update, context: ContextTypes.DE
 async def confirm_progress_update_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query; await query.answer(); user_choice = query.data; user_id = update.effective_user.id
     original_message_id = query.message.message_id; chat_id = query.message.chat_id
-    pending_update = context.user_data.pop(PENDING_PROGRESS_UPDATE_KEY, None) 
-    if not pending_update: logger.warning(f"Нет PENDING_PROGRESS_UPDATE_KEY для {user_id}"); await query.edit_message_text("Ошибка."); return
-    item_id = pending_update['item_id']; item_type_db = pending_update['item_type_db']; item_name = pending_update['item_name']
+    pending_update = decode_progress_confirmation(CALLBACK_CONFIRM_PROGRESS_PREFIX, user_id, user_choice)
+    if pending_update is None and user_choice in ("confirm_progress_yes", "confirm_progress_no"): # Кнопки, отправленные до перехода на подписанный формат
+        pending_update = context.user_data.pop(PENDING_PROGRESS_UPDATE_KEY, None)
+        if pending_update: pending_update['confirm'] = user_choice == "confirm_progress_yes"
+    if not pending_update: logger.warning(f"Неверная или чужая кнопка подтверждения от {user_id}: {user_choice}"); await query.edit_message_text("Ошибка: кнопка недействительна."); return
+    item_id = pending_update['item_id']; item_type_db = pending_update['item_type_db']
     new_units = pending_update['new_current_units']; action_type = pending_update.get('action_type', 'update')
     data = load_data(); item_pool_name = "projects" if item_type_db == "project" else "tasks"; item_pool = data.get(item_pool_name, {})
-    if user_choice == "confirm_progress_yes":
+    item_name = item_pool.get(item_id, {}).get('name', pending_update.get('item_name', item_id))
+    if pending_update['confirm']:
+        if not claim_mutation("confirm", update): return # Повторное нажатие той же кнопки
+        if item_id in item_pool and item_pool[item_id].get('current_units', 0) != pending_update['old_current_units']:
+            # Кнопка показывала прогресс от старого значения: с тех пор элемент уже изменили
+            await query.edit_message_text(f"Прогресс для '{item_name}' уже изменился ({item_pool[item_id].get('current_units', 0)}). Повторите запрос."); return
         if item_id in item_pool:
-            item_to_update = item_pool[item_id]; item_to_update['current_units'] = new_units; success_message = f"Прогресс для '{item_name}' обновлен до {new_units}."
+            item_to_update = item_pool[item_id]; progress_delta = new_units - item_to_update.get('current_units', 0); item_to_update['current_units'] = new_units; success_message = f"Прогресс для '{item_name}' обновлен до {new_units}."
             project_to_prompt_for_update_after_task = None
             if action_type == 'complete':
-                item_to_update['status'] = 'completed'
+                item_to_update['status'] = 'completed'; item_to_update['completed_at'] = datetime.now(pytz.utc).isoformat()
                 if item_to_update.get('total_units', 0) == 0 and new_units == 100: item_to_update['total_units'] = 100
                 success_message = f"👍 {item_type_db.capitalize()} '{item_name}' завершен!"
                 logger.info(f"{item_type_db.capitalize()} '{item_name}' (ID:{item_id}) ЗАВЕРШЕН юзером {user_id}.")
@@ -225,18 +245,23 @@ async def confirm_progress_update_callback(update: Update, context: ContextTypes
                 if item_type_db == "task" and item_to_update.get("project_id"):
                     proj_id = item_to_update["project_id"]
                     if proj_id in data.get("projects", {}):
-                        project_to_update_after_task = data["projects"][proj_id]
-                        project_to_update_after_task["id"] = proj_id 
-            save_data(data); await query.edit_message_text(success_message) 
+                        project_to_prompt_for_update_after_task = {**data["projects"][proj_id], "id": proj_id}
+            if not save_data(data):
+                release_mutation("confirm", update) # Кнопки остаются: повторное нажатие применит изменение заново
+                await query.edit_message_text(SAVE_FAILED_TEXT, reply_markup=query.message.reply_markup if query.message else None); return
+            record_progress(item_id, progress_delta) # История - только после сохранения: несохраненный прогресс не попадает в темп
+            record_item_mutation(item_to_update.get('owner_id'), item_type_db, item_id); await query.edit_message_text(success_message) 
             if action_type != 'complete': logger.info(f"Прогресс для {item_type_db} '{item_name}' ({item_id}) обновлен на {new_units} юзером {user_id}.")
             if project_to_prompt_for_update_after_task: 
                 proj_name = project_to_prompt_for_update_after_task.get('name', 'Неизвестный проект')
                 units_to_add = 1 
+                rollup = get_project_rollup(data, project_to_prompt_for_update_after_task['id']) # Уже учитывает завершение этой задачи
+                rollup_text = f" В проекте завершено задач: {rollup.completed_count} из {rollup.task_count}." if rollup else ""
                 keyboard_proj = [[
                     InlineKeyboardButton(f"Да (+{units_to_add} ед.)", callback_data=f"{CALLBACK_UPDATE_PARENT_PROJECT_PREFIX}_yes_{project_to_prompt_for_update_after_task['id']}_{units_to_add}"),
                     InlineKeyboardButton("Нет, спасибо", callback_data=f"{CALLBACK_UPDATE_PARENT_PROJECT_PREFIX}_no_{project_to_prompt_for_update_after_task['id']}_0"),
                 ]]
-                await context.bot.send_message(chat_id=chat_id, text=f"Задача '{item_name}' завершена. Добавить {units_to_add} ед. прогресса к проекту '{proj_name}'?", reply_markup=InlineKeyboardMarkup(keyboard_proj))
+                await context.bot.send_message(chat_id=chat_id, text=f"Задача '{item_name}' завершена.{rollup_text} Добавить {units_to_add} ед. прогресса к проекту '{proj_name}'?", reply_markup=InlineKeyboardMarkup(keyboard_proj))
         else: await query.edit_message_text(f"Не найден {item_type_db} '{item_name}'."); logger.warning(f"{item_type_db} ID {item_id} не найден.")
     else: 
         final_message = "Завершение отменено." if action_type == 'complete' else "Обновление прогресса отменено."
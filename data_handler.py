@@ -2,7 +2,9 @@
 import json
 import logging
 import os
-from typing import Union, Dict, List, Any
+from typing import Union, Dict, List, Any, Callable
+
+from item_index import ItemIndex, POOLS
 
 logger = logging.getLogger(__name__)
 if not logger.hasHandlers(): # Для самодостаточности при тестировании этого модуля
@@ -14,6 +16,25 @@ if not ADMIN_USER_IDS_DH:
     logger.warning("data_handler.py: ADMIN_IDS не настроены или указан только 0.")
 
 DATA_FILE = 'bot_data_v2.json'
+SAVE_FAILED_TEXT = "⚠️ Не удалось сохранить изменения, они не применены. Попробуйте еще раз."
+
+# Документ держится в памяти и перечитывается с диска, только если файл изменили извне.
+# version растет при каждом сохранении и служит ключом для производных структур (индексов).
+_store: Dict[str, Any] = {"data": None, "mtime": None, "version": 0}
+_index_cache: Dict[str, Any] = {"version": None, "data_id": None, "index": None}
+# Подписчики на изменения элементов: listener(owner_id, item_type, item_id); owner_id=None - изменилось все
+MutationListener = Callable[[Union[str, None], Union[str, None], Union[str, None]], None]
+_mutation_listeners: List[MutationListener] = []
+# Многопроцессный режим (cluster.py): процесс отвечает за пользователей с user_id % count == index
+# и хранит только их - в своем файле раздела (partition_file). Файл пишет один процесс, поэтому
+# запись не требует межпроцессной блокировки и стоит O(раздела), а не O(всего документа).
+_partition: Dict[str, Any] = {"index": 0, "count": 1, "base_file": DATA_FILE}
+
+def _file_mtime() -> Union[float, None]:
+    try:
+        return os.path.getmtime(DATA_FILE)
+    except OSError:
+        return None
 
 def get_default_data() -> Dict[str, Any]:
     # Используем ADMIN_USER_IDS_DH, определенные на уровне этого модуля
@@ -25,7 +46,81 @@ def get_default_data() -> Dict[str, Any]:
         "legacy_goal": {}
     }
 
+def partition_of(user_id: Union[str, int, None], count: int) -> int:
+    try: return abs(int(user_id)) % count
+    except (TypeError, ValueError): return 0
+
+def partition_file(path: str, index: int, count: int) -> str:
+    """Имя файла раздела: 'x.json' -> 'x.w1of4.json'. При count=1 - исходное имя."""
+    if count <= 1:
+        return path
+    directory, name = os.path.split(path)
+    stem, dot, ext = name.partition('.')
+    return os.path.join(directory, f"{stem}.w{index}of{count}{dot}{ext}")
+
+def set_partition(index: int, count: int) -> None:
+    global DATA_FILE
+    _partition["index"] = index; _partition["count"] = max(1, count)
+    DATA_FILE = partition_file(_partition["base_file"], index, _partition["count"])
+
+def owns_user(user_id: Union[str, int, None]) -> bool:
+    return _partition["count"] == 1 or partition_of(user_id, _partition["count"]) == _partition["index"]
+
+def _read_file(path: str) -> Union[Dict[str, Any], None]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def _write_file(path: str, data: Dict[str, Any]) -> None:
+    # Пишем во временный файл и подменяем: при сбое посреди записи старый файл остается целым
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_file, path)
+
+def read_other_partitions() -> List[Dict[str, Any]]:
+    """Документы остальных разделов с диска (только чтение, например для /stats админа). Вызывать в потоке."""
+    count = _partition["count"]
+    if count == 1:
+        return []
+    docs = [_read_file(partition_file(_partition["base_file"], i, count)) for i in range(count) if i != _partition["index"]]
+    return [doc for doc in docs if doc is not None]
+
+def repartition_data(old_count: int, new_count: int, base_file: Union[str, None] = None) -> Dict[str, Any]:
+    """
+    Перекладывает данные из файлов old_count разделов в файлы new_count разделов (при смене числа
+    воркеров; вызывается до их запуска). Старые файлы не удаляются. Возвращает объединенный документ.
+    """
+    base_file = base_file or _partition["base_file"]
+    merged = get_default_data()
+    for index in range(old_count):
+        doc = _read_file(partition_file(base_file, index, old_count))
+        if doc is None:
+            continue
+        for key in ("users", *(pool_name for pool_name, _ in POOLS)):
+            merged[key].update(doc.get(key, {}))
+        admin_ids = set(merged["config"].get("admin_ids", [])) | set(doc.get("config", {}).get("admin_ids", []))
+        merged["config"] = {**doc.get("config", {}), **merged["config"], "admin_ids": sorted(admin_ids)}
+        for key, value in doc.items():
+            if key not in merged: merged[key] = value
+        if doc.get("legacy_goal"): merged["legacy_goal"] = doc["legacy_goal"]
+    parts = [{**{key: value for key, value in merged.items() if key not in ("users", "projects", "tasks")},
+              "users": {}, "projects": {}, "tasks": {}} for _ in range(new_count)]
+    for user_id, user in merged["users"].items():
+        parts[partition_of(user_id, new_count)]["users"][user_id] = user
+    for pool_name, _ in POOLS:
+        for item_id, item in merged[pool_name].items():
+            parts[partition_of(item.get("owner_id"), new_count)][pool_name][item_id] = item
+    for index, part in enumerate(parts):
+        _write_file(partition_file(base_file, index, new_count), part)
+    return merged
+
 def load_data() -> Dict[str, Any]:
+    mtime = _file_mtime()
+    if _store["data"] is not None and _store["mtime"] == mtime:
+        return _store["data"]
     try:
         with open(DATA_FILE, 'r', encoding='utf-8') as f:
             data: Dict[str, Any] = json.load(f)
@@ -51,14 +146,45 @@ def load_data() -> Dict[str, Any]:
     except (FileNotFoundError, json.JSONDecodeError):
         logger.info(f"Файл {DATA_FILE} не найден или поврежден. Создается новый.")
         data = get_default_data()
+    _store["data"] = data; _store["mtime"] = mtime; _store["version"] += 1
+    record_item_mutation(None) # Файл перечитан: производные данные по всем пользователям устарели
     return data
 
-def save_data(data: Dict[str, Any]):
+def save_data(data: Dict[str, Any]) -> bool:
+    """
+    Записывает документ. False - запись не удалась: изменения не сохранены, и вызывающий не должен
+    сообщать об успехе и вызывать record_item_mutation. Кэш при этом сбрасывается: data - общий
+    словарь load_data(), и его несохраненные правки не должны попасть на диск со следующей записью.
+    """
     try:
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        _write_file(DATA_FILE, data)
     except Exception as e:
         logger.error(f"Ошибка при сохранении данных в {DATA_FILE}: {e}")
+        _store["data"] = None  # Следующий load_data() перечитает файл
+        return False
+    _store["data"] = data; _store["mtime"] = _file_mtime(); _store["version"] += 1
+    return True
+
+def add_mutation_listener(listener: MutationListener) -> None:
+    if listener not in _mutation_listeners:
+        _mutation_listeners.append(listener)
+
+def record_item_mutation(owner_id: Union[str, int, None], item_type: Union[str, None] = None, item_id: Union[str, None] = None) -> None:
+    """Сообщает подписчикам, что элемент пользователя создан или изменен. Вызывается рядом с save_data()."""
+    owner = str(owner_id) if owner_id is not None else None
+    for listener in _mutation_listeners:
+        try: listener(owner, item_type, item_id)
+        except Exception as e: logger.error(f"Ошибка в подписчике изменений данных: {e}", exc_info=True)
+
+def get_data_version() -> int:
+    return _store["version"]
+
+def get_item_index(data: Dict[str, Any]) -> ItemIndex:
+    """Индекс для текущей версии данных; перестраивается после сохранения или перечитывания."""
+    if _index_cache["index"] is None or _index_cache["version"] != _store["version"] or _index_cache["data_id"] != id(data):
+        _index_cache["index"] = ItemIndex(data)
+        _index_cache["version"] = _store["version"]; _index_cache["data_id"] = id(data)
+    return _index_cache["index"]
 
 def is_admin(user_id: int, data: Dict[str, Any]) -> bool: # Переименовано в main_bot при импорте
     return user_id in data.get("config", {}).get("admin_ids", [])
@@ -86,31 +212,15 @@ def find_item_by_name_or_id(query: str, item_type_to_search: Union[str, None], d
             logger.debug(f"Элемент ({pool_info['type_label']}) найден по ID: {query}")
             return item
             
-    # 2. Поиск по имени
-    if item_type_to_search: # Если тип указан, ищем только в нем
-        for pool_info in pools_to_check:
-            if pool_info["type_label"] == item_type_to_search:
-                items_data = data.get(pool_info["name"], {})
-                for item_id, item_details in items_data.items():
-                    if query_lower in item_details.get("name", "").lower():
-                        found = item_details.copy(); found['id'] = item_id; found['item_type_db'] = pool_info["type_label"]
-                        logger.debug(f"({pool_info['type_label']}) найден по имени '{query_lower}' в '{item_details.get('name','')}'. ID: {item_id}")
-                        return found
-    else: # Тип не указан, ищем сначала в проектах, потом в задачах (или наоборот, как решим)
-        # Сначала проекты
-        project_items_data = data.get("projects", {})
-        for item_id, item_details in project_items_data.items():
-            if query_lower in item_details.get("name", "").lower():
-                found = item_details.copy(); found['id'] = item_id; found['item_type_db'] = "project"
-                logger.debug(f"Проект найден по имени '{query_lower}' в '{item_details.get('name','')}'. ID: {item_id}")
-                return found
-        # Затем задачи
-        task_items_data = data.get("tasks", {})
-        for item_id, item_details in task_items_data.items():
-            if query_lower in item_details.get("name", "").lower():
-                found = item_details.copy(); found['id'] = item_id; found['item_type_db'] = "task"
-                logger.debug(f"Задача найдена по имени '{query_lower}' в '{item_details.get('name','')}'. ID: {item_id}")
-                return found
+    # 2. Поиск по имени (по заранее приведенным к нижнему регистру именам из индекса).
+    # Если тип не указан, ищем сначала в проектах, потом в задачах.
+    index = get_item_index(data)
+    for pool_info in pools_to_check:
+        item_id = index.find_by_name(query_lower, pool_info["type_label"])
+        if item_id is not None and item_id in data.get(pool_info["name"], {}):
+            found = data[pool_info["name"]][item_id].copy(); found['id'] = item_id; found['item_type_db'] = pool_info["type_label"]
+            logger.debug(f"({pool_info['type_label']}) найден по имени '{query_lower}'. ID: {item_id}")
+            return found
                 
     logger.debug(f"Элемент по запросу '{query}' (тип: {item_type_to_search}) не найден.")
     return None
\ No newline at end of file
@@ -0,0 +1,72 @@
+# debounce.py
+# Склейка быстрых сообщений одного пользователя перед NLU. Сообщения вида "по АН2" и сразу
+# "сделал половину" раньше давали два независимых вызова interpret_user_input и два ответа.
+# Теперь свободный текст сначала ждет DEBOUNCE_WINDOW секунд: если за это время пришло следующее
+# сообщение, ожидание начинается заново, а тексты копятся; NLU получает их одним запросом.
+# Если новое сообщение пришло, пока NLU по прошлым еще идет (и по результату еще ничего не сделано),
+# тот вызов отменяется, а его текст переходит в новую склейку. Хендлер с дебаунсом должен быть
+# неблокирующим (block=False), иначе ожидание задержит обработку остальных апдейтов.
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_WINDOW = 1.5   # секунд тишины, после которых накопленные сообщения уходят в NLU
+MAX_MERGED = 5          # не больше сообщений в одной склейке: дальше NLU запускается без ожидания
+
+SUPERSEDED = object()   # Результат для вызова, который перекрыт более новым сообщением
+
+# user_id -> накопленные тексты и номер последнего сообщения
+_buffers: Dict[int, Dict[str, Any]] = {}
+# user_id -> (идущий вызов NLU, склеенный текст, по которому он идет)
+_inflight: Dict[int, Tuple[asyncio.Task, str]] = {}
+_stats: Dict[str, int] = {"merged": 0, "cancelled": 0, "nlu_calls": 0}
+
+
+async def collect(user_id: int, text: str) -> Union[str, None]:
+    """
+    Добавляет сообщение в буфер пользователя и ждет окончания окна. Возвращает склеенный текст
+    для последнего сообщения серии и None для перекрытых (их хендлер просто завершается).
+    """
+    buffer = _buffers.setdefault(user_id, {"texts": [], "seq": 0})
+    inflight = _inflight.pop(user_id, None)
+    if inflight is not None and not inflight[0].done():
+        # NLU по прошлым сообщениям еще не ответил: отменяем, его текст идет в новую склейку
+        inflight[0].cancel(); _stats["cancelled"] += 1
+        buffer["texts"].insert(0, inflight[1])
+    buffer["texts"].append(text); buffer["seq"] += 1
+    seq = buffer["seq"]
+    if len(buffer["texts"]) < MAX_MERGED:
+        await asyncio.sleep(DEBOUNCE_WINDOW)
+    if _buffers.get(user_id) is not buffer or buffer["seq"] != seq:
+        return None  # Пришло сообщение новее: текст заберет его обработчик
+    texts: List[str] = _buffers.pop(user_id)["texts"]
+    if len(texts) > 1:
+        _stats["merged"] += len(texts) - 1
+        logger.debug(f"Склеено сообщений пользователя {user_id}: {len(texts)}.")
+    return "\n".join(texts)
+
+
+async def run_nlu(user_id: int, text: str, interpret: Callable[[str], Awaitable[Any]]) -> Any:
+    """
+    interpret(text) как отменяемая задача. Возвращает результат или SUPERSEDED, если вызов отменило
+    более новое сообщение пользователя. После возврата результата вызов уже не отменяется.
+    """
+    task = asyncio.get_running_loop().create_task(interpret(text))
+    _inflight[user_id] = (task, text); _stats["nlu_calls"] += 1
+    try:
+        await asyncio.wait({task})
+    finally:
+        if _inflight.get(user_id, (None,))[0] is task:
+            del _inflight[user_id]
+        if not task.done():
+            task.cancel()  # Отменили сам хендлер (остановка приложения)
+    if task.cancelled():
+        return SUPERSEDED
+    return task.result()
+
+
+def describe_debounce() -> str:
+    return (f"Склейка сообщений: склеено {_stats['merged']}, отменено вызовов NLU {_stats['cancelled']}, "
+            f"вызовов NLU {_stats['nlu_calls']}, ожидают {len(_buffers)}")
@@ -0,0 +1,178 @@
+# dedup.py
+# Защита от повторной обработки. После перезапуска, сетевого повтора или повторной доставки вебхука
+# Telegram присылает тот же апдейт еще раз, а без защиты он снова проходит через NLU (вызов Gemini)
+# и снова создает элемент. Здесь хранится ограниченное множество уже виденных ключей с временем:
+#  - "u:<update_id>" и "m:<chat_id>:<message_id>" - проверяются фильтром drop_duplicate_updates
+#    в самой ранней группе хендлеров, до любого чтения данных и LLM;
+#  - ключи идемпотентности изменений ("create:...", "confirm:..."; см. mutation_key/claim_mutation):
+#    одно и то же действие (сообщение, нажатие кнопки) меняет данные не больше одного раза.
+# Ключи живут DEDUP_WINDOW секунд (Telegram хранит недоставленные апдейты сутки), всего не больше
+# MAX_ENTRIES (вытесняются самые старые). Множество сохраняется в DEDUP_FILE раз в FLUSH_INTERVAL
+# и при остановке, поэтому повтор после перезапуска тоже отбрасывается.
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Union
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+logger = logging.getLogger(__name__)
+
+DEDUP_FILE = 'dedup.json'
+DEDUP_WINDOW = 24 * 3600
+MAX_ENTRIES = 100_000
+FLUSH_INTERVAL = 5.0
+
+# ключ -> время первой обработки (time.time()); порядок вставки = порядок по времени
+_seen: "OrderedDict[str, float]" = OrderedDict()
+_state: Dict[str, Any] = {"dirty": False, "loaded": False}
+_stats: Dict[str, int] = {"updates": 0, "mutations": 0, "evicted": 0}
+_flusher_task: Union[asyncio.Task, None] = None
+
+
+def _evict(now: float) -> None:
+    oldest = now - DEDUP_WINDOW
+    while _seen:
+        key, seen_at = next(iter(_seen.items()))
+        if seen_at > oldest and len(_seen) <= MAX_ENTRIES:
+            return
+        _seen.popitem(last=False); _stats["evicted"] += 1
+
+
+def seen(key: str) -> bool:
+    seen_at = _seen.get(key)
+    return seen_at is not None and seen_at > time.time() - DEDUP_WINDOW
+
+
+def claim(key: str) -> bool:
+    """Отмечает ключ. True - ключ новый (действие выполняется впервые), False - уже был в окне."""
+    if seen(key):
+        return False
+    now = time.time()
+    _seen[key] = now; _seen.move_to_end(key)
+    _state["dirty"] = True
+    _evict(now)
+    return True
+
+
+def _update_keys(update: Update) -> list:
+    keys = [f"u:{update.update_id}"]
+    message = update.message  # Только новые сообщения: правка приходит с тем же message_id
+    if message is not None:
+        keys.append(f"m:{message.chat_id}:{message.message_id}")
+    return keys
+
+
+async def drop_duplicate_updates(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # TypeHandler в группе -999: повторный апдейт не доходит ни до одной группы хендлеров
+    if not isinstance(update, Update):
+        return
+    keys = _update_keys(update)
+    if any(seen(key) for key in keys):
+        _stats["updates"] += 1
+        logger.info(f"Повторный апдейт {update.update_id} отброшен.")
+        raise ApplicationHandlerStop
+    for key in keys:
+        claim(key)
+
+
+def mutation_key(action: str, update: Update) -> str:
+    """
+    Ключ идемпотентности изменения: действие + сообщение, которое к нему привело
+    (для кнопок - сообщение с кнопками, чтобы повторное нажатие не применялось дважды).
+    """
+    query = update.callback_query
+    message = query.message if query is not None and query.message is not None else update.effective_message
+    if message is None:
+        return f"{action}:u{update.update_id}"
+    return f"{action}:{message.chat_id}:{message.message_id}"
+
+
+def claim_mutation(action: str, update: Update) -> bool:
+    """True - изменение по этому действию еще не применялось и теперь отмечено."""
+    key = mutation_key(action, update)
+    if claim(key):
+        return True
+    _stats["mutations"] += 1
+    logger.info(f"Повторное изменение отброшено: {key}.")
+    return False
+
+
+def release_mutation(action: str, update: Update) -> None:
+    """Снимает отметку claim_mutation: изменение не сохранилось, и повторное нажатие должно его применить."""
+    if _seen.pop(mutation_key(action, update), None) is not None:
+        _state["dirty"] = True
+
+
+# --- Сохранение ---
+def load_dedup() -> int:
+    _state["loaded"] = True
+    try:
+        with open(DEDUP_FILE, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.error(f"{DEDUP_FILE} поврежден, отметки обработанных апдейтов сброшены: {e}"); return 0
+    oldest = time.time() - DEDUP_WINDOW
+    for key, seen_at in sorted(snapshot.items(), key=lambda kv: kv[1]):
+        if seen_at > oldest and key not in _seen:
+            _seen[key] = seen_at
+    _evict(time.time())
+    logger.info(f"Восстановлено отметок обработанных апдейтов: {len(_seen)}.")
+    return len(_seen)
+
+
+def _write(seen: Dict[str, float]) -> None:
+    # Сериализация и запись - в потоке: json.dumps по 100k ключей не должен держать цикл событий
+    payload = json.dumps({key: round(seen_at, 1) for key, seen_at in seen.items()}, separators=(',', ':'))
+    try:
+        tmp_file = DEDUP_FILE + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_file, DEDUP_FILE)
+    except OSError as e:
+        logger.error(f"Не удалось сохранить {DEDUP_FILE}: {e}")
+
+
+def _snapshot() -> Dict[str, float]:
+    _evict(time.time())
+    return dict(_seen)
+
+
+async def _flusher() -> None:
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        if _state["dirty"]:
+            # Копия - в цикле событий (словарь меняют хендлеры), сериализация и запись - в потоке
+            _state["dirty"] = False
+            await asyncio.to_thread(_write, _snapshot())
+
+
+def describe_dedup() -> str:
+    return (f"Дедупликация: ключей {len(_seen)}, отброшено апдейтов {_stats['updates']}, "
+            f"изменений {_stats['mutations']}, вытеснено {_stats['evicted']}")
+
+
+def start_dedup() -> None:
+    global _flusher_task
+    if not _state["loaded"]:
+        load_dedup()
+    if _flusher_task is None or _flusher_task.done():
+        _flusher_task = asyncio.get_running_loop().create_task(_flusher())
+
+
+async def stop_dedup() -> None:
+    global _flusher_task
+    if _flusher_task is not None:
+        _flusher_task.cancel()
+        try: await _flusher_task
+        except asyncio.CancelledError: pass
+        _flusher_task = None
+    if _state["dirty"]:
+        _state["dirty"] = False
+        _write(_snapshot())
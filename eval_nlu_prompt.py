@@ -0,0 +1,82 @@
+# eval_nlu_prompt.py
+# Офлайн-сравнение прежнего NLU-промпта (все примеры) и нового (k ближайших примеров).
+#   python eval_nlu_prompt.py               - прогон через Gemini: точность intent/item_type и токены
+#   python eval_nlu_prompt.py --tokens-only - только размер промптов, без вызовов API
+import argparse
+import asyncio
+from typing import List, Tuple, Union
+
+import llm_handler
+from llm_handler import build_nlu_prompt, build_legacy_nlu_prompt, run_nlu_prompt
+
+# (текст, ожидаемый intent, ожидаемый item_type). Фразы намеренно не совпадают с NLU_EXAMPLE_BANK.
+EVAL_SET: List[Tuple[str, str, Union[str, None]]] = [
+    ("добавь проект Солнечная система дедлайн 31 декабря этого года", "add_project", "project"),
+    ("создай проект переезд", "add_project", "project"),
+    ("новая задача сделать кофе для проекта Утро, дедлайн завтра", "add_task", "task"),
+    ("задача написать тесты к проекту Релиз до конца недели", "add_task", "task"),
+    ("по задаче АН2 почти завершил первую часть", "update_progress", "task"),
+    ("сделал еще 20% по исследованию рынка", "update_progress", None),
+    ("по проекту переезд упаковал 3 коробки", "update_progress", "project"),
+    ("тесты +2, кофе готово", "batch_update", None),
+    ("отчет 50%, презентация готова", "batch_update", None),
+    ("статья +2, лендинг +1, Омега 10%", "batch_update", None),
+    ("какой статус у проекта Солнечная система?", "query_status", "project"),
+    ("покажи мои проекты", "query_status", "project"),
+    ("что у меня по задачам", "query_status", "task"),
+    ("мои дела", "query_status", None),
+    ("какие задачи я просрочил", "query_status", None),
+    ("список задач по проекту переезд", "query_status", "task"),
+    ("я закончил с тестами", "complete_item", None),
+    ("проект переезд завершен", "complete_item", "project"),
+    ("сдвинь срок задачи кофе на среду", "set_deadline", "task"),
+    ("задачу тесты привяжи к проекту Релиз", "link_task_to_project", "task"),
+    ("закрой все задачи в проекте Релиз", "bulk_project_action", None),
+    ("сдвинь дедлайны проекта переезд на неделю", "bulk_project_action", None),
+    ("сдвинь дедлайны Дачи на неделю", "bulk_project_action", None),
+    ("хватит слать отчеты", "pause_reports", None),
+    ("верни ежедневные отчеты", "resume_reports", None),
+    ("расскажи анекдот", "other", None),
+]
+
+
+def approx_tokens(text: str) -> int:
+    # Грубая оценка для режима без API: для кириллицы у Gemini выходит около 3 символов на токен
+    return max(1, len(text) // 3)
+
+
+async def evaluate(builder, label: str, tokens_only: bool) -> None:
+    intent_hits = 0; type_hits = 0; input_total = 0; output_total = 0; answered = 0
+    for text, expected_intent, expected_type in EVAL_SET:
+        prompt = builder(text)
+        if tokens_only:
+            input_total += approx_tokens(prompt)
+            continue
+        result, (input_tokens, output_tokens) = await run_nlu_prompt(prompt, text)
+        input_total += input_tokens; output_total += output_tokens
+        if not result:
+            continue
+        answered += 1
+        intent_hits += result.get("intent") == expected_intent
+        type_hits += (result.get("entities") or {}).get("item_type") == expected_type
+    n = len(EVAL_SET)
+    if tokens_only:
+        print(f"{label}: ~{input_total / n:.0f} входных токенов на запрос (оценка)")
+        return
+    print(f"{label}: intent {intent_hits}/{n} ({intent_hits / n:.0%}), item_type {type_hits}/{n} ({type_hits / n:.0%}), "
+          f"ответов {answered}/{n}, в среднем входных токенов {input_total / n:.0f}, выходных {output_total / n:.0f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Сравнение прежнего и нового NLU-промптов")
+    parser.add_argument("--tokens-only", action="store_true", help="не вызывать API, только оценить размер промптов")
+    args = parser.parse_args()
+    if not args.tokens_only and not llm_handler.GEMINI_API_KEY:
+        print("GEMINI_API_KEY не задан: запускаю в режиме --tokens-only.")
+        args.tokens_only = True
+    await evaluate(build_legacy_nlu_prompt, "Прежний промпт (8 примеров)", args.tokens_only)
+    await evaluate(build_nlu_prompt, f"Новый промпт (ближайших примеров: {llm_handler.NLU_FEW_SHOT_K})", args.tokens_only)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
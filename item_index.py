@@ -0,0 +1,56 @@
+# item_index.py
+import logging
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+POOLS = (("projects", "project"), ("tasks", "task"))
+
+
+class ItemIndex:
+    """
+    Вспомогательные индексы поверх документа данных: элементы по владельцу,
+    задачи по проекту и заранее приведенные к нижнему регистру имена для поиска.
+    Строится один раз на версию данных (см. data_handler.get_item_index), поэтому
+    ленивые производные списки (active_sorted) тоже живут до следующего сохранения.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self._data = data
+        # (owner_id, item_type) -> активные id по (дедлайн, имя); заполняется лениво
+        self._active_sorted: Dict[Tuple[str, str], List[str]] = {}
+        # owner_id -> {"project": [id, ...], "task": [id, ...]}
+        self.by_owner: Dict[str, Dict[str, List[str]]] = {}
+        # project_id -> [task_id, ...]
+        self.tasks_by_project: Dict[str, List[str]] = {}
+        # item_type -> [(имя в нижнем регистре, id), ...] в порядке документа
+        self.names: Dict[str, List[Tuple[str, str]]] = {"project": [], "task": []}
+
+        for pool_name, type_label in POOLS:
+            for item_id, item in data.get(pool_name, {}).items():
+                owner = str(item.get("owner_id"))
+                self.by_owner.setdefault(owner, {"project": [], "task": []})[type_label].append(item_id)
+                self.names[type_label].append((item.get("name", "").lower(), item_id))
+                if type_label == "task" and item.get("project_id"):
+                    self.tasks_by_project.setdefault(item["project_id"], []).append(item_id)
+
+    def owner_item_ids(self, owner_id: str, item_type: str) -> List[str]:
+        return self.by_owner.get(str(owner_id), {}).get(item_type, [])
+
+    def active_sorted(self, owner_id: str, item_type: str) -> List[str]:
+        """Активные элементы владельца в порядке вывода статуса: по дедлайну (без срока - в конце), затем по имени."""
+        key = (str(owner_id), item_type)
+        ids = self._active_sorted.get(key)
+        if ids is None:
+            pool = self._data.get("projects" if item_type == "project" else "tasks", {})
+            active = [item_id for item_id in self.owner_item_ids(owner_id, item_type)
+                      if pool[item_id].get("status") == "active" and str(pool[item_id].get("owner_id")) == key[0]]
+            ids = sorted(active, key=lambda item_id: (pool[item_id].get("deadline") or "9999", pool[item_id].get("name", "").lower()))
+            self._active_sorted[key] = ids
+        return ids
+
+    def find_by_name(self, query_lower: str, item_type: str) -> Any:
+        for name_lower, item_id in self.names[item_type]:
+            if query_lower in name_lower:
+                return item_id
+        return None
@@ -1,11 +1,14 @@
 # llm_handler.py
-import google.generativeai as genai
 import os
 import json
 import logging
-from typing import Union # <--- ВАЖНО: этот импорт должен быть
+import re
+import threading
+from typing import Union, Dict, List, Tuple # <--- ВАЖНО: этот импорт должен быть
 from datetime import date 
 
+from log_handler import log_event
+
 logger = logging.getLogger(__name__)
 
 # Загружаем API ключ из переменной окружения
@@ -14,14 +17,9 @@ if not GEMINI_API_KEY:
     logger.error("GEMINI_API_KEY не найден в переменных окружения!")
     # Можно либо завершить работу, либо работать без LLM, но это нужно предусмотреть
     # raise ValueError("GEMINI_API_KEY not found in environment variables.")
-else:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-    except Exception as e:
-        logger.error(f"Ошибка конфигурации Gemini API: {e}")
-        # raise
 
 # Настройки модели
+GEMINI_MODEL_NAME = "gemini-1.5-flash-latest"
 generation_config = {
     "temperature": 0.3,
     "top_p": 0.9,
@@ -37,10 +35,45 @@ safety_settings = [
     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
 ]
 
-model = genai.GenerativeModel(model_name="gemini-1.5-flash-latest",
-                              generation_config=generation_config,
-                              safety_settings=safety_settings)
+# google.generativeai тянет за собой grpc/protobuf/google-api-core и импортируется долго,
+# поэтому SDK загружается и модель создается только при первом обращении (или в warm_up_llm).
+_model = None
+_model_verified = False
+_model_lock = threading.Lock()
 
+def get_model():
+    """
+    Возвращает GenerativeModel, при первом вызове импортируя и настраивая SDK.
+    Доступность модели проверяется один раз; при ошибке проверка повторится на следующем вызове.
+    """
+    global _model, _model_verified
+    if _model is not None and _model_verified:
+        return _model
+    with _model_lock:
+        import google.generativeai as genai
+        if _model is None:
+            genai.configure(api_key=GEMINI_API_KEY)
+            _model = genai.GenerativeModel(model_name=GEMINI_MODEL_NAME,
+                                           generation_config=generation_config,
+                                           safety_settings=safety_settings)
+        if not _model_verified:
+            genai.get_model(_model.model_name) # Заодно открывает соединение с API
+            _model_verified = True
+    return _model
+
+def warm_up_llm() -> bool:
+    """Синхронный прогрев для запуска в потоке: импорт SDK, создание модели, первое соединение."""
+    if not GEMINI_API_KEY:
+        return False
+    try:
+        get_model()
+        return True
+    except Exception as e:
+        logger.error(f"Прогрев Gemini не удался: {e}")
+        return False
+
+# Прежний промпт со всеми примерами. В рабочем NLU больше не используется,
+# оставлен как эталон для eval_nlu_prompt.py.
 NLU_PROMPT_TEMPLATE = """
 Ты продвинутый ассистент для управления задачами и проектами.
 Твоя задача - извлечь из текста пользователя его намерение, а также связанные сущности.
@@ -84,6 +117,141 @@ NLU_PROMPT_TEMPLATE = """
 Текст: "{user_input}"
 Результат:
 """
+# Неизменяемое начало NLU-промпта. Оно одинаково для всех запросов, поэтому на стороне
+# провайдера срабатывает кэширование префикса. Всё, что зависит от запроса (примеры,
+# дата, текст пользователя), идет только после него.
+NLU_STATIC_PREFIX = """
+Ты ассистент для управления задачами и проектами. Извлеки из текста пользователя намерение и сущности
+и верни JSON: {"intent": ..., "entities": {...}}.
+
+Намерения (intent): "add_project", "add_task", "update_progress", "batch_update", "query_status", "complete_item", "set_deadline", "link_task_to_project", "bulk_project_action", "pause_reports", "resume_reports", "other".
+
+Сущности (entities):
+- "item_type": "project", "task" или null, если неясно ("статус", "мои дела" - null).
+- "item_name_hint": ключевые слова из названия; null для общих запросов ("статус задач", "мои проекты").
+- "project_name_hint_for_task": название проекта для задачи.
+- "deadline": дата YYYY-MM-DD, если указана явно; относительный срок ("завтра", "через неделю", "конец недели") - КАК ЕСТЬ.
+- "progress_description": текстовое описание прогресса.
+- "status_filter" (query_status): "overdue" для вопросов о просроченном, иначе null.
+  "задачи проекта X" - item_type "task", item_name_hint null, project_name_hint_for_task "X".
+- "bulk_action" (bulk_project_action - над всеми задачами проекта project_name_hint_for_task): "complete_tasks",
+  "shift_deadlines" (и "shift_days" - целое число дней, назад - отрицательное) или "archive_completed".
+- "operations" (batch_update - прогресс по нескольким элементам в одном сообщении; один элемент - update_progress):
+  список {"item_name_hint", "item_type", "action": "progress"/"complete", "progress_description",
+  "progress_type": "units"/"percent", "progress_value": число}; для "complete" поля прогресса не нужны.
+- "raw_text": исходный текст пользователя.
+"""
+
+NLU_DYNAMIC_TEMPLATE = """
+Примеры:
+{examples}
+
+ВАЖНО: Сегодняшняя дата: {current_date_YYYY_MM_DD}.
+Проанализируй следующий текст пользователя и верни JSON:
+Текст: "{user_input}"
+Результат:
+"""
+
+NLU_FEW_SHOT_K = 4
+
+# Банк примеров для few-shot. В промпт попадают только NLU_FEW_SHOT_K самых похожих на запрос.
+NLU_EXAMPLE_BANK: List[Tuple[str, dict]] = [
+    ("создай проект исследование рынка до конца года", {"intent": "add_project", "entities": {"item_name_hint": "исследование рынка", "deadline": "конец года", "item_type": "project"}}),
+    ("новый проект Омега дедлайн 20.12.2024", {"intent": "add_project", "entities": {"item_name_hint": "Омега", "deadline": "20.12.2024", "item_type": "project"}}),
+    ("добавь проект ремонт кухни", {"intent": "add_project", "entities": {"item_name_hint": "ремонт кухни", "deadline": None, "item_type": "project"}}),
+    ("задача Б5 проект тест бота 2, дедлайн 22", {"intent": "add_task", "entities": {"item_name_hint": "Б5", "project_name_hint_for_task": "тест бота 2", "deadline": "22", "item_type": "task"}}),
+    ("добавь задачу купить краску для проекта ремонт кухни до пятницы", {"intent": "add_task", "entities": {"item_name_hint": "купить краску", "project_name_hint_for_task": "ремонт кухни", "deadline": "до пятницы", "item_type": "task"}}),
+    ("новая задача позвонить юристу завтра", {"intent": "add_task", "entities": {"item_name_hint": "позвонить юристу", "project_name_hint_for_task": None, "deadline": "завтра", "item_type": "task"}}),
+    ("по задаче АН2 сделал первую часть из трех", {"intent": "update_progress", "entities": {"item_name_hint": "АН2", "progress_description": "сделал первую часть из трех", "item_type": "task"}}),
+    ("прогресс по задаче отчет +5", {"intent": "update_progress", "entities": {"item_name_hint": "отчет", "progress_description": "+5", "item_type": "task"}}),
+    ("по проекту Омега готово 40%", {"intent": "update_progress", "entities": {"item_name_hint": "Омега", "progress_description": "готово 40%", "item_type": "project"}}),
+    ("сделал половину исследования рынка", {"intent": "update_progress", "entities": {"item_name_hint": "исследование рынка", "progress_description": "сделал половину", "item_type": None}}),
+    ("АН2 +5, Б5 готово, проект Омега 40%", {"intent": "batch_update", "entities": {"operations": [
+        {"item_name_hint": "АН2", "action": "progress", "progress_description": "+5", "progress_type": "units", "progress_value": 5},
+        {"item_name_hint": "Б5", "action": "complete"},
+        {"item_name_hint": "Омега", "item_type": "project", "action": "progress", "progress_description": "40%", "progress_type": "percent", "progress_value": 40}]}}),
+    ("по отчету сделал половину, а задачу звонок юристу закончил", {"intent": "batch_update", "entities": {"operations": [
+        {"item_name_hint": "отчет", "item_type": "task", "action": "progress", "progress_description": "сделал половину", "progress_type": "percent", "progress_value": 50},
+        {"item_name_hint": "звонок юристу", "item_type": "task", "action": "complete"}]}}),
+    ("какой статус у проекта Омега?", {"intent": "query_status", "entities": {"item_name_hint": "Омега", "item_type": "project"}}),
+    ("статус задачи Бета", {"intent": "query_status", "entities": {"item_name_hint": "Бета", "item_type": "task"}}),
+    ("статус", {"intent": "query_status", "entities": {"item_name_hint": None, "item_type": None}}),
+    ("мои задачи", {"intent": "query_status", "entities": {"item_name_hint": None, "item_type": "task"}}),
+    ("что там по проектам", {"intent": "query_status", "entities": {"item_name_hint": None, "item_type": "project"}}),
+    ("что у меня просрочено", {"intent": "query_status", "entities": {"item_name_hint": None, "item_type": None, "status_filter": "overdue"}}),
+    ("покажи задачи проекта Омега", {"intent": "query_status", "entities": {"item_name_hint": None, "item_type": "task", "project_name_hint_for_task": "Омега"}}),
+    ("как дела с АН2?", {"intent": "query_status", "entities": {"item_name_hint": "АН2", "item_type": None}}),
+    ("я закончил с АН2", {"intent": "complete_item", "entities": {"item_name_hint": "АН2", "item_type": None}}),
+    ("задача купить краску готова", {"intent": "complete_item", "entities": {"item_name_hint": "купить краску", "item_type": "task"}}),
+    ("заверши проект ремонт кухни", {"intent": "complete_item", "entities": {"item_name_hint": "ремонт кухни", "item_type": "project"}}),
+    ("перенеси дедлайн проекта Омега на 1 марта", {"intent": "set_deadline", "entities": {"item_name_hint": "Омега", "deadline": "1 марта", "item_type": "project"}}),
+    ("дедлайн задачи отчет - послезавтра", {"intent": "set_deadline", "entities": {"item_name_hint": "отчет", "deadline": "послезавтра", "item_type": "task"}}),
+    ("привяжи задачу 'написать документацию' к проекту 'Релиз 2.0'", {"intent": "link_task_to_project", "entities": {"item_name_hint": "написать документацию", "project_name_hint_for_task": "Релиз 2.0", "item_type": "task"}}),
+    ("задача отчет относится к проекту Омега", {"intent": "link_task_to_project", "entities": {"item_name_hint": "отчет", "project_name_hint_for_task": "Омега", "item_type": "task"}}),
+    ("заверши все задачи проекта ремонт кухни", {"intent": "bulk_project_action", "entities": {"project_name_hint_for_task": "ремонт кухни", "bulk_action": "complete_tasks"}}),
+    ("перенеси все сроки проекта Омега на 3 дня вперед", {"intent": "bulk_project_action", "entities": {"project_name_hint_for_task": "Омега", "bulk_action": "shift_deadlines", "shift_days": 3}}),
+    ("убери в архив выполненные задачи Омеги", {"intent": "bulk_project_action", "entities": {"project_name_hint_for_task": "Омега", "bulk_action": "archive_completed"}}),
+    ("не присылай отчеты", {"intent": "pause_reports", "entities": {}}),
+    ("поставь отчеты на паузу до понедельника", {"intent": "pause_reports", "entities": {"deadline": "до понедельника"}}),
+    ("снова присылай ежедневные отчеты", {"intent": "resume_reports", "entities": {}}),
+    ("включи отчеты", {"intent": "resume_reports", "entities": {}}),
+    ("привет, как дела?", {"intent": "other", "entities": {}}),
+    ("напомни мне сделать отчет", {"intent": "other", "entities": {}}),
+]
+
+_TRIGRAM_CLEAN_RE = re.compile(r"[^\w\s]+")
+
+
+def _trigrams(text: str) -> frozenset:
+    normalized = " " + " ".join(_TRIGRAM_CLEAN_RE.sub(" ", text.lower()).split()) + " "
+    return frozenset(normalized[i:i + 3] for i in range(len(normalized) - 2))
+
+
+_EXAMPLE_BANK_INDEX = [(_trigrams(text), text, result) for text, result in NLU_EXAMPLE_BANK]
+
+
+def select_nlu_examples(user_text: str, k: int = NLU_FEW_SHOT_K) -> List[Tuple[str, dict]]:
+    """Выбирает k примеров из банка, ближайших к тексту по Жаккару символьных триграмм."""
+    query = _trigrams(user_text)
+    scored = []
+    for position, (grams, text, result) in enumerate(_EXAMPLE_BANK_INDEX):
+        union = len(query | grams)
+        score = len(query & grams) / union if union else 0.0
+        scored.append((-score, position, text, result))
+    scored.sort()
+    return [(text, result) for _, _, text, result in scored[:k]]
+
+
+def build_nlu_prompt(user_text: str, k: int = NLU_FEW_SHOT_K) -> str:
+    examples_text = "\n".join(
+        f'{i}. Текст: "{text}"\n   Результат: {json.dumps({"intent": result["intent"], "entities": {**result["entities"], "raw_text": text}}, ensure_ascii=False)}'
+        for i, (text, result) in enumerate(select_nlu_examples(user_text, k), start=1)
+    )
+    return NLU_STATIC_PREFIX + NLU_DYNAMIC_TEMPLATE.format(
+        examples=examples_text,
+        current_date_YYYY_MM_DD=date.today().strftime('%Y-%m-%d'),
+        user_input=user_text
+    )
+
+
+def build_legacy_nlu_prompt(user_text: str) -> str:
+    return NLU_PROMPT_TEMPLATE.format(current_date_YYYY_MM_DD=date.today().strftime('%Y-%m-%d'), user_input=user_text)
+
+
+# Учет токенов по видам запросов: {"nlu": {"calls": .., "input_tokens": .., "output_tokens": ..}, ...}
+LLM_USAGE: Dict[str, Dict[str, int]] = {}
+
+
+def _record_usage(kind: str, response) -> Tuple[int, int]:
+    usage = getattr(response, "usage_metadata", None)
+    input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    counters = LLM_USAGE.setdefault(kind, {"calls": 0, "input_tokens": 0, "output_tokens": 0})
+    counters["calls"] += 1; counters["input_tokens"] += input_tokens; counters["output_tokens"] += output_tokens
+    log_event(logger, logging.DEBUG, "llm.usage", kind=kind, input_tokens=input_tokens, output_tokens=output_tokens)
+    return input_tokens, output_tokens
+
+
 PROGRESS_INTERPRETATION_PROMPT_TEMPLATE = """
 Оцени прогресс в процентах от общей задачи (0-100) или в абсолютных единицах, на основе следующего описания.
 Верни результат в формате JSON:
@@ -116,29 +284,31 @@ async def interpret_user_input(user_text: str) -> Union[dict, None]: # <--- ИЗ
     if not GEMINI_API_KEY:
         logger.warning("Gemini API не настроен. Пропуск NLU.")
         return {"intent": "other", "entities": {"raw_text": user_text}}
-    # Проверка доступности модели (лучше делать это один раз при старте, но для простоты пока так)
     try:
-        genai.get_model(model.model_name)
+        get_model()
     except Exception as e:
-        logger.error(f"Модель Gemini '{model.model_name}' недоступна или API не настроен: {e}")
+        logger.error(f"Модель Gemini '{GEMINI_MODEL_NAME}' недоступна или API не настроен: {e}")
         return {"intent": "other", "entities": {"raw_text": user_text}}
 
-    current_date_str = date.today().strftime('%Y-%m-%d') # Получаем текущую дату
+    parsed_response, _ = await run_nlu_prompt(build_nlu_prompt(user_text), user_text)
+    return parsed_response
 
-    prompt = NLU_PROMPT_TEMPLATE.format( 
-         current_date_YYYY_MM_DD=current_date_str,
-         user_input=user_text
-    )
+async def run_nlu_prompt(prompt: str, user_text: str) -> Tuple[Union[dict, None], Tuple[int, int]]:
+    """
+    Отправляет готовый NLU-промпт и разбирает ответ. Возвращает (результат, (входные токены, выходные токены)).
+    """
+    usage = (0, 0)
     try:
         logger.info(f"Отправка запроса в Gemini NLU: {user_text[:100]}...")
-        response = await model.generate_content_async(prompt)
+        response = await get_model().generate_content_async(prompt)
+        usage = _record_usage("nlu", response)
         
         if not response.parts or not response.text: # Добавил проверку response.text
             logger.error("Gemini NLU: Пустой ответ от API (нет 'parts' или 'text').")
-            logger.debug(f"Полный ответ Gemini NLU: {response}")
-            return None
+            log_event(logger, logging.DEBUG, "nlu.empty_response", response=response)
+            return None, usage
             
-        logger.debug(f"Ответ от Gemini NLU (сырой): {response.text}")
+        log_event(logger, logging.DEBUG, "nlu.raw_response", text=response.text)
         
         cleaned_response_text = response.text.strip()
         if cleaned_response_text.startswith("```json"):
@@ -154,15 +324,15 @@ async def interpret_user_input(user_text: str) -> Union[dict, None]: # <--- ИЗ
            "raw_text" not in parsed_response["entities"]:
             parsed_response["entities"]["raw_text"] = user_text
 
-        logger.info(f"Ответ от Gemini NLU (распарсенный): {parsed_response}")
-        return parsed_response
+        log_event(logger, logging.INFO, "nlu.parsed", result=parsed_response)
+        return parsed_response, usage
     except json.JSONDecodeError as e:
         logger.error(f"Ошибка декодирования JSON от Gemini NLU: {e}. Ответ: {response.text if 'response' in locals() and hasattr(response, 'text') else 'Ответ не получен'}")
-        return None
+        return None, usage
     except Exception as e:
         logger.error(f"Ошибка при вызове Gemini API (NLU): {e}")
-        logger.debug(f"Полный ответ Gemini NLU (при ошибке): {response if 'response' in locals() else 'Ответ не получен'}")
-        return None
+        log_event(logger, logging.DEBUG, "nlu.error_response", response=response if 'response' in locals() else None)
+        return None, usage
 
 async def interpret_progress_description(description: str, total_units_context: int = 100) -> Union[dict, None]: # <--- ИЗМЕНЕНИЕ ЗДЕСЬ
     """
@@ -172,9 +342,9 @@ async def interpret_progress_description(description: str, total_units_context:
         logger.warning("Gemini API не настроен. Пропуск интерпретации прогресса.")
         return {"type": "unknown", "value": None}
     try:
-        genai.get_model(model.model_name)
+        get_model()
     except Exception as e:
-        logger.error(f"Модель Gemini '{model.model_name}' недоступна или API не настроен: {e}")
+        logger.error(f"Модель Gemini '{GEMINI_MODEL_NAME}' недоступна или API не настроен: {e}")
         return {"type": "unknown", "value": None}
 
     prompt = PROGRESS_INTERPRETATION_PROMPT_TEMPLATE.format(
@@ -183,14 +353,15 @@ async def interpret_progress_description(description: str, total_units_context:
     )
     try:
         logger.info(f"Отправка запроса в Gemini Progress: {description[:100]}...")
-        response = await model.generate_content_async(prompt)
+        response = await get_model().generate_content_async(prompt)
+        _record_usage("progress", response)
 
         if not response.parts or not response.text: # Добавил проверку response.text
             logger.error("Gemini Progress: Пустой ответ от API.")
-            logger.debug(f"Полный ответ Gemini Progress: {response}")
+            log_event(logger, logging.DEBUG, "progress.empty_response", response=response)
             return None
 
-        logger.debug(f"Ответ от Gemini Progress (сырой): {response.text}")
+        log_event(logger, logging.DEBUG, "progress.raw_response", text=response.text)
         
         cleaned_response_text = response.text.strip()
         if cleaned_response_text.startswith("```json"):
@@ -202,14 +373,14 @@ async def interpret_progress_description(description: str, total_units_context:
         cleaned_response_text = cleaned_response_text.replace(",\n}", "\n}").replace(",\n]", "\n]")
 
         parsed_response = json.loads(cleaned_response_text)
-        logger.info(f"Ответ от Gemini Progress (распарсенный): {parsed_response}")
+        log_event(logger, logging.INFO, "progress.parsed", result=parsed_response)
         return parsed_response
     except json.JSONDecodeError as e:
         logger.error(f"Ошибка декодирования JSON от Gemini Progress: {e}. Ответ: {response.text if 'response' in locals() and hasattr(response, 'text') else 'Ответ не получен'}")
         return None
     except Exception as e:
         logger.error(f"Ошибка при вызове Gemini API (Progress): {e}")
-        logger.debug(f"Полный ответ Gemini Progress (при ошибке): {response if 'response' in locals() else 'Ответ не получен'}")
+        log_event(logger, logging.DEBUG, "progress.error_response", response=response if 'response' in locals() else None)
         return None
 
 async def test_llm():
@@ -0,0 +1,139 @@
+# log_handler.py
+import atexit
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from typing import Dict, Union
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Доля событий каждого типа, которая реально попадает в лог (1.0 - все, 0.0 - ни одного).
+# Типы, которых нет в словаре, пишутся с DEFAULT_SAMPLING_RATE.
+EVENT_SAMPLING_RATES: Dict[str, float] = {
+    "status.scan_project": 0.01,
+    "status.scan_task": 0.01,
+    "pace.result": 0.1,
+    "nlu.raw_response": 0.2,
+    "progress.raw_response": 0.2,
+}
+DEFAULT_SAMPLING_RATE = 1.0
+
+_listener: Union[logging.handlers.QueueListener, None] = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # Стандартный QueueHandler форматирует запись целиком в вызывающем потоке. Мы в вызывающем
+    # потоке только снимаем значения: аргументы %-записи подставляются сразу (getMessage), поля
+    # структурированного события копируются вглубь. Иначе поток-писатель читал бы общий словарь
+    # данных и user_data, пока цикл событий их меняет. Время, формат и трассировку собирает писатель.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.msg, LogEvent):
+            record.msg = record.msg.frozen()
+            record.fields = record.msg.fields
+        elif record.args:
+            record.msg = record.getMessage(); record.args = None
+        return record
+
+
+class _Repr(str):
+    # Текст значения, снятый при постановке в очередь; в событии выводится без лишних кавычек
+    def __new__(cls, value) -> "_Repr":
+        return super().__new__(cls, repr(value))
+
+    def __repr__(self) -> str:
+        return str(self)
+
+
+class LogEvent:
+    """Структурированное событие лога. Текст собирается только при форматировании записи."""
+    __slots__ = ("name", "fields")
+
+    def __init__(self, name: str, fields: dict):
+        self.name = name
+        self.fields = fields
+
+    def frozen(self) -> "LogEvent":
+        """Копия со снятыми на этот момент значениями полей: глубокая копия, а что не копируется - repr."""
+        fields = {}
+        for key, value in self.fields.items():
+            try: fields[key] = copy.deepcopy(value)
+            except Exception: fields[key] = _Repr(value)
+        return LogEvent(self.name, fields)
+
+    def __str__(self) -> str:
+        if not self.fields:
+            return self.name
+        return self.name + " " + " ".join(f"{k}={v!r}" for k, v in self.fields.items())
+
+
+def setup_logging(level: Union[str, int, None] = None) -> None:
+    """
+    Переводит корневой логгер на запись через очередь: хендлеры бота только кладут
+    записи в очередь, а вывод в поток выполняет отдельный поток QueueListener.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    if level is None:
+        level = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    logging.basicConfig(level=level, handlers=[_DeferredQueueHandler(log_queue)], force=True)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Дописывает оставшиеся в очереди записи и останавливает поток-писатель."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_event(logger: logging.Logger, level: int, event: str, **fields) -> None:
+    """
+    Пишет структурированное событие `event` с полями `fields`, если уровень включен
+    и событие прошло сэмплирование. Пока уровень выключен, стоимость - одна проверка.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    rate = EVENT_SAMPLING_RATES.get(event, DEFAULT_SAMPLING_RATE)
+    if rate < 1.0 and (rate <= 0.0 or random.random() >= rate):
+        return
+    logger.log(level, LogEvent(event, fields), extra={"event": event, "fields": fields}, stacklevel=2)
+
+
+def set_log_level(level_name: str, logger_name: Union[str, None] = None) -> bool:
+    """Меняет уровень логгера (по умолчанию корневого) на лету. Возвращает False для неизвестного уровня."""
+    level = logging.getLevelName(level_name.upper())
+    if not isinstance(level, int):
+        return False
+    logging.getLogger(logger_name).setLevel(level)
+    return True
+
+
+def set_sampling_rate(event: str, rate: float) -> None:
+    EVENT_SAMPLING_RATES[event] = float(min(max(rate, 0.0), 1.0))
+
+
+def describe_logging() -> str:
+    """Краткое текстовое описание текущих уровней и сэмплирования (для админ-команды)."""
+    root = logging.getLogger()
+    lines = [f"Корневой уровень: {logging.getLevelName(root.level)}"]
+    for name in sorted(logging.root.manager.loggerDict):
+        lg = logging.root.manager.loggerDict[name]
+        if isinstance(lg, logging.Logger) and lg.level != logging.NOTSET:
+            lines.append(f"  {name}: {logging.getLevelName(lg.level)}")
+    lines.append(f"Сэмплирование (по умолчанию {DEFAULT_SAMPLING_RATE}):")
+    for event, rate in sorted(EVENT_SAMPLING_RATES.items()):
+        lines.append(f"  {event}: {rate}")
+    return "\n".join(lines)
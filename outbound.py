@@ -0,0 +1,239 @@
+# outbound.py
+# Управление потоком исходящих запросов к Bot API. Подключается к Application как rate limiter,
+# поэтому через него проходят все reply_text / send_message / edit_message_text без правок в хендлерах.
+#  - токен-бакеты: общий (лимит Telegram ~30 сообщений/с) и по каждому чату (~1 сообщение/с);
+#  - две полосы приоритета: интерактивные ответы всегда обслуживаются раньше массовых рассылок
+#    (массовые отправки передают rate_limit_args={"priority": BULK});
+#  - повторные правки одного и того же сообщения, еще ждущие очереди, схлопываются в последнюю;
+#  - на 429 (RetryAfter) отправка приостанавливается на указанное время и запрос повторяется.
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Coroutine, Deque, Dict, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+GLOBAL_RATE = 25.0          # сообщений в секунду на всего бота (с запасом от 30)
+GLOBAL_BURST = 25
+PER_CHAT_RATE = 1.0         # сообщений в секунду в один личный чат
+PER_CHAT_BURST = 3          # короткая пачка ответов в чат пропускается без задержки
+GROUP_CHAT_RATE = 20 / 60   # групповые чаты: 20 сообщений в минуту
+MAX_RETRIES = 3
+MAX_CHAT_BUCKETS = 10000    # при превышении сбрасываются бакеты, которые уже полностью восстановились
+
+# Конфигурация пула HTTP-соединений для Bot API (используется в bot5.build_application)
+HTTP_CONNECTION_POOL_SIZE = 64
+HTTP_POOL_TIMEOUT = 5.0
+HTTP_CONNECT_TIMEOUT = 5.0
+HTTP_READ_TIMEOUT = 15.0
+HTTP_WRITE_TIMEOUT = 15.0
+
+# Методы, которые отправляют или меняют сообщения и подпадают под лимиты
+LIMITED_ENDPOINTS = {
+    "sendMessage", "sendDocument", "sendPhoto", "sendMediaGroup", "copyMessage", "forwardMessage",
+    "editMessageText", "editMessageReplyMarkup", "editMessageCaption",
+}
+COALESCED_ENDPOINTS = {"editMessageText", "editMessageReplyMarkup", "editMessageCaption"}
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate; self.capacity = capacity
+        self.tokens = float(capacity); self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Сколько ждать до появления целого токена (0 - можно брать сейчас)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _PendingEdit:
+    __slots__ = ("future", "superseded_by")
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.superseded_by: Optional["_PendingEdit"] = None
+
+
+class OutboundRateLimiter(BaseRateLimiter[Dict[str, Any]]):
+    def __init__(self, global_rate: float = GLOBAL_RATE, per_chat_rate: float = PER_CHAT_RATE, max_retries: int = MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate, GLOBAL_BURST)
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self.chat_buckets: Dict[Union[int, str], TokenBucket] = {}
+        self.lanes: Dict[int, Deque[Tuple[asyncio.Future, float]]] = {INTERACTIVE: deque(), BULK: deque()}
+        self.pending_edits: Dict[Tuple[str, Any, Any], _PendingEdit] = {}
+        self.paused_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.stats: Dict[str, Any] = {
+            "requests": 0, "sent": 0, "coalesced": 0, "retry_after": 0, "failed": 0,
+            "wait_total": {INTERACTIVE: 0.0, BULK: 0.0}, "granted": {INTERACTIVE: 0, BULK: 0},
+        }
+
+    # --- Жизненный цикл (вызывается Application) ---
+    async def initialize(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try: await self._dispatcher
+            except asyncio.CancelledError: pass
+            self._dispatcher = None
+
+    # --- Выдача общих токенов по полосам приоритета ---
+    async def _dispatch(self) -> None:
+        while True:
+            if not self.lanes[INTERACTIVE] and not self.lanes[BULK]:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            wait = max(self.paused_until - now, self.global_bucket.delay(now))
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            lane = self.lanes[INTERACTIVE] if self.lanes[INTERACTIVE] else self.lanes[BULK]
+            future, _ = lane.popleft()
+            if future.done(): # Запрос отменили, пока он ждал
+                continue
+            self.global_bucket.consume()
+            future.set_result(None)
+
+    async def _acquire_global(self, priority: int) -> None:
+        if self._dispatcher is None: # Не инициализирован (например, бот используется вне Application)
+            return
+        future = asyncio.get_running_loop().create_future()
+        enqueued = time.monotonic()
+        self.lanes[priority].append((future, enqueued))
+        self._wakeup.set()
+        await future
+        self.stats["wait_total"][priority] += time.monotonic() - enqueued
+        self.stats["granted"][priority] += 1
+
+    async def _acquire_chat(self, chat_id: Union[int, str]) -> None:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+                now = time.monotonic()
+                self.chat_buckets = {cid: b for cid, b in self.chat_buckets.items() if not b.is_full(now)}
+            is_group = isinstance(chat_id, int) and chat_id < 0
+            bucket = TokenBucket(GROUP_CHAT_RATE if is_group else self.per_chat_rate, 1 if is_group else PER_CHAT_BURST)
+            self.chat_buckets[chat_id] = bucket
+        while True:
+            delay = bucket.delay(time.monotonic())
+            if delay <= 0:
+                bucket.consume()
+                return
+            await asyncio.sleep(delay)
+
+    # --- Обработка запроса ---
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], list]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Union[bool, Dict[str, Any], list]:
+        if endpoint not in LIMITED_ENDPOINTS:
+            return await callback(*args, **kwargs)
+        self.stats["requests"] += 1
+        priority = (rate_limit_args or {}).get("priority", INTERACTIVE)
+        chat_id = data.get("chat_id")
+
+        edit_key = None; pending = None
+        if endpoint in COALESCED_ENDPOINTS and chat_id is not None and data.get("message_id") is not None:
+            edit_key = (endpoint, chat_id, data["message_id"])
+            pending = _PendingEdit(asyncio.get_running_loop().create_future())
+            previous = self.pending_edits.get(edit_key)
+            if previous is not None:
+                previous.superseded_by = pending
+            self.pending_edits[edit_key] = pending
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                if chat_id is not None:
+                    await self._acquire_chat(chat_id)
+                if pending is not None and pending.superseded_by is not None:
+                    # Пока ждали, пришла более свежая правка того же сообщения: отправится только она
+                    self.stats["coalesced"] += 1
+                    return await asyncio.shield(_final_result(pending))
+                await self._acquire_global(priority)
+                if pending is not None and pending.superseded_by is not None:
+                    self.global_bucket.tokens += 1 # Токен не понадобился - возвращаем
+                    self.stats["coalesced"] += 1
+                    return await asyncio.shield(_final_result(pending))
+                try:
+                    result = await callback(*args, **kwargs)
+                except RetryAfter as e:
+                    retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                    self.stats["retry_after"] += 1
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                    logger.warning(f"Telegram 429 на {endpoint} (чат {chat_id}): пауза {retry_after:.1f} с, попытка {attempt + 1}.")
+                    if attempt >= self.max_retries:
+                        raise
+                    continue
+                self.stats["sent"] += 1
+                if pending is not None and not pending.future.done():
+                    pending.future.set_result(result)
+                return result
+        except BaseException as e:
+            self.stats["failed"] += 1
+            if pending is not None and not pending.future.done():
+                pending.future.set_exception(e)
+                pending.future.exception() # Помечаем исключение как полученное, если его никто не ждет
+            raise
+        finally:
+            if edit_key is not None and self.pending_edits.get(edit_key) is pending:
+                del self.pending_edits[edit_key]
+        raise RuntimeError("unreachable")
+
+    def metrics(self) -> Dict[str, Any]:
+        metrics: Dict[str, Any] = {k: v for k, v in self.stats.items() if k not in ("wait_total", "granted")}
+        for priority, name in LANE_NAMES.items():
+            granted = self.stats["granted"][priority]
+            metrics[f"{name}_queued"] = len(self.lanes[priority])
+            metrics[f"{name}_granted"] = granted
+            metrics[f"{name}_avg_wait_ms"] = round(self.stats["wait_total"][priority] * 1000 / granted, 1) if granted else 0.0
+        metrics["chat_buckets"] = len(self.chat_buckets)
+        metrics["paused_for_s"] = round(max(0.0, self.paused_until - time.monotonic()), 1)
+        return metrics
+
+
+async def _final_result(pending: _PendingEdit):
+    # Идем по цепочке заменивших правок до последней и ждем ее результат
+    while pending.superseded_by is not None:
+        pending = pending.superseded_by
+    return await pending.future
+
+
+rate_limiter = OutboundRateLimiter()
+
+
+def describe_metrics() -> str:
+    return "\n".join(f"{key}: {value}" for key, value in rate_limiter.metrics().items())
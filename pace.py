@@ -0,0 +1,247 @@
+# pace.py
+# Расчет темпа и прогноза по элементам (проектам и задачам).
+# compute_pace() - для одного элемента (ответ на "статус X"),
+# compute_pace_batch() - для многих сразу (отчеты, статистика); с NumPy считается векторно.
+# Фактический темп в обоих путях один: по недавней истории (recent_pace), если она есть у элемента,
+# иначе средний с даты создания. Проекты с прогрессом из сводки задач (with_rollup) историю не используют.
+import logging
+import math
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    print("WARNING (pace.py): numpy не найден. Пакетный расчет темпа будет идти поэлементно.")
+    NUMPY_AVAILABLE = False
+
+# Классы прогноза
+PACE_NOT_APPLICABLE = 0    # не активен или нет дедлайна / цели в ед. / даты создания
+PACE_DONE = 1              # текущий прогресс уже достиг цели
+PACE_BAD_PLAN = 2          # дедлайн раньше даты создания
+PACE_OVERDUE = 3           # срок вышел, цель не достигнута
+PACE_STARTED_TODAY = 4     # прогресс есть, но создан сегодня
+PACE_PRE_START = 5         # прогресс есть, но дата создания в будущем
+PACE_ON_TRACK = 6
+PACE_BEHIND = 7
+PACE_NOT_STARTED = 8       # прогресса нет: прогноз не строится, только детали темпа
+PACE_INVALID = 9           # не удалось разобрать даты
+
+FORECAST_TEXTS = {
+    PACE_OVERDUE: "Срок вышел, не успели. 😥",
+    PACE_STARTED_TODAY: "Отличный старт! 👍",
+    PACE_PRE_START: "Необычно, но прогресс есть!",
+    PACE_ON_TRACK: "Успеваете! 👍",
+    PACE_BEHIND: "Нужно ускориться! 🏃💨",
+}
+
+PACE_CLASS_NAMES = {
+    PACE_NOT_APPLICABLE: "не рассчитывается", PACE_DONE: "завершено", PACE_BAD_PLAN: "ошибка плана",
+    PACE_OVERDUE: "просрочено", PACE_STARTED_TODAY: "старт сегодня", PACE_PRE_START: "прогресс до старта",
+    PACE_ON_TRACK: "успевает", PACE_BEHIND: "отстает", PACE_NOT_STARTED: "не начато", PACE_INVALID: "ошибка дат",
+}
+
+_NO_DATE = -1
+_ROLLUP_KEY = "units_from_rollup"  # Отметка with_rollup: ед. проекта посчитаны по задачам
+
+
+@lru_cache(maxsize=65536)
+def deadline_ordinal(deadline_str: str) -> int:
+    """'YYYY-MM-DD' -> порядковый номер дня. ValueError при неверном формате."""
+    return datetime.strptime(deadline_str, '%Y-%m-%d').date().toordinal()
+
+
+@lru_cache(maxsize=65536)
+def created_ordinal(created_at_iso: str) -> int:
+    return datetime.fromisoformat(created_at_iso.replace("Z", "+00:00")).date().toordinal()
+
+
+def _classify(created: int, deadline: int, current: float, total: float, today: int,
+              recent: Union[Tuple[float, int], None] = None) -> Dict[str, Any]:
+    planned_days = deadline - created
+    days_passed = today - created
+    days_left = deadline - today
+    result = {"days_left": days_left, "required": None, "actual": None}
+    if planned_days < 0:
+        result["class"] = PACE_BAD_PLAN if current < total else PACE_DONE
+        return result
+    if current >= total:
+        result["class"] = PACE_DONE
+        return result
+
+    if days_left > 0:
+        result["required"] = (total - current) / days_left
+    if current > 0:
+        if recent is not None:
+            result["actual"] = recent[0]  # Темп за последние дни из истории прогресса
+        elif days_passed > 0:
+            result["actual"] = current / days_passed
+    if days_left <= 0:
+        result["class"] = PACE_OVERDUE
+    elif current > 0 and days_passed == 0:
+        result["class"] = PACE_STARTED_TODAY
+    elif current > 0 and days_passed < 0:
+        result["class"] = PACE_PRE_START
+    elif current > 0:
+        result["class"] = PACE_ON_TRACK if result["actual"] >= result["required"] else PACE_BEHIND
+    else:
+        result["class"] = PACE_NOT_STARTED
+    return result
+
+
+def _pace_texts(result: Dict[str, Any], current: float, days_passed: int, recent: Union[Tuple[float, int], None] = None) -> Dict[str, str]:
+    required = result["required"]; actual = result["actual"]
+    required_text = f"{required:.2f} ед./день" if required is not None else "срок вышел"
+    if current > 0:
+        if actual is not None: actual_text = f"{actual:.2f} ед./день" + (f" (за {recent[1]} дн.)" if recent is not None else "")
+        elif days_passed == 0: actual_text = "сделано сегодня"
+        else: actual_text = "прогресс до старта (?)"
+    elif current == 0 and days_passed >= 0: actual_text = "еще не начато"
+    else: actual_text = "ожидание начала"
+    return {"required": required_text, "actual": actual_text}
+
+
+def compute_pace(item: Dict[str, Any], today: Union[date, None] = None, recent_pace: Union[Callable, None] = None) -> Dict[str, Any]:
+    """
+    Темп и прогноз для одного элемента. Возвращает словарь:
+    class (PACE_*), days_left, required / actual (ед. в день или None),
+    forecast (текст прогноза или None) и details ({'required': .., 'actual': ..} для кнопки или None).
+    recent_pace(item_id, created_ordinal, today=...) -> (ед. в день, окно) или None - фактический темп
+    по недавней истории (progress_history.recent_pace); без него - средний с даты создания.
+    """
+    today_ord = (today or date.today()).toordinal()
+    status = item.get("status"); dl_str = item.get("deadline"); created_iso = item.get("created_at")
+    total = item.get("total_units", 0); current = item.get("current_units", 0)
+    empty = {"class": PACE_NOT_APPLICABLE, "days_left": None, "required": None, "actual": None, "forecast": None, "details": None}
+    if status != "active" or not dl_str or not created_iso or total <= 0:
+        return empty
+    try:
+        created = created_ordinal(created_iso); deadline = deadline_ordinal(dl_str)
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.error(f"Ошибка разбора дат для темпа ({item.get('id')}): {e}")
+        return {**empty, "class": PACE_INVALID}
+
+    recent = _recent_for(item, created, today, recent_pace)
+    result = _classify(created, deadline, current, total, today_ord, recent)
+    pace_class = result["class"]
+    result["forecast"] = FORECAST_TEXTS.get(pace_class)
+    result["details"] = None
+    if pace_class not in (PACE_DONE, PACE_BAD_PLAN):
+        result["details"] = _pace_texts(result, current, today_ord - created, recent)
+    return result
+
+
+def _recent_for(item: Dict[str, Any], created: int, today: Union[date, None], recent_pace: Union[Callable, None]) -> Union[Tuple[float, int], None]:
+    if recent_pace is None or not item.get("id") or item.get(_ROLLUP_KEY):
+        return None
+    return recent_pace(item["id"], created, today=today)
+
+
+def with_rollup(project: Dict[str, Any], rollup: Any) -> Dict[str, Any]:
+    """
+    Проект для расчета темпа с учетом сводки задач (rollups.ProjectRollup): если у проекта
+    нет своей цели в единицах, прогрессом считаются завершенные задачи из общего числа.
+    """
+    if rollup is None or project.get("total_units", 0) > 0 or rollup.task_count <= 0:
+        return project
+    return {**project, "current_units": rollup.completed_count, "total_units": rollup.task_count, _ROLLUP_KEY: True}
+
+
+def build_columns(items: Iterable[Dict[str, Any]], today: Union[date, None] = None, recent_pace: Union[Callable, None] = None) -> Dict[str, Any]:
+    """
+    Колоночное представление элементов для пакетного расчета: порядковые дни создания
+    и дедлайна, текущие и целевые единицы и маска элементов, для которых темп считается.
+    Неразбираемые даты помечаются в invalid. С recent_pace (как у compute_pace) в колонке recent -
+    темп по недавней истории (NaN, если ее нет).
+    """
+    ids: List[Any] = []; created: List[int] = []; deadline: List[int] = []; recent: List[float] = []
+    current: List[float] = []; total: List[float] = []; applicable: List[bool] = []; invalid: List[bool] = []
+    for item in items:
+        ids.append(item.get("id"))
+        dl_str = item.get("deadline"); created_iso = item.get("created_at"); total_u = item.get("total_units", 0)
+        ok = item.get("status") == "active" and bool(dl_str) and bool(created_iso) and total_u > 0
+        c_ord = d_ord = _NO_DATE; bad = False
+        if ok:
+            try:
+                c_ord = created_ordinal(created_iso); d_ord = deadline_ordinal(dl_str)
+            except (ValueError, TypeError, AttributeError):
+                ok = False; bad = True
+        item_recent = _recent_for(item, c_ord, today, recent_pace) if ok else None
+        created.append(c_ord); deadline.append(d_ord)
+        current.append(item.get("current_units", 0)); total.append(total_u)
+        applicable.append(ok); invalid.append(bad); recent.append(item_recent[0] if item_recent is not None else math.nan)
+    columns = {"ids": ids, "created": created, "deadline": deadline, "current": current,
+               "total": total, "applicable": applicable, "invalid": invalid, "recent": recent}
+    if NUMPY_AVAILABLE:
+        columns.update(
+            recent=np.asarray(recent, dtype=np.float64),
+            created=np.asarray(created, dtype=np.int32), deadline=np.asarray(deadline, dtype=np.int32),
+            current=np.asarray(current, dtype=np.float64), total=np.asarray(total, dtype=np.float64),
+            applicable=np.asarray(applicable, dtype=bool), invalid=np.asarray(invalid, dtype=bool),
+        )
+    return columns
+
+
+def compute_pace_batch(columns: Dict[str, Any], today: Union[date, None] = None) -> Dict[str, Any]:
+    """
+    Темп для всех элементов из build_columns() за один проход. Возвращает колонки
+    days_left, required, actual (NaN там, где не определено) и class (PACE_*).
+    Без NumPy - списки той же длины, посчитанные поэлементно.
+    """
+    today_ord = (today or date.today()).toordinal()
+    if not NUMPY_AVAILABLE:
+        return _compute_pace_batch_loop(columns, today_ord)
+
+    created = columns["created"]; deadline = columns["deadline"]; current = columns["current"]; total = columns["total"]
+    applicable = columns["applicable"]
+    planned_days = deadline - created
+    days_passed = today_ord - created
+    days_left = deadline - today_ord
+    remaining = total - current
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        required = np.where(days_left > 0, remaining / days_left, np.nan)
+        actual = np.where((current > 0) & (days_passed > 0), current / days_passed, np.nan)
+        actual = np.where((current > 0) & ~np.isnan(columns["recent"]), columns["recent"], actual)
+
+    done = current >= total
+    pace_class = np.select(
+        [~applicable, planned_days < 0, done, days_left <= 0,
+         (current > 0) & (days_passed == 0), (current > 0) & (days_passed < 0),
+         (current > 0) & (actual >= required), current > 0],
+        [PACE_NOT_APPLICABLE, PACE_BAD_PLAN, PACE_DONE, PACE_OVERDUE,
+         PACE_STARTED_TODAY, PACE_PRE_START, PACE_ON_TRACK, PACE_BEHIND],
+        default=PACE_NOT_STARTED,
+    ).astype(np.int8)
+    # Дедлайн раньше создания, но цель уже достигнута - как в одиночном расчете, это "завершено"
+    pace_class[applicable & (planned_days < 0) & done] = PACE_DONE
+    pace_class[columns["invalid"]] = PACE_INVALID
+
+    defined = applicable & ~done & (planned_days >= 0)
+    return {
+        "days_left": np.where(applicable, days_left, 0),
+        "required": np.where(defined, required, np.nan),
+        "actual": np.where(defined, actual, np.nan),
+        "class": pace_class,
+    }
+
+
+def _compute_pace_batch_loop(columns: Dict[str, Any], today_ord: int) -> Dict[str, Any]:
+    days_left_col: List[int] = []; required_col: List[float] = []; actual_col: List[float] = []; class_col: List[int] = []
+    for i in range(len(columns["ids"])):
+        if not columns["applicable"][i]:
+            days_left_col.append(0); required_col.append(math.nan); actual_col.append(math.nan)
+            class_col.append(PACE_INVALID if columns["invalid"][i] else PACE_NOT_APPLICABLE)
+            continue
+        recent = columns["recent"][i]
+        result = _classify(columns["created"][i], columns["deadline"][i], columns["current"][i], columns["total"][i], today_ord,
+                           None if math.isnan(recent) else (recent, 0))
+        days_left_col.append(result["days_left"])
+        required_col.append(result["required"] if result["required"] is not None else math.nan)
+        actual_col.append(result["actual"] if result["actual"] is not None else math.nan)
+        class_col.append(result["class"])
+    return {"days_left": days_left_col, "required": required_col, "actual": actual_col, "class": class_col}
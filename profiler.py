@@ -0,0 +1,248 @@
+# profiler.py
+import asyncio
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from telegram.ext import Application, BaseHandler, ConversationHandler
+
+logger = logging.getLogger(__name__)
+
+PROFILES_DIR = 'profiles'
+MAX_SESSION_SECONDS = 600   # Если задано только N апдейтов, сессия все равно не длится дольше этого
+SUMMARY_TOP_FUNCTIONS = 15
+TELEGRAM_TEXT_LIMIT = 4000
+
+# Пока сессии нет, _session равна None, а колбэки хендлеров не обернуты: накладных расходов нет.
+_session: Union["ProfilingSession", None] = None
+# Метка текущего вызова хендлера, чтобы handle_text_message мог сообщить распознанный intent
+_current_call: contextvars.ContextVar = contextvars.ContextVar("profiler_current_call", default=None)
+
+
+class _Counter:
+    __slots__ = ("calls", "wall", "cpu", "alloc_net", "alloc_peak")
+
+    def __init__(self):
+        self.calls = 0; self.wall = 0.0; self.cpu = 0.0; self.alloc_net = 0; self.alloc_peak = 0
+
+    def add(self, wall: float, cpu: float, alloc_net: int, alloc_peak: int):
+        self.calls += 1; self.wall += wall; self.cpu += cpu; self.alloc_net += alloc_net
+        self.alloc_peak = max(self.alloc_peak, alloc_peak)
+
+
+class ProfilingSession:
+    def __init__(self, application: Application, chat_id: int, max_updates: Union[int, None], max_seconds: Union[float, None]):
+        self.application = application
+        self.chat_id = chat_id
+        self.max_updates = max_updates
+        self.max_seconds = max_seconds if max_seconds else MAX_SESSION_SECONDS
+        self.started_at = time.monotonic()
+        self.seen_update_ids: set = set()
+        self.by_handler: Dict[str, _Counter] = {}
+        self.by_intent: Dict[str, _Counter] = {}
+        self.profile = cProfile.Profile()
+        self.started_tracemalloc = False
+        self._wrapped: List[Tuple[BaseHandler, Callable]] = []
+        self._timer_task: Union[asyncio.Task, None] = None
+        self._stopped = False
+
+    # --- Жизненный цикл ---
+    def start(self):
+        for handler in _iter_handlers(self.application):
+            original = handler.callback
+            handler.callback = _wrap_callback(_handler_label(handler), original)
+            self._wrapped.append((handler, original))
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(); self.started_tracemalloc = True
+        self.profile.enable()
+        self._timer_task = asyncio.get_running_loop().create_task(self._timer())
+        logger.warning(f"Профилирование запущено: до {self.max_updates or '∞'} апдейтов / {self.max_seconds:.0f} с.")
+
+    async def _timer(self):
+        await asyncio.sleep(self.max_seconds)
+        await self.finish("истекло время")
+
+    def admit(self, update: Any) -> bool:
+        # Учитываем первые max_updates апдейтов; на первом лишнем сессия останавливается,
+        # а сам апдейт обрабатывается уже без профилирования.
+        update_id = getattr(update, "update_id", None)
+        if update_id in self.seen_update_ids:
+            return True
+        if self.max_updates is not None and len(self.seen_update_ids) >= self.max_updates:
+            asyncio.get_running_loop().create_task(self.finish(f"обработано {len(self.seen_update_ids)} апдейтов"))
+            return False
+        self.seen_update_ids.add(update_id)
+        return True
+
+    def _stop(self) -> list:
+        global _session
+        self._stopped = True
+        self.profile.disable()
+        # Возвращаем исходные колбэки: после остановки хендлеры работают без оберток
+        for handler, original in self._wrapped:
+            handler.callback = original
+        self._wrapped.clear()
+        top_allocations = tracemalloc.take_snapshot().statistics('lineno')[:10] if tracemalloc.is_tracing() else []
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+        if _session is self:
+            _session = None
+        if self._timer_task is not None and self._timer_task is not asyncio.current_task():
+            self._timer_task.cancel()
+        return top_allocations
+
+    async def finish(self, reason: str) -> None:
+        if self._stopped:
+            return
+        top_allocations = self._stop()
+        summary = self.render_summary(reason, top_allocations)
+        stats_path = None
+        try:
+            stats_path = self.dump(summary)
+        except OSError as e:
+            logger.error(f"Не удалось записать файл профиля: {e}")
+        logger.warning(f"Профилирование завершено ({reason}). Файл: {stats_path}")
+        text = summary if stats_path is None else f"{summary}\n\nПолная статистика: {stats_path}"
+        if len(text) > TELEGRAM_TEXT_LIMIT:
+            text = text[:TELEGRAM_TEXT_LIMIT] + "\n…"
+        try:
+            await self.application.bot.send_message(chat_id=self.chat_id, text=text)
+        except Exception as e:
+            logger.error(f"Не удалось отправить итоги профилирования: {e}")
+
+    # --- Учет вызовов ---
+    def record(self, label: str, intent: Union[str, None], wall: float, cpu: float, alloc_net: int, alloc_peak: int):
+        self.by_handler.setdefault(label, _Counter()).add(wall, cpu, alloc_net, alloc_peak)
+        if intent:
+            self.by_intent.setdefault(intent, _Counter()).add(wall, cpu, alloc_net, alloc_peak)
+
+    # --- Отчеты ---
+    def render_summary(self, reason: str, top_allocations: list) -> str:
+        elapsed = time.monotonic() - self.started_at
+        lines = [f"⏱ Профилирование завершено ({reason}).", f"Длительность: {elapsed:.1f} с, апдейтов: {len(self.seen_update_ids)}", ""]
+        lines += _render_counters("По хендлерам", self.by_handler)
+        if self.by_intent:
+            lines.append("")
+            lines += _render_counters("По intent", self.by_intent)
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(SUMMARY_TOP_FUNCTIONS)
+        lines += ["", "Топ функций (cumulative):"]
+        lines += [ln for ln in stream.getvalue().splitlines() if ln.strip()][-SUMMARY_TOP_FUNCTIONS - 1:]
+        if top_allocations:
+            lines += ["", "Топ аллокаций:"]
+            lines += [f"  {stat}" for stat in top_allocations]
+        return "\n".join(lines)
+
+    def dump(self, summary: str) -> str:
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        base = os.path.join(PROFILES_DIR, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        self.profile.dump_stats(base + ".prof")
+        with open(base + ".txt", 'w', encoding='utf-8') as f:
+            f.write(summary + "\n\n")
+            pstats.Stats(self.profile, stream=f).sort_stats(pstats.SortKey.CUMULATIVE).print_stats()
+        return base + ".prof"
+
+
+def _render_counters(title: str, counters: Dict[str, _Counter]) -> List[str]:
+    lines = [f"{title} (вызовов / всего мс / среднее мс / CPU мс / пик КБ):"]
+    for label, c in sorted(counters.items(), key=lambda kv: kv[1].wall, reverse=True):
+        lines.append(f"  {label}: {c.calls} / {c.wall * 1000:.1f} / {c.wall * 1000 / c.calls:.1f} / {c.cpu * 1000:.1f} / {c.alloc_peak / 1024:.0f}")
+    if len(lines) == 1:
+        lines.append("  нет вызовов")
+    return lines
+
+
+def _handler_label(handler: BaseHandler) -> str:
+    callback = handler.callback
+    return getattr(callback, "__name__", type(handler).__name__)
+
+
+def _iter_handlers(application: Application):
+    # Обходит все хендлеры приложения, включая вложенные в ConversationHandler
+    stack: List[Any] = [h for group in application.handlers.values() for h in group]
+    while stack:
+        handler = stack.pop()
+        if isinstance(handler, ConversationHandler):
+            stack.extend(handler.entry_points)
+            stack.extend(handler.fallbacks)
+            for state_handlers in handler.states.values():
+                stack.extend(state_handlers)
+        elif hasattr(handler, "callback"):
+            yield handler
+
+
+def _wrap_callback(label: str, callback: Callable) -> Callable:
+    async def profiled_callback(update, context):
+        session = _session
+        if session is None or not session.admit(update):
+            return await callback(update, context)
+        call_info: Dict[str, Any] = {"intent": None}
+        token = _current_call.set(call_info)
+        tracemalloc.reset_peak()
+        mem_before = tracemalloc.get_traced_memory()[0]
+        wall_before = time.perf_counter(); cpu_before = time.thread_time()
+        try:
+            return await callback(update, context)
+        finally:
+            wall = time.perf_counter() - wall_before; cpu = time.thread_time() - cpu_before
+            mem_after, mem_peak = tracemalloc.get_traced_memory()
+            _current_call.reset(token)
+            session.record(label, call_info["intent"], wall, cpu, mem_after - mem_before, mem_peak - mem_before)
+    profiled_callback.__name__ = label
+    return profiled_callback
+
+
+# --- Публичный API ---
+def is_active() -> bool:
+    return _session is not None
+
+
+def note_intent(intent: Union[str, None]) -> None:
+    """Привязывает текущий вызов хендлера к intent. Без активной сессии ничего не делает."""
+    if _session is None:
+        return
+    call_info = _current_call.get()
+    if call_info is not None:
+        call_info["intent"] = intent
+
+
+def start_session(application: Application, chat_id: int, max_updates: Union[int, None], max_seconds: Union[float, None]) -> bool:
+    global _session
+    if _session is not None:
+        return False
+    _session = ProfilingSession(application, chat_id, max_updates, max_seconds)
+    _session.start()
+    return True
+
+
+async def stop_session(reason: str = "остановлено вручную") -> bool:
+    session = _session
+    if session is None:
+        return False
+    await session.finish(reason)
+    return True
+
+
+def parse_limit(arg: str) -> Tuple[Union[int, None], Union[float, None]]:
+    """'50' -> 50 апдейтов, '30s' / '2m' -> секунды. ValueError при неверном формате."""
+    arg = arg.strip().lower()
+    seconds = None
+    if arg.endswith("s") or arg.endswith("с"):
+        seconds = float(arg[:-1])
+    elif arg.endswith("m") or arg.endswith("м"):
+        seconds = float(arg[:-1]) * 60
+    if seconds is not None:
+        if not 0 < seconds < float("inf"):  # 0 и nan иначе молча превратились бы в MAX_SESSION_SECONDS
+            raise ValueError("длительность должна быть положительной")
+        return None, seconds
+    count = int(arg)
+    if count <= 0:
+        raise ValueError("число апдейтов должно быть положительным")
+    return count, None
@@ -0,0 +1,181 @@
+# progress_history.py
+# История прогресса по элементам: журнал событий "день, изменение в ед." вне основного документа.
+# На диске - только дозапись: HISTORY_FILE из записей struct '<IIi' (номер элемента, день как
+# порядковый номер даты, изменение) по 12 байт и HISTORY_IDS_FILE (id элемента на строку;
+# номер строки = номер элемента). В памяти у элемента два array: дни (неубывающие) и изменения,
+# события одного дня складываются. Запросы: темп за последние N дней (bisect по дням),
+# прореживание по корзинам дней. Миллион событий - около 12 МБ на диске и в памяти.
+import bisect
+import logging
+import os
+import struct
+from array import array
+from datetime import date
+from typing import Dict, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FILE = 'progress_history.bin'
+HISTORY_IDS_FILE = 'progress_history.ids'
+RECENT_PACE_WINDOW = 7  # дней для "текущего" темпа в прогнозе
+
+_RECORD = struct.Struct('<IIi')
+
+# id элемента -> (дни, изменения)
+_series: Dict[str, Tuple[array, array]] = {}
+_item_numbers: Dict[str, int] = {}
+_state = {"loaded": False, "events": 0}
+
+
+def read_history(history_file: str, ids_file: str) -> Tuple[List[str], Dict[str, Tuple[array, array]]]:
+    """Читает журнал с диска: (id по номерам элементов, id -> (дни, изменения))."""
+    series: Dict[str, Tuple[array, array]] = {}
+    ids: List[str] = []
+    try:
+        with open(ids_file, 'r', encoding='utf-8') as f:
+            ids = [line.rstrip('\n') for line in f]
+        with open(history_file, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return ids, series
+    usable = len(raw) - len(raw) % _RECORD.size  # Хвост от оборванной записи отбрасывается
+    for number, day, delta in _RECORD.iter_unpack(raw[:usable]):
+        if number < len(ids):
+            _add_event(series, ids[number], day, delta)
+    return ids, series
+
+
+def write_history(series: Dict[str, Tuple[array, array]], history_file: str, ids_file: str) -> int:
+    """Пишет журнал целиком (по записи на элемент и день) с заменой файлов. Возвращает число записей."""
+    ids = list(series)
+    records = bytearray()
+    for number, item_id in enumerate(ids):
+        for day, delta in zip(*series[item_id]):
+            records += _RECORD.pack(number, day, delta)
+    for path, payload, mode in ((ids_file, "".join(i + '\n' for i in ids), 'w'), (history_file, bytes(records), 'wb')):
+        tmp_file = path + '.tmp'
+        with open(tmp_file, mode, **({} if 'b' in mode else {"encoding": "utf-8"})) as f:
+            f.write(payload)
+        os.replace(tmp_file, path)
+    return len(records) // _RECORD.size
+
+
+def _load() -> None:
+    _state["loaded"] = True
+    ids, series = read_history(HISTORY_FILE, HISTORY_IDS_FILE)
+    _item_numbers.update((item_id, number) for number, item_id in enumerate(ids))
+    _series.update(series)
+    _state["events"] = sum(len(days) for days, _ in series.values())
+    if series:
+        logger.info(f"История прогресса загружена: элементов {len(_series)}, событий {_state['events']}.")
+
+
+def ensure_loaded() -> None:
+    if not _state["loaded"]:
+        _load()
+
+
+def _append(item_id: str, day: int, delta: int) -> None:
+    _add_event(_series, item_id, day, delta)
+    _state["events"] += 1
+
+
+def _add_event(all_series: Dict[str, Tuple[array, array]], item_id: str, day: int, delta: int) -> None:
+    series = all_series.get(item_id)
+    if series is None:
+        series = all_series[item_id] = (array('I'), array('i'))
+    days, deltas = series
+    if days and days[-1] == day:
+        deltas[-1] += delta  # Несколько обновлений за день - одно событие
+    elif days and days[-1] > day:
+        # Событие задним числом (переведенные часы): вставка с сохранением порядка дней
+        position = bisect.bisect_left(days, day)
+        if position < len(days) and days[position] == day: deltas[position] += delta
+        else: days.insert(position, day); deltas.insert(position, delta)
+    else:
+        days.append(day); deltas.append(delta)
+
+
+def _item_number(item_id: str) -> int:
+    number = _item_numbers.get(item_id)
+    if number is None:
+        number = _item_numbers[item_id] = len(_item_numbers)
+        with open(HISTORY_IDS_FILE, 'a', encoding='utf-8') as f:
+            f.write(item_id + '\n')
+    return number
+
+
+def record_progress(item_id: str, delta: int, day: Union[date, None] = None) -> None:
+    """Дописывает событие изменения прогресса (в ед.) элемента. Нулевые изменения не пишутся."""
+    if not delta:
+        return
+    ensure_loaded()
+    day_ord = (day or date.today()).toordinal()
+    try:
+        record = _RECORD.pack(_item_number(item_id), day_ord, int(delta))
+        with open(HISTORY_FILE, 'ab') as f:
+            f.write(record)
+    except (OSError, struct.error) as e:
+        logger.error(f"Не удалось записать историю прогресса {item_id}: {e}"); return
+    _append(item_id, day_ord, int(delta))
+
+
+def has_history(item_id: str) -> bool:
+    ensure_loaded()
+    return item_id in _series
+
+
+def units_in_window(item_id: str, window_days: int, today: Union[date, None] = None) -> int:
+    """Сумма изменений за последние window_days дней, включая сегодня."""
+    ensure_loaded()
+    series = _series.get(item_id)
+    if series is None:
+        return 0
+    days, deltas = series
+    today_ord = (today or date.today()).toordinal()
+    start = bisect.bisect_left(days, today_ord - window_days + 1)
+    end = bisect.bisect_right(days, today_ord)
+    return sum(deltas[start:end])
+
+
+def recent_pace(item_id: str, created_ordinal: int, window_days: int = RECENT_PACE_WINDOW,
+                today: Union[date, None] = None) -> Union[Tuple[float, int], None]:
+    """
+    (ед. в день, длина окна в днях) за последние window_days дней или None, если истории у элемента нет
+    (элементы, созданные до ведения истории, считаются по-старому). Окно не выходит за дату создания;
+    дни считаются включительно: у созданного 3 дня назад окно - 4 дня, вместе с днем создания.
+    """
+    if not has_history(item_id):
+        return None
+    today_ord = (today or date.today()).toordinal()
+    window = min(window_days, today_ord - created_ordinal + 1)
+    if window <= 0:
+        return None
+    return units_in_window(item_id, window, today) / window, window
+
+
+def downsample(item_id: str, bucket_days: int = 7) -> List[Tuple[date, int]]:
+    """[(первый день корзины, сумма изменений), ...] - история, сжатая до корзин по bucket_days дней."""
+    ensure_loaded()
+    series = _series.get(item_id)
+    if series is None:
+        return []
+    buckets: List[Tuple[date, int]] = []
+    current_start = None; total = 0
+    for day, delta in zip(*series):
+        start = day - day % bucket_days
+        if start != current_start:
+            if current_start is not None: buckets.append((date.fromordinal(current_start), total))
+            current_start = start; total = 0
+        total += delta
+    if current_start is not None:
+        buckets.append((date.fromordinal(current_start), total))
+    return buckets
+
+
+def compact() -> int:
+    """Переписывает журнал из памяти: по одной записи на элемент и день. Возвращает число записей."""
+    ensure_loaded()
+    _state["events"] = write_history(_series, HISTORY_FILE, HISTORY_IDS_FILE)
+    _item_numbers.clear(); _item_numbers.update((item_id, number) for number, item_id in enumerate(_series))
+    return _state["events"]
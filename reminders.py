@@ -0,0 +1,255 @@
+# reminders.py
+# Напоминания о дедлайнах: "завтра срок", "сегодня срок", "просрочено" - в локальное время
+# владельца (timezone и reminder_time пользователя, по умолчанию DEFAULT_REMINDER_TIME).
+# Вместо периодического перебора всех элементов - куча (heapq) ближайших напоминаний: у каждого
+# активного элемента с дедлайном в куче не больше одной записи - его следующее напоминание.
+# Куча поддерживается подписчиком data_handler.record_item_mutation (создание, смена срока,
+# завершение): элемент получает новое поколение и новую запись, старая запись отбрасывается при
+# извлечении (ленивое удаление). Одна задача asyncio спит до вершины кучи; каждое событие - O(log n).
+# Отправленные напоминания помнятся в REMINDERS_SENT_FILE, чтобы не повторяться после перезапуска.
+# Временная ошибка отправки (сеть, 429) не отмечает напоминание отправленным: оно повторяется с
+# растущей задержкой; окончательные (бот заблокирован, чат не найден) - отмечаются и не повторяются.
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, Union
+
+import pytz
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from data_handler import load_data, add_mutation_listener, get_item_index, owns_user
+from item_index import POOLS
+
+logger = logging.getLogger(__name__)
+
+REMINDERS_SENT_FILE = 'reminders_sent.json'
+DEFAULT_REMINDER_TIME = "09:00"
+REMINDER_CATCHUP = timedelta(hours=6)  # Напоминание, пропущенное (например, при перезапуске), досылается в этом окне
+SENT_RETENTION_DAYS = 3
+MAX_SLEEP = 3600.0
+REMINDER_RETRY_DELAY = 60.0  # секунд до первого повтора неудавшейся отправки, дальше - вдвое дольше
+REMINDER_MAX_RETRIES = 6
+
+REMIND_TOMORROW = "tomorrow"
+REMIND_TODAY = "today"
+REMIND_OVERDUE = "overdue"
+# (вид, день относительно дедлайна)
+REMINDER_KINDS: Tuple[Tuple[str, int], ...] = ((REMIND_TOMORROW, -1), (REMIND_TODAY, 0), (REMIND_OVERDUE, 1))
+
+SendFunc = Callable[[int, str], Awaitable[Any]]
+
+# Запись кучи: (момент UTC timestamp, порядковый номер, поколение, тип, id, вид, дедлайн)
+HeapEntry = Tuple[float, int, int, str, str, str, str]
+
+_state: Dict[str, Any] = {"data": None}
+_heap: List[HeapEntry] = []
+_generation: Dict[Tuple[str, str], int] = {}
+_sent: Dict[str, str] = {}  # "тип:id:вид:дедлайн" -> дедлайн
+_retries: Dict[str, int] = {}  # "тип:id:вид:дедлайн" -> число неудачных попыток
+_counter = itertools.count()
+_stats: Dict[str, int] = {"sent": 0, "stale": 0, "builds": 0, "retries": 0, "failed": 0}
+_wakeup: Union[asyncio.Event, None] = None
+_scheduler_task: Union[asyncio.Task, None] = None
+
+
+# --- Моменты напоминаний ---
+def _reminder_moment(user: Dict[str, Any], local_day: date) -> datetime:
+    try: tz = pytz.timezone(user.get("timezone") or "UTC")
+    except pytz.UnknownTimeZoneError: tz = pytz.utc
+    try:
+        hours, minutes = (int(part) for part in str(user.get("reminder_time") or DEFAULT_REMINDER_TIME).split(":"))
+        at = dt_time(hours, minutes)
+    except ValueError:
+        at = dt_time(9, 0)
+    return tz.localize(datetime.combine(local_day, at)).astimezone(pytz.utc)
+
+
+def _sent_key(item_type: str, item_id: str, kind: str, deadline: str) -> str:
+    return f"{item_type}:{item_id}:{kind}:{deadline}"
+
+
+def _schedule(item_type: str, item_id: str, now_utc: datetime) -> None:
+    """Следующее напоминание элемента (или никакого). Прежние записи элемента становятся устаревшими."""
+    key = (item_type, item_id)
+    generation = _generation[key] = _generation.get(key, 0) + 1
+    data = _state["data"]
+    item = data.get("projects" if item_type == "project" else "tasks", {}).get(item_id)
+    if not item or item.get("status") != "active" or not item.get("deadline"):
+        _generation.pop(key, None); return
+    owner = str(item.get("owner_id"))
+    user = data.get("users", {}).get(owner, {})
+    if not owns_user(owner) or user.get("receive_reminders", True) is False:
+        return
+    deadline = item["deadline"]
+    try: deadline_day = datetime.strptime(deadline, '%Y-%m-%d').date()
+    except ValueError: return
+    moments = [(kind, _reminder_moment(user, deadline_day + timedelta(days=offset))) for kind, offset in REMINDER_KINDS]
+    due = [(kind, moment) for kind, moment in moments if moment <= now_utc]
+    # Из наступивших актуально только последнее (более ранние им перекрыты), и только в окне досылки
+    if due and now_utc - due[-1][1] <= REMINDER_CATCHUP and _sent_key(item_type, item_id, due[-1][0], deadline) not in _sent:
+        kind, moment = due[-1]
+    elif len(due) < len(moments):
+        kind, moment = moments[len(due)]
+    else:
+        return
+    entry = (moment.timestamp(), next(_counter), generation, item_type, item_id, kind, deadline)
+    heapq.heappush(_heap, entry)
+    if _wakeup is not None and _heap[0] is entry:
+        _wakeup.set()  # Новое напоминание раньше того, до которого спит планировщик
+
+
+def _build(data: Dict[str, Any]) -> None:
+    _state["data"] = data
+    _heap.clear(); _generation.clear()
+    now_utc = datetime.now(pytz.utc)
+    for pool_name, item_type in POOLS:
+        for item_id in list(data.get(pool_name, {})):
+            _schedule(item_type, item_id, now_utc)
+    _stats["builds"] += 1
+    logger.info(f"Индекс напоминаний построен: запланировано {len(_heap)}.")
+    if _wakeup is not None: _wakeup.set()
+
+
+def on_item_mutation(owner_id: Union[str, None], item_type: Union[str, None] = None, item_id: Union[str, None] = None) -> None:
+    # Подписчик data_handler
+    data = _state["data"]
+    if data is None:
+        return
+    if owner_id is None:
+        _state["data"] = None  # Файл перечитан: планировщик перестроит кучу
+        if _wakeup is not None: _wakeup.set()
+        return
+    now_utc = datetime.now(pytz.utc)
+    if item_type and item_id:
+        _schedule(item_type, item_id, now_utc)
+    else:
+        index = get_item_index(data)
+        for _, owner_type in POOLS:
+            for owned_id in index.owner_item_ids(owner_id, owner_type):
+                _schedule(owner_type, owned_id, now_utc)
+
+
+# --- Отправка ---
+def _reminder_text(item: Dict[str, Any], item_type: str, kind: str, deadline: str) -> str:
+    label = "Проект" if item_type == "project" else "Задача"
+    name = item.get("name", "?")
+    progress = f" Прогресс: {item.get('current_units', 0)}/{item['total_units']}." if item.get("total_units", 0) > 0 else ""
+    if kind == REMIND_TOMORROW:
+        return f"⏰ Завтра срок: {label} '{name}' (до {deadline}).{progress}"
+    if kind == REMIND_TODAY:
+        return f"🔥 Сегодня срок: {label} '{name}'.{progress}"
+    return f"🆘 Просрочено: {label} '{name}' (срок был {deadline}).{progress} Отметьте прогресс или перенесите дедлайн."
+
+
+def _load_sent() -> None:
+    try:
+        with open(REMINDERS_SENT_FILE, 'r', encoding='utf-8') as f:
+            _sent.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.error(f"{REMINDERS_SENT_FILE} поврежден, отметки отправленных напоминаний сброшены: {e}")
+
+
+def _save_sent() -> None:
+    oldest = (date.today() - timedelta(days=SENT_RETENTION_DAYS)).isoformat()
+    for key in [key for key, deadline in _sent.items() if deadline < oldest]:
+        del _sent[key]
+    try:
+        tmp_file = REMINDERS_SENT_FILE + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(_sent, f, separators=(',', ':'))
+        os.replace(tmp_file, REMINDERS_SENT_FILE)
+    except OSError as e:
+        logger.error(f"Не удалось сохранить {REMINDERS_SENT_FILE}: {e}")
+
+
+def _is_permanent(error: Exception) -> bool:
+    # Повтор не поможет: бот заблокирован пользователем или чата больше нет
+    return isinstance(error, Forbidden) or (isinstance(error, BadRequest) and "chat not found" in str(error).lower())
+
+
+async def _fire_due(send: SendFunc) -> int:
+    sent_now = 0; marked = 0; now = time.time()
+    while _heap and _heap[0][0] <= now and _state["data"] is not None:
+        _, _, generation, item_type, item_id, kind, deadline = heapq.heappop(_heap)
+        if _generation.get((item_type, item_id)) != generation:
+            _stats["stale"] += 1; continue  # Элемент с тех пор менялся: запись устарела
+        item = _state["data"].get("projects" if item_type == "project" else "tasks", {}).get(item_id)
+        if item and item.get("status") == "active" and item.get("deadline") == deadline:
+            key = _sent_key(item_type, item_id, kind, deadline)
+            try:
+                await send(int(item["owner_id"]), _reminder_text(item, item_type, kind, deadline))
+                sent_now += 1; _stats["sent"] += 1
+            except Exception as e:
+                attempt = _retries.get(key, 0) + 1
+                if not _is_permanent(e) and attempt <= REMINDER_MAX_RETRIES:
+                    delay = REMINDER_RETRY_DELAY * 2 ** (attempt - 1)
+                    if isinstance(e, RetryAfter):
+                        retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                        delay = max(delay, retry_after)
+                    logger.warning(f"Не удалось отправить напоминание ({item_type} {item_id}, {kind}): {e}. "
+                                   f"Повтор {attempt}/{REMINDER_MAX_RETRIES} через {delay:.0f} с.")
+                    _retries[key] = attempt; _stats["retries"] += 1
+                    # Та же запись с тем же поколением: изменение элемента до повтора ее отменит
+                    heapq.heappush(_heap, (now + delay, next(_counter), generation, item_type, item_id, kind, deadline))
+                    continue
+                logger.error(f"Напоминание ({item_type} {item_id}, {kind}) не отправлено и не будет повторено: {e}")
+                _stats["failed"] += 1
+            _retries.pop(key, None)
+            _sent[key] = deadline; marked += 1
+        if _state["data"] is not None: # Пока шла отправка, файл могли перечитать
+            _schedule(item_type, item_id, datetime.now(pytz.utc))  # Следующий вид напоминания
+    if marked:
+        _save_sent()
+    return sent_now
+
+
+async def run_reminder_scheduler(send: SendFunc) -> None:
+    """Спит до ближайшего напоминания (или до изменения кучи), отправляет наступившие."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    _load_sent()
+    while True:
+        data = load_data()
+        if _state["data"] is not data:
+            _build(data)
+        try:
+            await _fire_due(send)
+        except Exception as e:
+            logger.error(f"Ошибка планировщика напоминаний: {e}", exc_info=True)
+        delay = min(MAX_SLEEP, _heap[0][0] - time.time()) if _heap else MAX_SLEEP
+        _wakeup.clear()
+        if delay > 0:
+            try: await asyncio.wait_for(_wakeup.wait(), delay)
+            except asyncio.TimeoutError: pass
+
+
+def describe_reminders() -> str:
+    return (f"Напоминания: в очереди {len(_heap)}, отправлено {_stats['sent']}, повторов {_stats['retries']}, "
+            f"не доставлено {_stats['failed']}, устаревших записей {_stats['stale']}, построений {_stats['builds']}")
+
+
+def start_reminder_scheduler(send: SendFunc) -> asyncio.Task:
+    global _scheduler_task
+    if _scheduler_task is None or _scheduler_task.done():
+        _scheduler_task = asyncio.get_running_loop().create_task(run_reminder_scheduler(send))
+        logger.info("Планировщик напоминаний о дедлайнах запущен.")
+    return _scheduler_task
+
+
+async def stop_reminder_scheduler() -> None:
+    global _scheduler_task
+    if _scheduler_task is not None:
+        _scheduler_task.cancel()
+        try: await _scheduler_task
+        except asyncio.CancelledError: pass
+        _scheduler_task = None
+
+
+add_mutation_listener(on_item_mutation)
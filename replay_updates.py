@@ -0,0 +1,79 @@
+# replay_updates.py
+# Отправляет записанные апдейты на локальный вебхук (BOT_MODE=webhook), как это делал бы Telegram.
+#   python replay_updates.py updates.jsonl [--url http://127.0.0.1:8443/telegram] [--secret ...] [--delay 0.1]
+# Файл - JSON-массив апдейтов или по одному апдейту в строке (JSON Lines).
+# Проверки /healthz и /readyz: python replay_updates.py --check
+# Нагрузка: --concurrency N - N соединений; апдейты одного пользователя идут через одно соединение
+# по порядку (как их раздает cluster.py), итог - апдейтов в секунду.
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List
+from urllib.parse import SplitResult, urlsplit
+
+from cluster import route_user_id
+
+
+def load_updates(path: str) -> List[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read().strip()
+    if content.startswith('['):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных апдейтов на локальный вебхук")
+    parser.add_argument("file", nargs="?", help="JSON / JSON Lines с апдейтами")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{os.getenv('WEBHOOK_PORT', '8443')}{os.getenv('WEBHOOK_PATH', '/telegram')}")
+    parser.add_argument("--secret", default=os.getenv('WEBHOOK_SECRET'))
+    parser.add_argument("--delay", type=float, default=0.0, help="пауза между апдейтами, с")
+    parser.add_argument("--check", action="store_true", help="только опросить /healthz и /readyz")
+    parser.add_argument("--concurrency", type=int, default=1, help="число параллельных соединений")
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=10)
+    if args.check or not args.file:
+        for path in ("/healthz", "/readyz"):
+            conn.request("GET", path); response = conn.getresponse()
+            print(f"{path}: {response.status} {response.read().decode()}")
+        return
+
+    headers = {"Content-Type": "application/json"}
+    if args.secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = args.secret
+    updates = load_updates(args.file)
+    concurrency = max(1, args.concurrency)
+    streams: List[List[Dict[str, Any]]] = [[] for _ in range(concurrency)]
+    for update in updates:
+        streams[abs(route_user_id(update)) % concurrency].append(update)
+    statuses: Dict[int, int] = {}; lock = threading.Lock()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=_send_stream, args=(url, headers, stream, args.delay, statuses, lock)) for stream in streams]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    elapsed = time.perf_counter() - started
+    print(f"Отправлено {len(updates)} апдейтов за {elapsed:.2f} с ({len(updates) / elapsed:.0f}/с, "
+          f"соединений {concurrency}); коды ответов: {statuses}")
+
+
+def _send_stream(url: SplitResult, headers: Dict[str, str], updates: List[Dict[str, Any]], delay: float,
+                 statuses: Dict[int, int], lock: threading.Lock) -> None:
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=10)
+    for update in updates:
+        conn.request("POST", url.path or "/", body=json.dumps(update, ensure_ascii=False).encode('utf-8'), headers=headers)
+        response = conn.getresponse(); response.read()
+        with lock:
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+        if response.status != 200:
+            print(f"update_id={update.get('update_id')}: HTTP {response.status}")
+        if delay:
+            time.sleep(delay)
+
+
+if __name__ == '__main__':
+    main()
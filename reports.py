@@ -0,0 +1,279 @@
+# reports.py
+# Ежедневные отчеты пользователям с receive_reports=True.
+# Пользователи группируются по моменту отправки (локальное время отчета в их часовом поясе,
+# переведенное в UTC); для каждой группы дайджесты считаются за один проход по индексу
+# владельцев и одним пакетным расчетом темпа. Отметка прогресса (завершенные группы в
+# REPORT_PROGRESS_FILE и журнал отправок в REPORT_SENT_LOG_FILE) позволяет после перезапуска
+# доотправить группу без повторов.
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, date, time as dt_time, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, Union
+
+import pytz
+
+from data_handler import load_data, save_data, get_item_index, get_data_version, owns_user, record_item_mutation
+from pace import build_columns, compute_pace_batch, with_rollup, FORECAST_TEXTS, PACE_CLASS_NAMES, PACE_NOT_APPLICABLE, PACE_INVALID
+from progress_history import recent_pace
+from rollups import get_project_rollup
+
+logger = logging.getLogger(__name__)
+
+REPORT_PROGRESS_FILE = 'report_progress.json'
+REPORT_SENT_LOG_FILE = 'report_progress.sent'  # Строки "<группа> <user_id>", дописываются после каждой отправки
+DEFAULT_REPORT_TIME = "09:00"      # Локальное время отчета, если у пользователя не задано "report_time"
+REPORT_CATCHUP = timedelta(hours=3)  # Пропущенные (например, во время перезапуска) группы досылаются в этом окне
+REPORT_RETRY_DELAY = 300  # секунд до повтора неудавшихся отправок группы
+REPORT_COUNTER_FLUSH = 50  # отправок между сохранениями счетчиков отчетов (last_report_day_counter)
+PROGRESS_RETENTION = timedelta(days=2)
+MAX_ITEMS_IN_DIGEST = 30
+
+SendFunc = Callable[[int, str], Awaitable[Any]]
+
+_scheduler_task: Union[asyncio.Task, None] = None
+
+
+# --- Отметка прогресса ---
+def _load_progress(progress_file: Union[str, None] = None, sent_file: Union[str, None] = None) -> Dict[str, Any]:
+    # Файлы можно указать явно: cluster.py перекладывает отметки воркеров при смене их числа
+    progress: Dict[str, Any] = {"sent": {}, "done": []}
+    try:
+        with open(progress_file or REPORT_PROGRESS_FILE, 'r', encoding='utf-8') as f:
+            progress["done"] = json.load(f).get("done", [])
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    try:
+        with open(sent_file or REPORT_SENT_LOG_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    progress["sent"].setdefault(parts[0], []).append(parts[1])
+    except FileNotFoundError:
+        pass
+    return progress
+
+
+def _save_progress(progress: Dict[str, Any], progress_file: Union[str, None] = None, sent_file: Union[str, None] = None) -> None:
+    # Полная перезапись: список завершенных групп и журнал отправок по незавершенным
+    progress_file = progress_file or REPORT_PROGRESS_FILE; sent_file = sent_file or REPORT_SENT_LOG_FILE
+    try:
+        tmp_file = progress_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"done": progress["done"]}, f, separators=(',', ':'))
+        os.replace(tmp_file, progress_file)
+        tmp_file = sent_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.writelines(f"{key} {user_id}\n" for key, ids in progress["sent"].items() for user_id in ids)
+        os.replace(tmp_file, sent_file)
+    except OSError as e:
+        logger.error(f"Не удалось сохранить отметку прогресса отчетов: {e}")
+
+
+def _append_sent(bucket_key: str, user_id: str) -> None:
+    try:
+        with open(REPORT_SENT_LOG_FILE, 'a', encoding='utf-8') as f:
+            f.write(f"{bucket_key} {user_id}\n")
+    except OSError as e:
+        logger.error(f"Не удалось дописать {REPORT_SENT_LOG_FILE}: {e}")
+
+
+def _prune_progress(progress: Dict[str, Any], now_utc: datetime) -> None:
+    oldest = _bucket_key(now_utc - PROGRESS_RETENTION)
+    progress["done"] = [key for key in progress["done"] if key >= oldest]
+    progress["sent"] = {key: ids for key, ids in progress["sent"].items() if key >= oldest}
+
+
+def _bucket_key(moment_utc: datetime) -> str:
+    return moment_utc.strftime('%Y-%m-%dT%H:%MZ')
+
+
+# --- Группировка пользователей ---
+def _user_report_moment(user: Dict[str, Any], local_day: date) -> datetime:
+    try: tz = pytz.timezone(user.get("timezone") or "UTC")
+    except pytz.UnknownTimeZoneError: tz = pytz.utc
+    try:
+        hours, minutes = (int(part) for part in str(user.get("report_time") or DEFAULT_REPORT_TIME).split(":"))
+        report_time = dt_time(hours, minutes)
+    except ValueError:
+        report_time = dt_time(9, 0)
+    return tz.localize(datetime.combine(local_day, report_time)).astimezone(pytz.utc)
+
+
+def build_report_buckets(users: Dict[str, Dict[str, Any]], now_utc: datetime) -> Dict[datetime, List[str]]:
+    """
+    Группирует пользователей с включенными отчетами по моменту отправки (UTC).
+    Для каждого берутся вчерашний, сегодняшний и завтрашний локальные дни, чтобы
+    покрыть часовые пояса по обе стороны от UTC.
+    """
+    buckets: Dict[datetime, List[str]] = {}
+    utc_today = now_utc.date()
+    for user_id, user in users.items():
+        if not user.get("receive_reports", False):
+            continue
+        for shift in (-1, 0, 1):
+            moment = _user_report_moment(user, utc_today + timedelta(days=shift))
+            buckets.setdefault(moment, []).append(user_id)
+    return buckets
+
+
+# --- Дайджесты ---
+def build_digests(data: Dict[str, Any], user_ids: List[str], today: Union[date, None] = None) -> Dict[str, Tuple[str, List[str]]]:
+    """
+    Дайджесты для группы пользователей: {user_id: (текст, [id проектов в отчете])}.
+    Активные элементы берутся из индекса владельцев, темп считается одним пакетом на всю группу.
+    Пользователи без активных элементов в результат не попадают.
+    """
+    index = get_item_index(data)
+    items: List[Dict[str, Any]] = []; owners: List[str] = []; kinds: List[str] = []
+    for user_id in user_ids:
+        for item_type, pool_name in (("project", "projects"), ("task", "tasks")):
+            pool = data.get(pool_name, {})
+            for item_id in index.owner_item_ids(user_id, item_type):
+                item = pool.get(item_id)
+                if item and item.get("status") == "active":
+                    entry = {**item, "id": item_id}
+                    if item_type == "project": entry = with_rollup(entry, get_project_rollup(data, item_id))
+                    items.append(entry); owners.append(user_id); kinds.append(item_type)
+    if not items:
+        return {}
+
+    paces = compute_pace_batch(build_columns(items, today, recent_pace), today)
+    per_user: Dict[str, List[int]] = {}
+    for position, owner in enumerate(owners):
+        per_user.setdefault(owner, []).append(position)
+
+    digests: Dict[str, Tuple[str, List[str]]] = {}
+    for user_id, positions in per_user.items():
+        positions.sort(key=lambda pos: (items[pos].get("deadline") or "9999", items[pos].get("name", "").lower()))
+        lines = ["📊 *Ежедневный отчет*"]
+        project_ids = [items[pos]["id"] for pos in positions if kinds[pos] == "project"]
+        for pos in positions[:MAX_ITEMS_IN_DIGEST]:
+            lines.append(_digest_line(items[pos], kinds[pos], int(paces["class"][pos]), int(paces["days_left"][pos])))
+        if len(positions) > MAX_ITEMS_IN_DIGEST:
+            lines.append(f"…и еще {len(positions) - MAX_ITEMS_IN_DIGEST}. Полный список: 'статус'.")
+        digests[user_id] = ("\n".join(lines), project_ids)
+    return digests
+
+
+def _digest_line(item: Dict[str, Any], kind: str, pace_class: int, days_left: int) -> str:
+    icon = "📁" if kind == "project" else "▫️"
+    line = f"{icon} {item.get('name', '?')}"
+    if item.get("total_units", 0) > 0:
+        line += f" [{item.get('current_units', 0)}/{item['total_units']}]"
+    if item.get("deadline"):
+        line += f", до {item['deadline']}"
+    if pace_class not in (PACE_NOT_APPLICABLE, PACE_INVALID):
+        if days_left < 0: line += f" (просрочено на {-days_left} дн.)"
+        elif days_left == 0: line += " (срок сегодня)"
+        line += f" — {FORECAST_TEXTS.get(pace_class, PACE_CLASS_NAMES[pace_class])}"
+    return line
+
+
+# --- Отправка ---
+def _apply_report_counters(counts: Dict[str, int]) -> None:
+    # Рассылка группы идет минутами, и документ за это время могли перечитать и сохранить другие
+    # хендлеры: приращения применяются к текущему документу, а не к загруженному в начале группы
+    if not counts:
+        return
+    data = load_data(); changed = []
+    for project_id, count in counts.items():
+        project = data["projects"].get(project_id)
+        if project is not None:
+            project["last_report_day_counter"] = project.get("last_report_day_counter", 0) + count
+            changed.append((project.get("owner_id"), project_id))
+    if not save_data(data):
+        return  # Приращения остаются в counts и применятся при следующей записи
+    # Счетчик отчетов меняется на месте: снимки и кэши владельцев должны узнать об изменении
+    for owner_id, project_id in changed:
+        record_item_mutation(owner_id, "project", project_id)
+    counts.clear()
+
+
+async def send_bucket(bucket_key: str, user_ids: List[str], send: SendFunc, progress: Dict[str, Any]) -> int:
+    """Отправляет отчеты группе, пропуская уже отправленных по отметке прогресса. Возвращает число отправок."""
+    already_sent = set(progress["sent"].get(bucket_key, []))
+    pending = [user_id for user_id in user_ids if user_id not in already_sent]
+    digests = build_digests(load_data(), pending)
+    sent_now = 0; failed = 0; counts: Dict[str, int] = {}
+    sent_list = progress["sent"].setdefault(bucket_key, [])
+    for user_id in pending:
+        digest = digests.get(user_id)
+        if digest is not None:
+            text, project_ids = digest
+            try:
+                await send(int(user_id), text)
+            except Exception as e:
+                # Не отмечаем отправку: получатель останется в группе до повтора
+                logger.error(f"Не удалось отправить отчет пользователю {user_id}: {e}")
+                failed += 1
+                continue
+            sent_now += 1
+            for project_id in project_ids:
+                counts[project_id] = counts.get(project_id, 0) + 1
+            if sent_now % REPORT_COUNTER_FLUSH == 0:
+                _apply_report_counters(counts)  # Сбой посреди большой группы теряет не больше порции счетчиков
+        sent_list.append(user_id)
+        _append_sent(bucket_key, user_id)
+    _apply_report_counters(counts)
+    if not failed:
+        progress["done"].append(bucket_key)
+        progress["sent"].pop(bucket_key, None)
+        _save_progress(progress)
+    logger.info(f"Отчеты группы {bucket_key}: отправлено {sent_now} из {len(user_ids)} получателей"
+                + (f", не удалось {failed} (повтор через {REPORT_RETRY_DELAY} с)." if failed else "."))
+    return sent_now
+
+
+async def run_report_scheduler(send: SendFunc) -> None:
+    """Бесконечный цикл: спит до ближайшей группы, отправляет ее, пересчитывает расписание."""
+    progress = _load_progress()
+    buckets: Dict[datetime, List[str]] = {}; buckets_key = None
+    while True:
+        now_utc = datetime.now(pytz.utc)
+        _prune_progress(progress, now_utc)
+        data = load_data()
+        # Группы пересчитываются, только если сменились данные или день
+        if buckets_key != (get_data_version(), now_utc.date()):
+            # В многопроцессном режиме каждый воркер отправляет отчеты только своим пользователям
+            users = {user_id: user for user_id, user in data.get("users", {}).items() if owns_user(user_id)}
+            buckets = build_report_buckets(users, now_utc)
+            buckets_key = (get_data_version(), now_utc.date())
+        done = set(progress["done"])
+        due = sorted((moment, users) for moment, users in buckets.items()
+                     if _bucket_key(moment) not in done and moment > now_utc - REPORT_CATCHUP)
+        if not due:
+            await asyncio.sleep(3600)
+            continue
+        moment, user_ids = due[0]
+        delay = (moment - now_utc).total_seconds()
+        if delay > 0:
+            # Просыпаемся не реже раза в час: за это время могли появиться новые получатели
+            await asyncio.sleep(min(delay, 3600))
+            continue
+        try:
+            await send_bucket(_bucket_key(moment), user_ids, send, progress)
+            if _bucket_key(moment) not in progress["done"]:
+                # Часть отправок не удалась: повтор, пока группа в окне REPORT_CATCHUP
+                await asyncio.sleep(REPORT_RETRY_DELAY)
+        except Exception as e:
+            logger.error(f"Ошибка при отправке группы отчетов {_bucket_key(moment)}: {e}", exc_info=True)
+            progress["done"].append(_bucket_key(moment)); _save_progress(progress)
+
+
+def start_report_scheduler(send: SendFunc) -> asyncio.Task:
+    global _scheduler_task
+    if _scheduler_task is None or _scheduler_task.done():
+        _scheduler_task = asyncio.get_running_loop().create_task(run_report_scheduler(send))
+        logger.info("Планировщик ежедневных отчетов запущен.")
+    return _scheduler_task
+
+
+async def stop_report_scheduler() -> None:
+    global _scheduler_task
+    if _scheduler_task is not None:
+        _scheduler_task.cancel()
+        try: await _scheduler_task
+        except asyncio.CancelledError: pass
+        _scheduler_task = None
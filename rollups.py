@@ -0,0 +1,125 @@
+# rollups.py
+# Сводки проектов по дочерним задачам: число задач, завершенных, сумма единиц (текущих и целевых)
+# и ближайший срок среди открытых задач. Один раз строятся проходом по задачам, дальше
+# поддерживаются инкрементально: подписчик data_handler.record_item_mutation на изменение задачи
+# вычитает ее прежний вклад из сводки проекта и добавляет новый, не перебирая остальные задачи.
+# Сводки - производные данные: в файл не пишутся и строятся заново, если файл перечитан.
+import heapq
+import logging
+from typing import Any, Dict, List, Tuple, Union
+
+from data_handler import add_mutation_listener, get_item_index
+
+logger = logging.getLogger(__name__)
+
+CLOSED_STATUSES = ("completed", "archived")
+
+# Вклад задачи: (id проекта, закрыта ли, текущие ед., целевые ед., срок - только у открытой задачи)
+Contribution = Tuple[str, bool, int, int, Union[str, None]]
+
+
+class ProjectRollup:
+    """Агрегаты по задачам одного проекта. Все изменения - через _apply со знаком +1/-1."""
+    __slots__ = ("task_count", "completed_count", "current_units", "total_units", "_deadlines", "_heap")
+
+    def __init__(self):
+        self.task_count = 0; self.completed_count = 0; self.current_units = 0; self.total_units = 0
+        self._deadlines: Dict[str, int] = {}  # срок -> число открытых задач с ним
+        self._heap: List[str] = []            # сроки с ленивым удалением (YYYY-MM-DD сравниваются как строки)
+
+    @property
+    def open_count(self) -> int:
+        return self.task_count - self.completed_count
+
+    @property
+    def earliest_open_deadline(self) -> Union[str, None]:
+        while self._heap and self._heap[0] not in self._deadlines:
+            heapq.heappop(self._heap)
+        return self._heap[0] if self._heap else None
+
+    def _apply(self, contribution: Contribution, sign: int) -> None:
+        _, closed, current, total, deadline = contribution
+        self.task_count += sign; self.completed_count += sign * closed
+        self.current_units += sign * current; self.total_units += sign * total
+        if deadline:
+            count = self._deadlines.get(deadline, 0) + sign
+            if count <= 0: self._deadlines.pop(deadline, None)
+            else:
+                if deadline not in self._deadlines: heapq.heappush(self._heap, deadline)
+                self._deadlines[deadline] = count
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"task_count": self.task_count, "completed_count": self.completed_count,
+                "current_units": self.current_units, "total_units": self.total_units,
+                "earliest_open_deadline": self.earliest_open_deadline}
+
+
+# Состояние привязано к конкретному объекту данных (load_data возвращает один и тот же словарь,
+# пока файл не перечитан; перечитывание приходит подписчику как изменение с owner_id=None)
+_state: Dict[str, Any] = {"data": None, "rollups": {}, "contributions": {}}
+_stats: Dict[str, int] = {"builds": 0, "updates": 0}
+
+
+def _contribution(task: Union[Dict[str, Any], None]) -> Union[Contribution, None]:
+    if not task or not task.get("project_id"):
+        return None
+    closed = task.get("status") in CLOSED_STATUSES
+    try: current = int(task.get("current_units") or 0); total = int(task.get("total_units") or 0)
+    except (TypeError, ValueError): current = total = 0
+    deadline = task.get("deadline") if task.get("status") == "active" else None
+    return task["project_id"], closed, current, total, deadline or None
+
+
+def _build(data: Dict[str, Any]) -> None:
+    rollups: Dict[str, ProjectRollup] = {}; contributions: Dict[str, Contribution] = {}
+    for task_id, task in data.get("tasks", {}).items():
+        contribution = _contribution(task)
+        if contribution is not None:
+            contributions[task_id] = contribution
+            rollups.setdefault(contribution[0], ProjectRollup())._apply(contribution, 1)
+    _state.update(data=data, rollups=rollups, contributions=contributions)
+    _stats["builds"] += 1
+    logger.debug(f"Сводки проектов построены: проектов {len(rollups)}, задач {len(contributions)}.")
+
+
+def _refresh_task(task_id: str) -> None:
+    # O(1): старый вклад задачи вычитается, новый добавляется
+    old = _state["contributions"].pop(task_id, None)
+    new = _contribution(_state["data"].get("tasks", {}).get(task_id))
+    if old is not None:
+        _state["rollups"][old[0]]._apply(old, -1)
+    if new is not None:
+        _state["contributions"][task_id] = new
+        _state["rollups"].setdefault(new[0], ProjectRollup())._apply(new, 1)
+    _stats["updates"] += 1
+
+
+def get_project_rollup(data: Dict[str, Any], project_id: str) -> Union[ProjectRollup, None]:
+    """Сводка проекта или None, если у проекта нет задач."""
+    if _state["data"] is not data:
+        _build(data)
+    rollup = _state["rollups"].get(project_id)
+    return rollup if rollup is not None and rollup.task_count > 0 else None
+
+
+def on_item_mutation(owner_id: Union[str, None], item_type: Union[str, None] = None, item_id: Union[str, None] = None) -> None:
+    # Подписчик data_handler
+    data = _state["data"]
+    if data is None:
+        return  # Еще не строились: построятся при первом обращении
+    if owner_id is None:
+        _state["data"] = None; return
+    if item_type == "task" and item_id:
+        _refresh_task(item_id)
+    elif item_type is None:
+        # Массовое изменение (импорт, массовые действия): пересчитываются задачи владельца, по одной
+        for task_id in get_item_index(data).owner_item_ids(owner_id, "task"):
+            _refresh_task(task_id)
+
+
+def describe_rollups() -> str:
+    return (f"Сводки проектов: {len(_state['rollups'])} проектов, построений {_stats['builds']}, "
+            f"инкрементальных обновлений {_stats['updates']}")
+
+
+add_mutation_listener(on_item_mutation)
@@ -0,0 +1,175 @@
+# snapshot.py
+# Неизменяемые версии элементов для долгих чтений вне цикла событий (/stats, экспорт).
+# Хендлеры меняют документ data_handler на месте; поток, читающий тот же словарь, видит
+# недописанные изменения или падает с "dictionary changed size during iteration". Вместо блокировок
+# читатель берет current_snapshot() в цикле событий и дальше работает с ним в любом потоке.
+# Версия разбита на SHARD_COUNT корзин по владельцу, корзина - владелец -> его пулы элементов;
+# элементы - копии в MappingProxyType. Новая версия строится лениво при первом чтении после изменений
+# (подписчик record_item_mutation копит затронутые элементы) и делит с прежней все, что не менялось:
+# копируются только кортеж корзин, затронутые корзины и пулы затронутых владельцев. Публикация -
+# одно присваивание, поэтому читатель всегда видит целую версию.
+import logging
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, Mapping, Set, Tuple, Union
+
+from data_handler import add_mutation_listener, load_data, get_item_index
+from item_index import POOLS
+
+logger = logging.getLogger(__name__)
+
+SHARD_COUNT = 256
+
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+
+# Пулы одного владельца: {"projects": {id: item}, "tasks": {...}}, все уровни только для чтения
+OwnerPools = Mapping[str, Mapping[str, Mapping[str, Any]]]
+
+
+def shard_of(owner_id: str) -> int:
+    return hash(owner_id) % SHARD_COUNT
+
+
+class PoolView:
+    """Один пул (проекты или задачи) всех владельцев версии: итерация без копирования."""
+    __slots__ = ("_shards", "_pool_name")
+
+    def __init__(self, shards: Tuple[Mapping[str, OwnerPools], ...], pool_name: str):
+        self._shards = shards; self._pool_name = pool_name
+
+    def items(self) -> Iterator[Tuple[str, Mapping[str, Any]]]:
+        for shard in self._shards:
+            for pools in shard.values():
+                yield from pools[self._pool_name].items()
+
+    def values(self) -> Iterator[Mapping[str, Any]]:
+        for _, item in self.items():
+            yield item
+
+    def __len__(self) -> int:
+        return sum(len(pools[self._pool_name]) for shard in self._shards for pools in shard.values())
+
+
+class Snapshot:
+    """Версия элементов. Не меняется после публикации; безопасна для чтения из любого потока."""
+    __slots__ = ("version", "shards")
+
+    def __init__(self, version: int, shards: Tuple[Mapping[str, OwnerPools], ...]):
+        self.version = version; self.shards = shards
+
+    def owner_data(self, owner_id: Union[str, int]) -> OwnerPools:
+        """Элементы одного владельца в форме документа ({"projects": ..., "tasks": ...})."""
+        owner = str(owner_id)
+        return self.shards[shard_of(owner)].get(owner) or _empty_pools()
+
+    def pool(self, pool_name: str) -> PoolView:
+        return PoolView(self.shards, pool_name)
+
+    def owner_count(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+
+def _empty_pools() -> OwnerPools:
+    return MappingProxyType({pool_name: _EMPTY for pool_name, _ in POOLS})
+
+
+def _freeze(item: Mapping[str, Any]) -> Mapping[str, Any]:
+    return MappingProxyType(dict(item))
+
+
+_state: Dict[str, Any] = {"data": None, "snapshot": None, "version": 0, "all": True}
+# Затронутые с последней публикации: (владелец, тип, id); id=None - все элементы владельца
+_dirty: Set[Tuple[str, Union[str, None], Union[str, None]]] = set()
+_stats: Dict[str, int] = {"full_builds": 0, "publishes": 0, "items_copied": 0}
+
+
+def _build_all(data: Dict[str, Any]) -> Tuple[Mapping[str, OwnerPools], ...]:
+    owners: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for pool_name, _ in POOLS:
+        for item_id, item in data.get(pool_name, {}).items():
+            pools = owners.setdefault(str(item.get("owner_id")), {name: {} for name, _ in POOLS})
+            pools[pool_name][item_id] = _freeze(item)
+    shards = [{} for _ in range(SHARD_COUNT)]
+    for owner, pools in owners.items():
+        shards[shard_of(owner)][owner] = MappingProxyType({name: MappingProxyType(pool) for name, pool in pools.items()})
+    _stats["full_builds"] += 1; _stats["items_copied"] += sum(len(p) for pools in owners.values() for p in pools.values())
+    return tuple(MappingProxyType(shard) for shard in shards)
+
+
+def _apply_dirty(data: Dict[str, Any], shards: Tuple[Mapping[str, OwnerPools], ...]) -> Tuple[Mapping[str, OwnerPools], ...]:
+    # Рабочие копии только затронутых корзин и владельцев; остальное переходит в новую версию как есть
+    new_shards: Dict[int, Dict[str, Any]] = {}
+    new_pools: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def owner_pools(owner: str) -> Dict[str, Dict[str, Any]]:
+        pools = new_pools.get(owner)
+        if pools is None:
+            index = shard_of(owner)
+            if index not in new_shards: new_shards[index] = dict(shards[index])
+            current = new_shards[index].get(owner)
+            pools = new_pools[owner] = {name: dict(current[name]) if current else {} for name, _ in POOLS}
+        return pools
+
+    item_index = None
+    for owner, item_type, item_id in _dirty:
+        if item_id is None:
+            # Изменились все элементы владельца (массовые действия, импорт): пулы собираются заново по индексу
+            item_index = item_index or get_item_index(data)
+            pools = owner_pools(owner)
+            for pool_name, owner_type in POOLS:
+                pool = data.get(pool_name, {})
+                pools[pool_name] = {i: _freeze(pool[i]) for i in item_index.owner_item_ids(owner, owner_type)
+                                    if i in pool and str(pool[i].get("owner_id")) == owner}
+                _stats["items_copied"] += len(pools[pool_name])
+            continue
+        pool_name = "projects" if item_type == "project" else "tasks"
+        item = data.get(pool_name, {}).get(item_id)
+        owner_pools(owner)[pool_name].pop(item_id, None)
+        if item is not None:
+            # Владелец мог смениться: элемент кладется к текущему
+            owner_pools(str(item.get("owner_id")))[pool_name][item_id] = _freeze(item); _stats["items_copied"] += 1
+
+    for owner, pools in new_pools.items():
+        shard = new_shards[shard_of(owner)]
+        if any(pools.values()): shard[owner] = MappingProxyType({name: MappingProxyType(pool) for name, pool in pools.items()})
+        else: shard.pop(owner, None)
+    merged = list(shards)
+    for index, shard in new_shards.items():
+        merged[index] = MappingProxyType(shard)
+    return tuple(merged)
+
+
+def current_snapshot() -> Snapshot:
+    """Актуальная версия. Вызывается в цикле событий; сама версия дальше читается откуда угодно."""
+    data = load_data()
+    snapshot = _state["snapshot"]
+    if snapshot is not None and data is _state["data"] and not _state["all"] and not _dirty:
+        return snapshot
+    if snapshot is None or data is not _state["data"] or _state["all"]:
+        shards = _build_all(data)
+    else:
+        shards = _apply_dirty(data, snapshot.shards)
+    _dirty.clear(); _state["all"] = False; _state["version"] += 1
+    snapshot = Snapshot(_state["version"], shards)
+    _state["data"] = data; _state["snapshot"] = snapshot  # Публикация: одно присваивание
+    _stats["publishes"] += 1
+    return snapshot
+
+
+def on_item_mutation(owner_id: Union[str, None], item_type: Union[str, None] = None, item_id: Union[str, None] = None) -> None:
+    # Подписчик data_handler: только отметка, версия строится при следующем чтении
+    if _state["snapshot"] is None:
+        return
+    if owner_id is None:
+        _state["all"] = True; _dirty.clear()
+    elif not _state["all"]:
+        _dirty.add((owner_id, item_type if item_id else None, item_id))
+
+
+def describe_snapshots() -> str:
+    snapshot = _state["snapshot"]
+    current = f"версия {snapshot.version}, владельцев {snapshot.owner_count()}" if snapshot else "еще не строились"
+    return (f"Снимки данных: {current}; публикаций {_stats['publishes']}, полных построений {_stats['full_builds']}, "
+            f"скопировано элементов {_stats['items_copied']}")
+
+
+add_mutation_listener(on_item_mutation)
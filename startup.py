@@ -0,0 +1,78 @@
+# startup.py
+# Импортируется первым в bot5.py: момент импорта этого модуля считается началом запуска.
+import asyncio
+import logging
+import time
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_T0 = time.perf_counter()
+
+
+class StartupTimeline:
+    """Отметки этапов запуска (секунды от старта процесса) и флаг готовности бота."""
+
+    def __init__(self):
+        self.marks: List[Tuple[str, float]] = []
+        self.durations: Dict[str, float] = {}
+        self.ready = False
+        self.first_update_seen = False
+
+    def mark(self, phase: str) -> float:
+        elapsed = time.perf_counter() - _T0
+        self.marks.append((phase, elapsed))
+        return elapsed
+
+    def record_duration(self, phase: str, seconds: float) -> None:
+        self.durations[phase] = seconds
+
+    def report(self) -> str:
+        lines = ["Хронология запуска:"]
+        lines += [f"  {elapsed * 1000:8.1f} мс  {phase}" for phase, elapsed in self.marks]
+        if self.durations:
+            lines.append("Длительность этапов прогрева:")
+            lines += [f"  {seconds * 1000:8.1f} мс  {phase}" for phase, seconds in self.durations.items()]
+        return "\n".join(lines)
+
+
+timeline = StartupTimeline()
+
+
+def _timed(phase: str, func, *args):
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        timeline.record_duration(phase, time.perf_counter() - started)
+
+
+def _load_store_and_indexes() -> None:
+    from data_handler import load_data, get_item_index
+    data = _timed("загрузка данных", load_data)
+    _timed("построение индексов", get_item_index, data)
+
+
+async def warm_up() -> None:
+    """
+    Параллельно загружает хранилище с индексами и прогревает LLM (импорт SDK, соединение),
+    затем отмечает готовность. Вызывается из post_init приложения, до начала опроса.
+    """
+    from llm_handler import warm_up_llm
+    timeline.mark("прогрев: начало")
+    _, llm_ok = await asyncio.gather(
+        asyncio.to_thread(_load_store_and_indexes),
+        asyncio.to_thread(_timed, "прогрев LLM", warm_up_llm),
+    )
+    timeline.mark("готов к работе" if llm_ok else "готов к работе (LLM недоступна)")
+    timeline.ready = True
+    logger.info(timeline.report())
+
+
+async def note_first_update(update, context) -> None:
+    # Регистрируется в группе -1000; после первого апдейта сводится к одной проверке флага
+    if timeline.first_update_seen:
+        return
+    timeline.first_update_seen = True
+    timeline.mark("первый апдейт")
+    logger.info(timeline.report())
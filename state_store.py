@@ -0,0 +1,247 @@
+# state_store.py
+# Хранилище эфемерного состояния пользователей (context.user_data).
+# UserState подставляется в Application через ContextTypes(user_data=UserState), поэтому хендлеры
+# по-прежнему работают с context.user_data как со словарем, а хранилище добавляет:
+#  - TTL для каждого ключа (по политике из KEY_POLICIES): брошенные диалоги и ненажатые кнопки истекают;
+#  - лимит ключей на пользователя: при превышении вытесняются ближайшие к истечению;
+#  - сохранение на диск только ключей с persist=True, чтобы связанные с ними кнопки
+#    продолжали работать после перезапуска.
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Tuple, Union
+
+from telegram.ext import Application
+
+from constants import (
+    ACTIVE_CONVERSATION_KEY, LAST_PROCESSED_IN_CONV_MSG_ID_KEY, NEW_TASK_INFO_KEY,
+    ITEM_FOR_PROGRESS_UPDATE_KEY, PENDING_PROGRESS_UPDATE_KEY, PENDING_BATCH_UPDATE_KEY,
+)
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = 'user_state.json'
+MAX_KEYS_PER_USER = 50
+SWEEP_INTERVAL = 300  # секунд между очистками и сохранениями
+DEFAULT_TTL = 6 * 3600
+HOUR = 3600; DAY = 24 * HOUR
+
+# (префикс ключа, TTL в секундах, сохранять ли на диск). Первое совпадение по префиксу выигрывает.
+KEY_POLICIES: Tuple[Tuple[str, int, bool], ...] = (
+    (PENDING_PROGRESS_UPDATE_KEY, DAY, True),  # Только для кнопок старого формата (см. callback_codec.py)
+    (PENDING_BATCH_UPDATE_KEY, DAY, True),
+    (ACTIVE_CONVERSATION_KEY, HOUR, False),
+    (LAST_PROCESSED_IN_CONV_MSG_ID_KEY, 10 * 60, False),
+    ('new_project_info', HOUR, False),
+    (NEW_TASK_INFO_KEY, HOUR, False),
+    (ITEM_FOR_PROGRESS_UPDATE_KEY, HOUR, False),
+)
+
+_dirty = False  # Менялись ли сохраняемые ключи с последней записи на диск
+_sweeper_task: Union[asyncio.Task, None] = None
+
+
+def key_policy(key: Any) -> Tuple[int, bool]:
+    if isinstance(key, str):
+        for prefix, ttl, persist in KEY_POLICIES:
+            if key.startswith(prefix):
+                return ttl, persist
+    return DEFAULT_TTL, False
+
+
+class UserState(dict):
+    """Словарь user_data с истечением ключей и ограничением размера."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self._expires: Dict[Any, float] = {}
+        self.update(*args, **kwargs)
+
+    def _expired(self, key: Any, now: Union[float, None] = None) -> bool:
+        expires = self._expires.get(key)
+        if expires is None or expires > (now or time.time()):
+            return False
+        self._forget(key)
+        return True
+
+    def _forget(self, key: Any) -> None:
+        global _dirty
+        if key_policy(key)[1]: _dirty = True
+        super().pop(key, None); self._expires.pop(key, None)
+
+    def set(self, key: Any, value: Any, ttl: Union[float, None] = None, expires_at: Union[float, None] = None) -> None:
+        global _dirty
+        super().__setitem__(key, value)
+        policy_ttl, persist = key_policy(key)
+        self._expires[key] = expires_at if expires_at is not None else time.time() + (ttl if ttl is not None else policy_ttl)
+        if persist: _dirty = True
+        if len(self) > MAX_KEYS_PER_USER:
+            self.purge_expired()
+            while len(self) > MAX_KEYS_PER_USER:
+                victim = min((k for k in self._expires if k != key), key=self._expires.__getitem__)
+                logger.debug(f"user_data: вытеснен ключ {victim} (лимит {MAX_KEYS_PER_USER}).")
+                self._forget(victim)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self.set(key, value)
+
+    def __getitem__(self, key: Any) -> Any:
+        if self._expired(key): raise KeyError(key)
+        return super().__getitem__(key)
+
+    def __contains__(self, key: Any) -> bool:
+        return super().__contains__(key) and not self._expired(key)
+
+    def __delitem__(self, key: Any) -> None:
+        if not super().__contains__(key): raise KeyError(key)
+        self._forget(key)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return default if key not in self else super().__getitem__(key)
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        if key not in self:
+            if default: return default[0]
+            raise KeyError(key)
+        value = super().__getitem__(key)
+        self._forget(key)
+        return value
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key not in self: self.set(key, default)
+        return super().__getitem__(key)
+
+    def clear(self) -> None:
+        for key in list(self._expires): self._forget(key)
+
+    # Массовые записи и чтения тоже идут через set и истечение, а не напрямую в dict
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items(): self.set(key, value)
+
+    def __ior__(self, other: Any) -> "UserState":
+        self.update(other)
+        return self
+
+    def copy(self) -> "UserState":
+        self.purge_expired()
+        clone = UserState(super().items())
+        clone._expires = dict(self._expires)
+        return clone
+
+    def __iter__(self):
+        self.purge_expired()
+        return super().__iter__()
+
+    def __len__(self) -> int:
+        self.purge_expired()
+        return super().__len__()
+
+    def keys(self):
+        self.purge_expired()
+        return super().keys()
+
+    def values(self):
+        self.purge_expired()
+        return super().values()
+
+    def items(self):
+        self.purge_expired()
+        return super().items()
+
+    def purge_expired(self, now: Union[float, None] = None) -> int:
+        now = now or time.time()
+        expired = [key for key, expires in self._expires.items() if expires <= now]
+        for key in expired: self._forget(key)
+        return len(expired)
+
+    def persistent_items(self) -> Dict[str, list]:
+        return {key: [super(UserState, self).__getitem__(key), round(self._expires[key])]
+                for key in self._expires if key_policy(key)[1]}
+
+
+# --- Очистка и сохранение ---
+def sweep(application: Application) -> Tuple[int, int]:
+    """Удаляет истекшие ключи и опустевшие записи пользователей. Возвращает (ключей, пользователей)."""
+    now = time.time(); purged = 0; dropped = 0
+    for user_id, state in list(application.user_data.items()):
+        if isinstance(state, UserState):
+            purged += state.purge_expired(now)
+        if not state:
+            application.drop_user_data(user_id); dropped += 1
+    return purged, dropped
+
+
+def _serialize_state(application: Application) -> str:
+    snapshot = {str(user_id): items for user_id, state in application.user_data.items()
+                if isinstance(state, UserState) and (items := state.persistent_items())}
+    return json.dumps(snapshot, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def _write_state(payload: str) -> None:
+    try:
+        tmp_file = STATE_FILE + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_file, STATE_FILE)
+    except OSError as e:
+        logger.error(f"Не удалось сохранить {STATE_FILE}: {e}")
+
+
+def save_state(application: Application) -> None:
+    global _dirty
+    _dirty = False
+    _write_state(_serialize_state(application))
+
+
+def load_state(application: Application) -> int:
+    """Восстанавливает сохраненные ключи в user_data приложения. Возвращает число восстановленных ключей."""
+    global _dirty
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except json.JSONDecodeError as e:
+        logger.error(f"{STATE_FILE} поврежден, состояние не восстановлено: {e}"); return 0
+    now = time.time(); restored = 0
+    for user_id, items in snapshot.items():
+        for key, (value, expires_at) in items.items():
+            if expires_at > now:
+                application.user_data[int(user_id)].set(key, value, expires_at=expires_at); restored += 1
+    _dirty = False
+    logger.info(f"Восстановлено ключей состояния пользователей: {restored}.")
+    return restored
+
+
+async def _sweeper(application: Application) -> None:
+    global _dirty
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        purged, dropped = sweep(application)
+        if purged or dropped:
+            logger.debug(f"user_data: истекло ключей {purged}, удалено пустых записей {dropped}.")
+        if _dirty:
+            # Снимок собирается в цикле событий (user_data меняется хендлерами), пишется в потоке
+            _dirty = False
+            await asyncio.to_thread(_write_state, _serialize_state(application))
+
+
+def start_state_store(application: Application) -> None:
+    global _sweeper_task
+    load_state(application)
+    if _sweeper_task is None or _sweeper_task.done():
+        _sweeper_task = asyncio.get_running_loop().create_task(_sweeper(application))
+
+
+async def stop_state_store(application: Application) -> None:
+    global _sweeper_task
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+        try: await _sweeper_task
+        except asyncio.CancelledError: pass
+        _sweeper_task = None
+    sweep(application)
+    if _dirty:
+        save_state(application)
@@ -0,0 +1,185 @@
+# status_view.py
+# Список активных проектов и задач пользователя для ответа на "статус" без имени элемента.
+# Вывод постраничный: отсортированные id берутся из индекса (ItemIndex.active_sorted), рисуется
+# только запрошенная страница, кнопки "назад/далее" несут компактный курсор
+# "st:<фильтр>:<смещение>". Отфильтрованные списки и отрисованные страницы кешируются по
+# (пользователь, фильтр, дата[, смещение]) и сбрасываются подписчиком на изменения данных
+# (data_handler.record_item_mutation) только для затронутого владельца.
+# Строка проекта показывает завершенные задачи из сводки rollups.py (без перебора задач).
+import logging
+from datetime import date
+from typing import Any, Dict, List, Tuple, Union
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from data_handler import get_item_index, add_mutation_listener
+from log_handler import log_event
+from rollups import get_project_rollup
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 15
+MAX_NAME_LENGTH = 80  # Длинные имена обрезаются, чтобы страница гарантированно влезала в 4096 символов
+MAX_CACHED_VIEWS = 5000
+CALLBACK_STATUS_PAGE_PREFIX = "st"
+
+# Коды фильтров (короткие - они попадают в callback_data)
+FILTER_ALL = "a"
+FILTER_PROJECTS = "p"
+FILTER_TASKS = "t"
+FILTER_OVERDUE = "o"
+FILTER_PROJECT_TASKS = "P"  # "P<id проекта>" - задачи одного проекта
+
+_EMPTY_TEXTS = {
+    FILTER_ALL: "У вас нет активных проектов или задач. Время что-нибудь создать! 😊",
+    FILTER_PROJECTS: "У вас нет активных проектов.",
+    FILTER_TASKS: "У вас нет активных задач.",
+    FILTER_OVERDUE: "Просроченных проектов и задач нет. 👍",
+}
+_SECTION_TITLES = {"project": "*Ваши активные проекты:*", "task": "*Ваши активные задачи:*"}
+
+_cache: Dict[Tuple, Any] = {}
+_keys_by_user: Dict[str, set] = {}
+_stats: Dict[str, int] = {"hits": 0, "misses": 0, "invalidations": 0}
+_cache_day = {"day": None}  # При смене даты вчерашние виды сбрасываются целиком
+
+
+def filter_code(item_type: Union[str, None] = None, overdue: bool = False, project_id: Union[str, None] = None) -> str:
+    if project_id: return FILTER_PROJECT_TASKS + project_id
+    if overdue: return FILTER_OVERDUE
+    return {"project": FILTER_PROJECTS, "task": FILTER_TASKS}.get(item_type, FILTER_ALL)
+
+
+def _filtered_entries(data: Dict[str, Any], user_id_str: str, code: str, today_iso: str) -> List[Tuple[str, str]]:
+    """[(тип, id), ...] в порядке вывода для фильтра."""
+    index = get_item_index(data)
+    if code.startswith(FILTER_PROJECT_TASKS):
+        project_id = code[1:]; tasks = data.get("tasks", {})
+        return [("task", t) for t in index.active_sorted(user_id_str, "task") if tasks[t].get("project_id") == project_id]
+    types = {FILTER_PROJECTS: ("project",), FILTER_TASKS: ("task",)}.get(code, ("project", "task"))
+    entries = [(item_type, item_id) for item_type in types for item_id in index.active_sorted(user_id_str, item_type)]
+    if code == FILTER_OVERDUE:
+        pools = {"project": data.get("projects", {}), "task": data.get("tasks", {})}
+        # Дедлайны хранятся как YYYY-MM-DD, поэтому строковое сравнение совпадает с календарным
+        entries = [(t, i) for t, i in entries if (pools[t][i].get("deadline") or "9999") < today_iso]
+    log_event(logger, logging.DEBUG, "status.filtered", user_id=user_id_str, filter=code, count=len(entries))
+    return entries
+
+
+def _item_line(data: Dict[str, Any], item_type: str, item_id: str) -> str:
+    item = data["projects" if item_type == "project" else "tasks"][item_id]
+    name = item.get('name', '?')
+    if len(name) > MAX_NAME_LENGTH: name = name[:MAX_NAME_LENGTH - 1] + "…"
+    dl_info = f"(до {item['deadline']})" if item.get('deadline') else "(без срока)"
+    if item.get("total_units", 0) > 0: prog = f" [{item.get('current_units', 0)}/{item['total_units']}]"
+    elif item.get('current_units', 0) > 0: prog = f" [{item.get('current_units', 0)} ед.]"
+    else: prog = ""
+    project_link = ""
+    if item_type == "project":
+        rollup = get_project_rollup(data, item_id)
+        if rollup: prog += f" [задачи {rollup.completed_count}/{rollup.task_count}]"
+    if item_type == "task" and item.get("project_id"):
+        project = data.get("projects", {}).get(item["project_id"])
+        if project: project_link = f" (Проект: _{project.get('name', '?')[:MAX_NAME_LENGTH]} _)"
+    return f"  `{item_id}`: {name}{project_link} {dl_info} {prog}"
+
+
+def _render_page(data: Dict[str, Any], entries: List[Tuple[str, str]], code: str, offset: int) -> Tuple[str, Union[InlineKeyboardMarkup, None]]:
+    if not entries:
+        if code.startswith(FILTER_PROJECT_TASKS):
+            project = data.get("projects", {}).get(code[1:], {})
+            return f"В проекте '{project.get('name', '?')}' нет ваших активных задач.", None
+        return _EMPTY_TEXTS.get(code, _EMPTY_TEXTS[FILTER_ALL]), None
+
+    total_pages = (len(entries) + PAGE_SIZE - 1) // PAGE_SIZE
+    page_no = offset // PAGE_SIZE + 1
+    title = "🔍 *Ваш текущий статус:*"
+    if code == FILTER_OVERDUE: title = "🆘 *Просроченные:*"
+    elif code.startswith(FILTER_PROJECT_TASKS): title = f"🔍 *Задачи проекта {data.get('projects', {}).get(code[1:], {}).get('name', '?')}:*"
+    if total_pages > 1: title += f" (стр. {page_no}/{total_pages}, всего {len(entries)})"
+
+    lines = [title]; section = None
+    for item_type, item_id in entries[offset:offset + PAGE_SIZE]:
+        if item_type != section:
+            if section is not None: lines.append("")
+            if code not in (FILTER_OVERDUE,) and not code.startswith(FILTER_PROJECT_TASKS):
+                lines.append(_SECTION_TITLES[item_type] + (" (продолжение)" if offset and section is None and _continues(entries, offset) else ""))
+            section = item_type
+        lines.append(_item_line(data, item_type, item_id))
+
+    buttons = []
+    if offset > 0:
+        buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"{CALLBACK_STATUS_PAGE_PREFIX}:{code}:{max(0, offset - PAGE_SIZE)}"))
+    if offset + PAGE_SIZE < len(entries):
+        buttons.append(InlineKeyboardButton("Далее ▶️", callback_data=f"{CALLBACK_STATUS_PAGE_PREFIX}:{code}:{offset + PAGE_SIZE}"))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+def _continues(entries: List[Tuple[str, str]], offset: int) -> bool:
+    # Секция началась на предыдущей странице
+    return 0 < offset < len(entries) and entries[offset - 1][0] == entries[offset][0]
+
+
+def get_status_page(data: Dict[str, Any], user_id_str: str, code: str = FILTER_ALL, offset: int = 0,
+                    today: Union[date, None] = None) -> Tuple[str, Union[InlineKeyboardMarkup, None]]:
+    """Текст и клавиатура страницы статуса. Повторный запрос без изменений данных - поиск в словаре."""
+    day = (today or date.today()).isoformat()
+    if _cache_day["day"] != day:
+        _drop_all(); _cache_day["day"] = day
+    page_key = (user_id_str, code, day, offset)
+    page = _cache.get(page_key)
+    if page is not None:
+        _stats["hits"] += 1
+        return page
+    _stats["misses"] += 1
+    entries_key = (user_id_str, code, day)
+    entries = _cache.get(entries_key)
+    if entries is None:
+        entries = _filtered_entries(data, user_id_str, code, day)
+        _remember(user_id_str, entries_key, entries)
+    if offset >= len(entries) and entries:
+        offset = (len(entries) - 1) // PAGE_SIZE * PAGE_SIZE # Курсор со старой кнопки: список с тех пор сократился
+    page = _render_page(data, entries, code, max(0, offset))
+    _remember(user_id_str, page_key, page)
+    return page
+
+
+def parse_page_callback(callback_data: str) -> Union[Tuple[str, int], None]:
+    """'st:<фильтр>:<смещение>' -> (фильтр, смещение) или None."""
+    try:
+        prefix, rest = callback_data.split(":", 1)
+        code, offset = rest.rsplit(":", 1)
+        if prefix != CALLBACK_STATUS_PAGE_PREFIX or not code: return None
+        return code, max(0, int(offset))
+    except ValueError:
+        return None
+
+
+def _remember(user_id_str: str, key: Tuple, value: Any) -> None:
+    if len(_cache) >= MAX_CACHED_VIEWS:
+        _drop_all()
+    _cache[key] = value
+    _keys_by_user.setdefault(user_id_str, set()).add(key)
+
+
+def _drop_all() -> None:
+    _cache.clear(); _keys_by_user.clear()
+
+
+def invalidate_user(owner_id: Union[str, None], item_type: Union[str, None] = None, item_id: Union[str, None] = None) -> None:
+    # Подписчик data_handler: сбрасывает виды владельца измененного элемента (None - все виды)
+    _stats["invalidations"] += 1
+    if owner_id is None:
+        _drop_all(); return
+    for key in _keys_by_user.pop(owner_id, ()):
+        _cache.pop(key, None)
+
+
+def describe_status_cache() -> str:
+    lookups = _stats["hits"] + _stats["misses"]
+    hit_rate = f"{_stats['hits'] / lookups:.0%}" if lookups else "—"
+    return (f"Кеш статуса: {len(_cache)} записей, попаданий {_stats['hits']}, промахов {_stats['misses']} "
+            f"(hit rate {hit_rate}), сбросов {_stats['invalidations']}")
+
+
+add_mutation_listener(invalidate_user)
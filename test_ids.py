@@ -0,0 +1,51 @@
+# test_ids.py
+# Упорядоченные по времени ID (utils.generate_id): порядок, разные узлы-воркеры, повтор при занятом ID.
+#   python -m pytest -q test_ids.py
+import pytest
+
+import utils
+
+NOW = utils.ID_EPOCH + 86400 * 500
+
+
+@pytest.fixture(autouse=True)
+def id_clock(monkeypatch):
+    monkeypatch.setattr(utils, "_id_clock", {"second": 0, "seq": 0})
+    monkeypatch.setattr(utils, "ID_NODE", 0)
+    monkeypatch.setattr(utils.time, "time", lambda: NOW)
+
+
+def test_ids_sort_by_creation():
+    ids = [utils.generate_id("task") for _ in range(100)]
+    assert ids == sorted(ids)
+    assert [utils.id_number(i) for i in ids] == sorted(utils.id_number(i) for i in ids)
+    assert utils.id_created_at(ids[0]).timestamp() == NOW
+
+
+def test_sequence_overflow_moves_to_next_second():
+    ids = [utils.generate_id("task") for _ in range((1 << utils._SEQ_BITS) + 1)]
+    assert len(set(ids)) == len(ids) and ids == sorted(ids)
+    assert utils.id_created_at(ids[-1]).timestamp() == NOW + 1
+
+
+def test_nodes_do_not_collide_in_same_second(monkeypatch):
+    seen = set()
+    for node in range(utils.ID_MAX_NODES):
+        monkeypatch.setattr(utils, "ID_NODE", node)
+        monkeypatch.setattr(utils, "_id_clock", {"second": 0, "seq": 0})  # Отдельный процесс - свои часы
+        seen.update(utils.generate_id("task") for _ in range(10))
+    assert len(seen) == utils.ID_MAX_NODES * 10
+
+
+def test_node_out_of_range_is_rejected(monkeypatch):
+    monkeypatch.setattr(utils, "ID_NODE", utils.ID_MAX_NODES)
+    with pytest.raises(ValueError):
+        utils.generate_id("task")
+
+
+def test_taken_id_is_skipped(monkeypatch):
+    first = utils.generate_id("task")
+    # После перезапуска в ту же секунду счетчик начинается заново и первый ID уже занят
+    monkeypatch.setattr(utils, "_id_clock", {"second": 0, "seq": 0})
+    second = utils.generate_id("task", {first: {}})
+    assert second != first and second > first
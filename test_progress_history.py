@@ -0,0 +1,75 @@
+# test_progress_history.py
+# Окно недавнего темпа и одинаковый прогноз в одиночном (compute_pace) и пакетном (compute_pace_batch) расчете.
+#   python -m pytest -q test_progress_history.py
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import pace
+import progress_history
+
+TODAY = date(2026, 10, 19)
+
+
+@pytest.fixture(autouse=True)
+def history_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(progress_history, "HISTORY_FILE", str(tmp_path / "history.bin"))
+    monkeypatch.setattr(progress_history, "HISTORY_IDS_FILE", str(tmp_path / "history.ids"))
+    progress_history._series.clear(); progress_history._item_numbers.clear()
+    progress_history._state.update(loaded=False, events=0)
+    yield
+    progress_history._series.clear(); progress_history._item_numbers.clear()
+    progress_history._state.update(loaded=False, events=0)
+
+
+def _item(created: date, current: int = 5, total: int = 20, deadline_days: int = 9):
+    return {"id": "task_a", "status": "active", "created_at": datetime.combine(created, datetime.min.time()).isoformat(),
+            "deadline": (TODAY + timedelta(days=deadline_days)).isoformat(), "total_units": total, "current_units": current}
+
+
+def test_recent_pace_counts_creation_day():
+    created = TODAY - timedelta(days=3)
+    progress_history.record_progress("task_a", 5, created)
+    # Окно включает день создания: 5 ед. за 4 дня, а не 0 ед. за 3
+    assert progress_history.recent_pace("task_a", created.toordinal(), today=TODAY) == (1.25, 4)
+
+
+def test_recent_pace_on_creation_day():
+    progress_history.record_progress("task_a", 2, TODAY)
+    assert progress_history.recent_pace("task_a", TODAY.toordinal(), today=TODAY) == (2.0, 1)
+
+
+def test_item_with_progress_on_creation_day_stays_on_track():
+    created = TODAY - timedelta(days=3)
+    progress_history.record_progress("task_a", 5, created)
+    item = _item(created, current=5, total=20, deadline_days=15)  # нужно 15 ед. за 15 дней = 1.00/день
+    result = pace.compute_pace(item, today=TODAY, recent_pace=progress_history.recent_pace)
+    # Раньше окно без дня создания давало 0.00 ед./день (за 3 дн.) и "отстает"
+    assert result["class"] == pace.PACE_ON_TRACK
+    assert result["details"]["actual"] == "1.25 ед./день (за 4 дн.)"
+
+
+def test_batch_uses_recent_pace_like_single():
+    created = TODAY - timedelta(days=20)
+    progress_history.record_progress("task_a", 1, created)
+    progress_history.record_progress("task_a", 14, TODAY - timedelta(days=2))
+    item = _item(created, current=15, total=30, deadline_days=10)  # средний 0.75/день, за неделю 2.0/день, нужно 1.5
+    single = pace.compute_pace(item, today=TODAY, recent_pace=progress_history.recent_pace)
+    batch = pace.compute_pace_batch(pace.build_columns([item], TODAY, progress_history.recent_pace), TODAY)
+    assert single["class"] == pace.PACE_ON_TRACK
+    assert int(batch["class"][0]) == single["class"]
+    assert float(batch["actual"][0]) == pytest.approx(single["actual"])
+
+
+def test_rollup_projects_ignore_history():
+    created = TODAY - timedelta(days=20)
+    progress_history.record_progress("task_a", 10, TODAY)
+    project = {**_item(created, current=0, total=0), "id": "task_a"}
+
+    class Rollup:
+        task_count = 4; completed_count = 1
+    rolled = pace.with_rollup(project, Rollup())
+    single = pace.compute_pace(rolled, today=TODAY, recent_pace=progress_history.recent_pace)
+    batch = pace.compute_pace_batch(pace.build_columns([rolled], TODAY, progress_history.recent_pace), TODAY)
+    assert single["actual"] == pytest.approx(1 / 20)
+    assert float(batch["actual"][0]) == pytest.approx(1 / 20)
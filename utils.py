@@ -1,9 +1,10 @@
 # utils.py
-import uuid
-from datetime import datetime, date, timedelta 
+import time
+from datetime import datetime, date, timedelta, timezone
 from typing import Union
 import re
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 if not logger.hasHandlers():
@@ -17,8 +18,72 @@ except ImportError:
     print("WARNING (utils.py): python-dateutil не найден. Парсинг дат будет ограничен.")
     DATEUTIL_AVAILABLE = False
 
-def generate_id(prefix="item"):
-    return f"{prefix}_{uuid.uuid4().hex[:8]}"
+# ID элементов: "<префикс>_" + 10 символов base32 (Crockford, строчные) от 50-битного числа
+# [секунды от ID_EPOCH: 32 бита][узел: 5 бит][счетчик в секунде: 13 бит]. Фиксированная ширина и
+# алфавит по возрастанию: строки ID одного префикса сортируются по времени создания. Узел - номер
+# воркера (cluster.py задает ID_NODE, воркеров не больше ID_MAX_NODES), поэтому воркеры не пересекаются; счетчик исчерпан - берется
+# следующая секунда (логические часы не идут назад). Старые ID (<префикс>_<8 hex>) остаются как есть.
+ID_EPOCH = 1704067200  # 2024-01-01 UTC
+ID_NODE = 0
+_ID_ALPHABET = "0123456789abcdefghjkmnpqrstvwxyz"
+_ID_LENGTH = 10
+_NODE_BITS = 5; _SEQ_BITS = 13
+ID_MAX_NODES = 1 << _NODE_BITS
+_ID_RE = re.compile(rf'^[a-z]+_([{_ID_ALPHABET}]{{{_ID_LENGTH}}})$')
+_id_clock = {"second": 0, "seq": 0}
+_id_lock = threading.Lock()  # Часы ID общие для цикла событий и потоков (asyncio.to_thread)
+
+
+def _encode_id_number(number: int) -> str:
+    chars = []
+    for _ in range(_ID_LENGTH):
+        number, digit = divmod(number, 32); chars.append(_ID_ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def generate_id(prefix="item", taken=None):
+    """Новый ID, упорядоченный по времени. taken - словарь (пул), с ключами которого ID не должен совпасть."""
+    if not 0 <= ID_NODE < ID_MAX_NODES:
+        # Номер по модулю совпал бы с другим воркером, и их ID пересеклись бы незаметно
+        raise ValueError(f"ID_NODE должен быть от 0 до {ID_MAX_NODES - 1}, задан {ID_NODE}")
+    with _id_lock:
+        while True:
+            second = max(int(time.time()) - ID_EPOCH, _id_clock["second"])
+            if second == _id_clock["second"]:
+                _id_clock["seq"] += 1
+                if _id_clock["seq"] >> _SEQ_BITS: second += 1; _id_clock["seq"] = 0  # Счетчик секунды исчерпан
+            else:
+                _id_clock["seq"] = 0
+            _id_clock["second"] = second
+            number = (second << (_NODE_BITS + _SEQ_BITS)) | (ID_NODE << _SEQ_BITS) | _id_clock["seq"]
+            new_id = id_from_number(prefix, number)
+            # После перезапуска в ту же секунду (или при переводе часов назад) счетчик начинается заново
+            if taken is None or new_id not in taken:
+                return new_id
+
+
+def id_number(item_id: str) -> Union[int, None]:
+    """50-битное число ID нового формата или None для старых (случайных) ID."""
+    match = _ID_RE.match(item_id or "")
+    if not match:
+        return None
+    number = 0
+    for char in match.group(1):
+        number = number * 32 + _ID_ALPHABET.index(char)
+    return number
+
+
+def id_from_number(prefix: str, number: int) -> str:
+    """Обратное к id_number: ID нового формата по его числу."""
+    return f"{prefix}_{_encode_id_number(number)}"
+
+
+def id_created_at(item_id: str) -> Union[datetime, None]:
+    """Момент создания (UTC, с точностью до секунды) из ID нового формата; None для старых ID."""
+    number = id_number(item_id)
+    if number is None:
+        return None
+    return datetime.fromtimestamp(ID_EPOCH + (number >> (_NODE_BITS + _SEQ_BITS)), timezone.utc)
 
 def parse_natural_deadline_to_date(deadline_str: str) -> Union[date, None]:
     if not deadline_str:
@@ -44,10 +109,10 @@ def parse_natural_deadline_to_date(deadline_str: str) -> Union[date, None]:
         try:
             val = int(m_rel.group(1)); unit = m_rel.group(2); delta = None
             if DATEUTIL_AVAILABLE:
-                if "ден" in unit: delta = relativedelta.relativedelta(days=val)
-                elif "недел" in unit: delta = relativedelta.relativedelta(weeks=val)
-                elif "месяц" in unit: delta = relativedelta.relativedelta(months=val)
-                elif "год" in unit or "лет" in unit: delta = relativedelta.relativedelta(years=val)
+                if "ден" in unit: delta = relativedelta(days=val)
+                elif "недел" in unit: delta = relativedelta(weeks=val)
+                elif "месяц" in unit: delta = relativedelta(months=val)
+                elif "год" in unit or "лет" in unit: delta = relativedelta(years=val)
             else:
                 if "ден" in unit: delta = timedelta(days=val)
                 elif "недел" in unit: delta = timedelta(days=val*7)
@@ -0,0 +1,224 @@
+# webhook.py
+# Режим вебхука: встроенный асинхронный HTTP-сервер (без внешних зависимостей) принимает
+# апдейты от Telegram и кладет их в очередь Application. Включается BOT_MODE=webhook.
+#   POST <WEBHOOK_PATH> - апдейт; проверяется заголовок X-Telegram-Bot-Api-Secret-Token
+#   GET  /healthz       - процесс жив (200)
+#   GET  /readyz        - прогрев завершен и приложение принимает апдейты (200), иначе 503
+# Локальная проверка без Telegram: python replay_updates.py recorded_updates.jsonl
+# Тот же сервер служит приемником многопроцессного режима (cluster.py, параметр sink).
+import asyncio
+import hmac
+import json
+import logging
+import os
+import signal
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Tuple, Union
+
+from telegram import Bot, Update
+from telegram.ext import Application
+
+from startup import timeline
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')          # Публичный адрес; если задан, вебхук регистрируется в Telegram при старте
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')    # Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADER_LINES = 100
+READ_TIMEOUT = 30.0
+
+_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+            411: "Length Required", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class WebhookServer:
+    """
+    Без sink апдейт разбирается и кладется в очередь application. С sink (приемник cluster.py)
+    сырой JSON апдейта передается в sink(raw) -> bool; False - некуда положить, Telegram повторит (503).
+    """
+
+    def __init__(self, application: Union[Application, None], path: str = WEBHOOK_PATH, secret: Union[str, None] = WEBHOOK_SECRET,
+                 host: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT, sink: Union[Callable[[Dict[str, Any]], bool], None] = None,
+                 ready_check: Union[Callable[[], bool], None] = None):
+        self.application = application
+        self.path = path; self.secret = secret; self.host = host; self.port = port
+        self.sink = sink; self.ready_check = ready_check
+        self.server: Union[asyncio.AbstractServer, None] = None
+        self.stats: Dict[str, int] = {"accepted": 0, "rejected_secret": 0, "bad_request": 0}
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        logger.info(f"Вебхук-сервер слушает {self.host}:{self.port}{self.path}")
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def is_ready(self) -> bool:
+        if self.ready_check is not None:
+            return self.ready_check()
+        return timeline.ready and self.application.running
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Telegram держит соединение открытым (keep-alive), поэтому запросы читаются в цикле
+        try:
+            while True:
+                request = await asyncio.wait_for(_read_request(reader), READ_TIMEOUT)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self._route(method, path, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except _HttpError as e:
+            writer.write(_response(e.status, e.message, False))
+            try: await writer.drain()
+            except ConnectionError: pass
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, str]:
+        path = path.split('?', 1)[0]
+        if path == '/healthz':
+            return 200, "ok"
+        if path == '/readyz':
+            return (200, "ready") if self.is_ready() else (503, "starting")
+        if path != self.path:
+            return 404, "not found"
+        if method != 'POST':
+            return 405, "method not allowed"
+        # Сравнение байтов: compare_digest на str с не-ASCII символами бросает TypeError
+        if self.secret and not hmac.compare_digest(headers.get(SECRET_HEADER, '').encode('utf-8'), self.secret.encode('utf-8')):
+            self.stats["rejected_secret"] += 1
+            logger.warning("Вебхук: запрос с неверным секретным токеном отклонен.")
+            return 403, "forbidden"
+        if self.sink is not None:
+            try: raw = json.loads(body)
+            except ValueError: raw = None
+            if not isinstance(raw, dict) or "update_id" not in raw:
+                self.stats["bad_request"] += 1
+                return 400, "bad update"
+            if not self.sink(raw):
+                return 503, "busy"
+            self.stats["accepted"] += 1
+            return 200, "ok"
+        try:
+            raw = json.loads(body)
+            if not isinstance(raw, dict):
+                raise ValueError("тело не является JSON-объектом")
+            update = Update.de_json(raw, self.application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            self.stats["bad_request"] += 1
+            logger.warning(f"Вебхук: не удалось разобрать апдейт: {e}")
+            return 400, "bad update"
+        if update is None:
+            self.stats["bad_request"] += 1
+            return 400, "empty update"
+        await self.application.update_queue.put(update)
+        self.stats["accepted"] += 1
+        return 200, "ok"
+
+
+class _HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status; self.message = message
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Union[Tuple[str, str, Dict[str, str], bytes], None]:
+    request_line = await reader.readline()
+    if not request_line:
+        return None # Клиент закрыл соединение
+    try:
+        method, path, _ = request_line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise _HttpError(400, "bad request line")
+    headers: Dict[str, str] = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise _HttpError(400, "too many headers")
+    body = b''
+    if method == 'POST':
+        if 'content-length' not in headers:
+            raise _HttpError(411, "length required")
+        try: length = int(headers['content-length'])
+        except ValueError: raise _HttpError(400, "bad content-length")
+        if length > MAX_BODY_BYTES:
+            raise _HttpError(413, "payload too large")
+        body = await reader.readexactly(length)
+    return method.upper(), path, headers, body
+
+
+def _response(status: int, text: str, keep_alive: bool) -> bytes:
+    body = text.encode('utf-8')
+    head = (f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: text/plain; charset=utf-8\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('latin-1') + body
+
+
+async def run_webhook(application: Application, allowed_updates: Any = Update.ALL_TYPES) -> None:
+    """
+    Жизненный цикл приложения в режиме вебхука (аналог run_polling): initialize, post_init,
+    start, HTTP-сервер и регистрация вебхука; по SIGINT/SIGTERM - остановка в обратном порядке.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try: loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError: pass # Windows
+
+    server = WebhookServer(application)
+    async with running_application(application):
+        try:
+            await server.start()
+            await register_webhook(application.bot, allowed_updates)
+            await stop_event.wait()
+        finally:
+            logger.info("Остановка вебхук-сервера...")
+            await server.stop()
+
+
+async def register_webhook(bot: Bot, allowed_updates: Any = Update.ALL_TYPES) -> None:
+    if WEBHOOK_URL:
+        await bot.set_webhook(url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET, allowed_updates=allowed_updates)
+        logger.info(f"Вебхук зарегистрирован в Telegram: {WEBHOOK_URL}")
+    elif not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET не задан: вебхук принимает запросы без проверки источника.")
+
+
+@asynccontextmanager
+async def running_application(application: Application) -> AsyncIterator[Application]:
+    """initialize, post_init и start; на выходе - остановка в обратном порядке (как в run_polling)."""
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        yield application
+    finally:
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)